@@ -0,0 +1,304 @@
+# Batch post-processing of many TEVA runs.
+#
+# Discovers CC/DNF workbook pairs (ccs_<run>.xlsx + dnfs_<run>.xlsx) in a directory, runs the
+# post-processing stages for every output class of every pair in a process pool, and writes
+# one compressed .npz file per class plus a manifest.json per run. Runs whose outputs are up
+# to date with their workbooks are skipped, so an interrupted batch can simply be restarted.
+# The workbooks are read through the loader's sidecar cache, which is written next to them
+# unless --cache-dir or --no-sidecar is given.
+#
+# Example:
+#           python TEVA_Batch.py Sample_Data -o TEVA_batch_output -j 4 --cache-dir teva_sidecars
+
+# Import libraries
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import TEVA_Loader as loader
+import TEVA_Post_Processing as post
+
+# Bump when the output layout changes, older outputs are then recomputed
+BATCH_VERSION = 1
+
+STAGES = ['load', 'parse', 'co-occurrence', 'stacked counts', 'contours', 'ranges', 'write']
+
+
+
+# Discovery
+def discover_pairs(directory):
+    '''
+    Finds the CC/DNF workbook pairs in a directory.
+
+        Returns:
+            list of (run name, cc workbook path, dnf workbook path), sorted by run name
+    '''
+
+    pairs = []
+    for name in sorted(os.listdir(directory)):
+        match = re.fullmatch(r'ccs_(.+)\.xlsx', name)
+        if match is None:
+            continue
+        dnf_path = os.path.join(directory, 'dnfs_{}.xlsx'.format(match.group(1)))
+        if os.path.exists(dnf_path):
+            pairs.append((match.group(1), os.path.join(directory, name), dnf_path))
+
+    return pairs
+
+
+
+def class_sheets(cc_path, dnf_path):
+    '''
+    Matches the CCEA_<class> and DNFEA_<class> sheets of a workbook pair.
+
+        Returns:
+            list of (class, cc sheet name, dnf sheet name)
+    '''
+
+    cc_sheets = pd.ExcelFile(cc_path).sheet_names
+    dnf_sheets = set(pd.ExcelFile(dnf_path).sheet_names)
+
+    classes = []
+    for sheet in cc_sheets:
+        if sheet.startswith('CCEA_') and 'DNFEA_' + sheet[5:] in dnf_sheets:
+            classes.append((sheet[5:], sheet, 'DNFEA_' + sheet[5:]))
+
+    return classes
+
+
+
+def check_layout(df, path, sheet_name):
+    '''
+    Raises a ValueError if a sheet does not have every column of post.META_COLUMNS, e.g. the
+    12-column layout of older TEVA exports without the sensitivity columns, so the run is
+    reported as failed instead of written without them.
+    '''
+
+    missing = [col for col in post.META_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError('{} [{}]: the metadata columns {} are missing (older TEVA export layout)'.format(
+                         os.path.basename(path), sheet_name, ', '.join(missing)))
+
+
+
+def input_key(path):
+    '''
+    mtime and size of an input workbook, used to decide whether outputs are up to date.
+    '''
+
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+
+def is_up_to_date(run_dir, cc_path, dnf_path, n_grid):
+    '''
+    True if run_dir holds complete outputs for the current cc/dnf workbooks.
+    '''
+
+    try:
+        with open(os.path.join(run_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    return (manifest.get('version') == BATCH_VERSION
+            and manifest.get('n_grid') == n_grid
+            and manifest.get('inputs') == [input_key(cc_path), input_key(dnf_path)]
+            and all(os.path.exists(os.path.join(run_dir, item['file'])) for item in manifest['classes']))
+
+
+
+# Post-processing
+def process_class(ccs, dnfs, n_grid, timings):
+    '''
+    Runs all post-processing stages on one output class.
+
+        Returns:
+            dict of numpy arrays to store
+    '''
+
+    t = time.perf_counter()
+    cc_indptr, cc_indices, feature_names = post.cc_membership(ccs)
+    dnf_indptr, dnf_indices, cc_names = post.dnf_membership(dnfs)
+    cc_features = post.csr_to_lists(cc_indptr, cc_indices, feature_names)
+    all_ccs = post.csr_to_lists(dnf_indptr, dnf_indices, cc_names)
+    unique_features = pd.unique(post.flatten(cc_features))
+    timings['parse'] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    cooccurrence = post.CC_feature_heatmap(unique_features, cc_features)
+    timings['co-occurrence'] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    feature_counts = post.StackedCounts(cc_features, max(ccs['order']), 'Feature')
+    cc_counts = post.StackedCounts(all_ccs, max(dnfs['order']), 'CC')
+    timings['stacked counts'] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    x_fit, y_fit, z_fit, fitness = post.fitness_contours(n_grid, dnfs, ccs)
+    timings['contours'] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    range_indptr, range_indices, range_names, values, lo, hi = post.cc_ranges(ccs)
+    timings['ranges'] += time.perf_counter() - t
+
+    return {'feature_names': feature_names.astype(str),
+            'cc_names': cc_names.astype(str),
+            'cc_indptr': cc_indptr,
+            'cc_indices': cc_indices,
+            'dnf_indptr': dnf_indptr,
+            'dnf_indices': dnf_indices,
+            'unique_features': np.asarray(unique_features).astype(str),
+            'cooccurrence': cooccurrence,
+            'feature_count_names': feature_counts.names.astype(str),
+            'feature_order_counts': feature_counts.counts,
+            'cc_count_names': cc_counts.names.astype(str),
+            'cc_order_counts': cc_counts.counts,
+            'x_fit': x_fit,
+            'y_fit': y_fit,
+            'z_fit': np.ma.filled(z_fit, np.nan),
+            'range_lo': lo,
+            'range_hi': hi,
+            'cc_meta_cov': ccs['cov'].to_numpy(),
+            'cc_meta_ppv': ccs['ppv'].to_numpy(),
+            'cc_meta_fitness': ccs['fitness'].to_numpy(),
+            'cc_meta_order': ccs['order'].to_numpy(),
+            'dnf_meta_cov': dnfs['cov'].to_numpy(),
+            'dnf_meta_ppv': dnfs['ppv'].to_numpy(),
+            'dnf_meta_fitness': dnfs['fitness'].to_numpy(),
+            'dnf_meta_order': dnfs['order'].to_numpy()}
+
+
+
+def process_pair(run, cc_path, dnf_path, out_dir, n_grid=1000, cache_dir=None, use_cache=True):
+    '''
+    Post-processes every output class of one workbook pair and writes the results.
+    Runs in a worker process. cache_dir and use_cache are passed on to loader.load_sheet.
+
+        Returns:
+            (run name, dict of stage timings in seconds)
+    '''
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    run_dir = os.path.join(out_dir, run)
+    os.makedirs(run_dir, exist_ok=True)
+    # drop the old manifest first, the run only counts as complete once a new one is written
+    if os.path.exists(os.path.join(run_dir, 'manifest.json')):
+        os.remove(os.path.join(run_dir, 'manifest.json'))
+
+    classes = []
+    for label, cc_sheet, dnf_sheet in class_sheets(cc_path, dnf_path):
+        t = time.perf_counter()
+        ccs = loader.load_sheet(cc_path, cc_sheet, cache_dir, use_cache)
+        dnfs = loader.load_sheet(dnf_path, dnf_sheet, cache_dir, use_cache)
+        check_layout(ccs, cc_path, cc_sheet)
+        check_layout(dnfs, dnf_path, dnf_sheet)
+        timings['load'] += time.perf_counter() - t
+
+        arrays = process_class(ccs, dnfs, n_grid, timings)
+
+        # write to a temporary file first so an interrupted run never leaves a partial output
+        t = time.perf_counter()
+        file_name = '{}.npz'.format(label)
+        tmp = os.path.join(run_dir, file_name + '.tmp.npz')
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, os.path.join(run_dir, file_name))
+        timings['write'] += time.perf_counter() - t
+
+        classes.append({'class': label, 'cc_sheet': cc_sheet, 'dnf_sheet': dnf_sheet, 'file': file_name})
+
+    # the manifest is written last, it marks the run as complete
+    manifest = {'version': BATCH_VERSION,
+                'n_grid': n_grid,
+                'inputs': [input_key(cc_path), input_key(dnf_path)],
+                'classes': classes,
+                'timings': timings}
+    with open(os.path.join(run_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return run, timings
+
+
+
+def run_batch(directory, out_dir, jobs=None, n_grid=1000, force=False, cache_dir=None, use_cache=True):
+    '''
+    Post-processes all workbook pairs in a directory, skipping pairs that are up to date.
+    The workbook sidecars are written to cache_dir (default: next to the workbooks), or not
+    at all with use_cache=False.
+
+        Returns:
+            results     dict of run name -> stage timings (only for the runs processed now)
+            failures    dict of run name -> error message of the runs that failed
+    '''
+
+    pairs = discover_pairs(directory)
+    todo = [pair for pair in pairs if force or not is_up_to_date(os.path.join(out_dir, pair[0]), pair[1], pair[2], n_grid)]
+    print('{} workbook pairs found, {} up to date, {} to process'.format(len(pairs), len(pairs) - len(todo), len(todo)))
+
+    results = {}
+    failures = {}
+    if not todo:
+        return results, failures
+
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(process_pair, run, cc_path, dnf_path, out_dir, n_grid, cache_dir, use_cache): run
+                   for run, cc_path, dnf_path in todo}
+        for future in as_completed(futures):
+            try:
+                run, timings = future.result()
+            except Exception as error:
+                failures[futures[future]] = str(error)
+                print('{}: failed ({})'.format(futures[future], error))
+                continue
+            results[run] = timings
+            print('{}: done in {:.2f} s'.format(run, sum(timings.values())))
+
+    return results, failures
+
+
+
+def timing_report(results):
+    '''
+    Per-stage timing table (seconds) of the processed runs.
+    '''
+
+    report = pd.DataFrame.from_dict(results, orient='index', columns=STAGES)
+    report['total'] = report.sum(axis=1)
+
+    return report
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch post-processing of TEVA CC/DNF workbook pairs.')
+    parser.add_argument('directory', help='folder with ccs_<run>.xlsx / dnfs_<run>.xlsx workbooks')
+    parser.add_argument('-o', '--output', default='TEVA_batch_output', help='output folder (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--n-grid', type=int, default=1000, help='fitness contour grid size (default: %(default)s)')
+    parser.add_argument('--force', action='store_true', help='reprocess runs that are up to date')
+    parser.add_argument('--cache-dir', default=None, help='folder for the workbook sidecars (default: next to the workbooks)')
+    parser.add_argument('--no-sidecar', action='store_true', help='read the workbooks without writing sidecars')
+    args = parser.parse_args(argv)
+
+    results, failures = run_batch(args.directory, args.output, args.jobs, args.n_grid, args.force,
+                                  args.cache_dir, not args.no_sidecar)
+    if results:
+        with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200, 'display.max_columns', None):
+            print(timing_report(results))
+    if failures:
+        print('{} of {} runs failed: {}'.format(len(failures), len(results) + len(failures), ', '.join(sorted(failures))))
+        return 1
+
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,315 @@
+# Benchmarks for the TEVA post-processing functions on synthetic archives.
+#
+# Generates synthetic CC/DNF sheets that follow the TEVA export schema (the 14 metadata
+# columns, feature range strings in the CC sheet and cc_ indicator columns in the DNF sheet),
+# times each post-processing function and records its peak memory, and saves the results
+# as JSON so runs can be compared over time.
+#
+# Example:
+#           python TEVA_Benchmark.py --features 100 --ccs 1000 10000 --orders 3 -o bench.json
+#
+# With --imports the import time of the TEVA modules is measured instead, each in a fresh
+# interpreter, and modules that load one of the DEFERRED_PACKAGES at import time are flagged:
+#           python TEVA_Benchmark.py --imports -o imports.json --compare imports_before.json
+
+# Import libraries
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+import TEVA_Cache as cache
+import TEVA_Post_Processing as post
+
+# Modules whose import is benchmarked, and the packages they may only load when a function needs them.
+# TEVA_Export is left out on purpose: it only runs from the dashboard and imports bokeh and panel
+# at module level.
+IMPORT_MODULES = ['TEVA_Post_Processing', 'TEVA_Cache', 'TEVA_Loader', 'TEVA_Evaluation', 'TEVA_Observations',
+                  'TEVA_Batch', 'TEVA_Profiling', 'TEVA_Dynamic_Plotting', 'TEVA_Report']
+DEFERRED_PACKAGES = ['holoviews', 'hvplot', 'panel', 'bokeh', 'matplotlib', 'scipy']
+
+
+
+# Synthetic TEVA archives
+def synthetic_archive(n_features=60, n_ccs=1000, n_dnfs=None, max_cc_order=3, max_dnf_order=4, seed=0):
+    '''
+    Generates a synthetic CC sheet and DNF sheet with the same schema as the TEVA exports.
+
+            n_features      number of feature columns in the CC sheet
+            n_ccs           number of CCs
+            n_dnfs          number of DNFs (default: n_ccs // 4)
+            max_cc_order    CC orders are drawn from 1 ... max_cc_order
+            max_dnf_order   DNF orders are drawn from 1 ... max_dnf_order
+            seed            random seed
+
+        Returns:
+            ccs, dnfs       DataFrames as returned by pd.read_excel on the CCEA/DNFEA sheets
+    '''
+
+    rng = np.random.default_rng(seed)
+    if n_dnfs is None:
+        n_dnfs = max(1, n_ccs // 4)
+    feature_names = ['feature_{}'.format(i) for i in range(n_features)]
+
+    # CC sheet: each CC constrains `order` distinct features to a '[lo, hi]' range
+    cc_order = rng.integers(1, min(max_cc_order, n_features) + 1, n_ccs)
+    cells = np.full((n_ccs, n_features), np.nan, dtype=object)
+    for i, order in enumerate(cc_order):
+        features = rng.choice(n_features, order, replace=False)
+        lo = np.round(rng.uniform(0, 50, order), 2)
+        hi = np.round(lo + rng.uniform(0, 50, order), 2)
+        cells[i, features] = ['[{}, {}]'.format(a, b) for a, b in zip(lo, hi)]
+    ccs = pd.concat([_synthetic_meta(rng, n_ccs, cc_order, n_features),
+                     pd.DataFrame(cells, columns=feature_names)], axis=1)
+
+    # DNF sheet: each DNF is an OR of `order` distinct CCs
+    dnf_order = rng.integers(1, min(max_dnf_order, n_ccs) + 1, n_dnfs)
+    indicators = np.zeros((n_dnfs, n_ccs), dtype=np.int8)
+    for i, order in enumerate(dnf_order):
+        indicators[i, rng.choice(n_ccs, order, replace=False)] = 1
+    dnfs = pd.concat([_synthetic_meta(rng, n_dnfs, dnf_order, n_features),
+                      pd.DataFrame(indicators, columns=['cc_{}'.format(i) for i in range(n_ccs)])], axis=1)
+
+    return ccs, dnfs
+
+
+
+def _synthetic_meta(rng, n_rows, order, n_features):
+    # the 14 metadata columns, in the order of post.META_COLUMNS
+    n_obs = 100
+    tp = rng.integers(1, n_obs // 2, n_rows)
+    fp = rng.integers(0, n_obs // 2, n_rows)
+    fn = n_obs // 2 - tp
+    tn = n_obs - tp - fp - fn
+    min_sens = -rng.exponential(5, n_rows)
+    masks = ['[' + ' '.join(['0'] * n_features) + ']'] * n_rows
+
+    columns = [np.arange(n_rows), ['High'] * n_rows, masks, -rng.exponential(5, n_rows), order,
+               rng.integers(1, 10, n_rows), tp / (tp + fn), tp / (tp + fp), min_sens,
+               np.minimum(min_sens + rng.exponential(2, n_rows), 0), tp, tn, fp, fn]
+
+    return pd.DataFrame(dict(zip(post.META_COLUMNS, columns)))
+
+
+
+# Benchmarks
+def measure(function, *args, repeat=3, **kwargs):
+    '''
+    Times a function call (best of `repeat`) and records its peak traced memory.
+
+        Returns:
+            dict with seconds (best), mean_seconds and peak_mb
+    '''
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    # memory is traced in a separate call, tracing slows the function down
+    tracemalloc.start()
+    function(*args, **kwargs)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': min(times), 'mean_seconds': float(np.mean(times)), 'peak_mb': peak / 2**20}
+
+
+
+def benchmark_cases(ccs, dnfs, n_grid=200):
+    '''
+    The benchmarked post-processing steps, as name -> (function, args).
+    '''
+
+    cc_features = post.parse_cc(ccs)
+    all_ccs = post.parse_dnf(dnfs)
+    unique_features = pd.unique(post.flatten(cc_features))
+    cc_plot_data = pd.DataFrame({'min_sens': ccs['min_feat_sensitivity'],
+                                 'max_sens': ccs['max_feat_sensitivity'],
+                                 'CC': ccs['Unnamed: 0']})
+    dnf_plot_data = pd.DataFrame({'CCs': all_ccs})
+    sens_index = post.SensitivityIndex.from_plot_data(cc_plot_data, dnf_plot_data)
+    min_sens = float(np.median(ccs['min_feat_sensitivity']))
+
+    return {
+        'parse_cc': (post.parse_cc, (ccs,)),
+        'parse_dnf': (post.parse_dnf, (dnfs,)),
+        'feature_ranges_by_cc': (post.feature_ranges_by_cc, (ccs,)),
+        'feature_ranges_by_feature': (post.feature_ranges_by_feature, (ccs,)),
+        'CC_feature_heatmap': (post.CC_feature_heatmap, (unique_features, cc_features)),
+        'stacked_features': (post.stacked_features, (ccs, unique_features, cc_features, post.flatten(cc_features))),
+        'stacked_ccs': (post.stacked_ccs, (dnfs, np.unique(post.flatten(all_ccs)), all_ccs, post.flatten(all_ccs))),
+        'fitness_contours': (_uncached_fitness_contours, (n_grid, dnfs, ccs)),
+        'sensitivity_index_build': (post.SensitivityIndex.from_plot_data, (cc_plot_data, dnf_plot_data)),
+        'sensitivity_filter': (sens_index.query, (min_sens, 0)),
+    }
+
+
+
+def _uncached_fitness_contours(n_grid, dnfs, ccs):
+    # fitness_contours caches its results, clear the caches so every call does the work
+    post._INTERPOLATOR_CACHE.clear()
+    post._SURFACE_CACHE.clear()
+    return post.fitness_contours(n_grid, dnfs, ccs)
+
+
+
+def run_benchmarks(feature_counts, cc_counts, orders, n_grid=200, repeat=3, only=None, seed=0):
+    '''
+    Runs every benchmark case for every (features, ccs, order) combination.
+
+        Returns:
+            list of result dicts (one per case and size)
+    '''
+
+    # the functions are timed, not the on-disk cache (TEVA_CACHE_DIR)
+    cache.disable()
+    results = []
+    for n_features in feature_counts:
+        for n_ccs in cc_counts:
+            for max_order in orders:
+                ccs, dnfs = synthetic_archive(n_features, n_ccs, max_cc_order=max_order, seed=seed)
+                for name, (function, args) in benchmark_cases(ccs, dnfs, n_grid).items():
+                    if only and name not in only:
+                        continue
+                    result = {'case': name, 'n_features': n_features, 'n_ccs': n_ccs,
+                              'n_dnfs': len(dnfs), 'max_order': max_order}
+                    result.update(measure(function, *args, repeat=repeat))
+                    results.append(result)
+                    print('{case:26s} features={n_features:<5d} ccs={n_ccs:<7d} order={max_order:<2d} '
+                          '{seconds:9.4f} s {peak_mb:9.1f} MB'.format(**result))
+
+    return results
+
+
+
+def measure_import(module, repeat=3):
+    '''
+    Times `import module` in fresh interpreters (best of `repeat`), without the interpreter startup.
+
+        Returns:
+            dict with seconds (best), mean_seconds, the number of modules loaded and the
+            DEFERRED_PACKAGES that were loaded
+    '''
+
+    code = ('import sys, time, json\n'
+            'start = time.perf_counter()\n'
+            'import {}\n'
+            'seconds = time.perf_counter() - start\n'
+            'print(json.dumps({{"seconds": seconds, "modules": len(sys.modules), '
+            '"loaded": sorted(set(name.split(".")[0] for name in sys.modules))}}))').format(module)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    runs = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    times = [run['seconds'] for run in runs]
+
+    return {'seconds': min(times), 'mean_seconds': float(np.mean(times)), 'modules': runs[-1]['modules'],
+            'deferred_loaded': [name for name in DEFERRED_PACKAGES if name in runs[-1]['loaded']]}
+
+
+
+def run_import_benchmarks(modules=IMPORT_MODULES, repeat=3):
+    '''
+    Measures the import of every module. Results have the keys of run_benchmarks (with zero
+    sizes), so they can be saved and compared the same way.
+
+        Returns:
+            list of result dicts (one per module)
+    '''
+
+    results = []
+    for module in modules:
+        result = {'case': 'import ' + module, 'n_features': 0, 'n_ccs': 0, 'n_dnfs': 0, 'max_order': 0}
+        result.update(measure_import(module, repeat))
+        results.append(result)
+        print('{case:34s} {seconds:9.4f} s {modules:6d} modules  {deferred}'.format(
+              deferred=', '.join(result['deferred_loaded']) or '-', **result))
+
+    return results
+
+
+
+def save_results(results, path):
+    '''
+    Writes the benchmark results together with the environment they were measured in.
+    '''
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'pandas': pd.__version__,
+              'machine': platform.platform(),
+              'results': results}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+
+def compare_results(baseline_path, results, threshold=1.25):
+    '''
+    Compares results with an earlier results file. Cases that got slower than threshold
+    times the baseline are flagged.
+
+        Returns:
+            DataFrame with the baseline and current seconds and their ratio
+    '''
+
+    with open(baseline_path) as f:
+        baseline = pd.DataFrame(json.load(f)['results'])
+    keys = ['case', 'n_features', 'n_ccs', 'max_order']
+    table = pd.merge(baseline[keys + ['seconds']], pd.DataFrame(results)[keys + ['seconds']],
+                     on=keys, suffixes=('_baseline', '_current'))
+    table['ratio'] = table['seconds_current'] / table['seconds_baseline']
+    table['regression'] = table['ratio'] > threshold
+
+    return table
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the TEVA post-processing functions on synthetic archives.')
+    parser.add_argument('--features', type=int, nargs='+', default=[60], help='feature counts (default: %(default)s)')
+    parser.add_argument('--ccs', type=int, nargs='+', default=[1000, 10000], help='CC counts (default: %(default)s)')
+    parser.add_argument('--orders', type=int, nargs='+', default=[3], help='max CC orders (default: %(default)s)')
+    parser.add_argument('--n-grid', type=int, default=200, help='fitness contour grid size (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed repetitions per case (default: %(default)s)')
+    parser.add_argument('--only', nargs='+', help='only run these cases')
+    parser.add_argument('-o', '--output', default='TEVA_benchmark.json', help='results file (default: %(default)s)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--imports', action='store_true', help='benchmark the module imports instead')
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        results = run_import_benchmarks(args.only or IMPORT_MODULES, args.repeat)
+    else:
+        results = run_benchmarks(args.features, args.ccs, args.orders, args.n_grid, args.repeat, args.only)
+    save_results(results, args.output)
+    print('results written to {}'.format(args.output))
+
+    status = 0
+    if args.imports and any(result['deferred_loaded'] for result in results):
+        print('modules loading deferred packages at import time: {}'.format(
+              ', '.join(result['case'] for result in results if result['deferred_loaded'])))
+        status = 1
+    if args.compare:
+        table = compare_results(args.compare, results)
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(table)
+        if table['regression'].any():
+            status = 1
+
+    return status
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,404 @@
+# On-disk memoization of post-processing results.
+#
+# Functions decorated with @memoize (the sheet parsers and the fitness contours of
+# TEVA_Post_Processing, the stages that run once per loaded run) store their results on disk,
+# keyed on a content hash of their arguments and of the source of the module that defines
+# them, so a restarted kernel or a rerun batch job reloads the results instead of recomputing
+# them. Arrays are stored as .npy files and reloaded memory-mapped (read only, no copy);
+# other values (lists, pandas objects) are pickled. Once the cache grows beyond max_bytes the
+# least recently used results are removed. The cache is off until enable() is called or the
+# TEVA_CACHE_DIR environment variable is set (TEVA_CACHE_MAX_MB sets the size limit).
+#
+# Example:
+#           cache.enable('teva_cache')
+#           cc_features = post.parse_cc(ccs)        # computed and stored, reloaded after a restart
+#           print(cache.stats())
+
+# Import libraries
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import inspect
+import functools
+import threading
+import numpy as np
+import pandas as pd
+
+# Bump when the storage layout changes, older entries are then ignored
+CACHE_VERSION = 1
+
+# Eviction frees the cache down to this share of max_bytes, so a full cache is not rescanned
+# on every store
+EVICT_TO = 0.8
+
+# Columns of the statistics table
+STAT_COLUMNS = ['hits', 'misses', 'uncacheable', 'load_ms', 'compute_ms', 'stored_kB']
+
+# size of the cache folder is counted up from one scan, None until the first store
+_options = {'dir': None, 'max_bytes': 2 << 30, 'bytes': None}
+_stats = {}
+_lock = threading.Lock()
+_source_hashes = {}
+_MISSING = object()
+
+
+
+# Switching on and off
+def enable(cache_dir, max_bytes=2 << 30):
+    '''
+    Stores the results of the memoized functions in cache_dir (created if needed).
+
+            cache_dir       folder of the cache, can be shared between runs and processes
+            max_bytes       size limit, least recently used results are removed beyond it
+    '''
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _options['dir'] = os.path.abspath(cache_dir)
+    _options['max_bytes'] = max_bytes
+    _options['bytes'] = None
+
+
+
+def disable():
+    '''
+    Calls the memoized functions directly again. Stored results are kept.
+    '''
+
+    _options['dir'] = None
+
+
+
+def enabled():
+    return _options['dir'] is not None
+
+
+
+def clear():
+    '''
+    Removes all stored results.
+    '''
+
+    for entry in _entries():
+        shutil.rmtree(entry['path'], ignore_errors=True)
+    _options['bytes'] = None
+
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+
+# Statistics
+def stats():
+    '''
+    Per function hits, misses, calls with arguments that cannot be hashed (computed without
+    the cache), total load and compute time and the size of the stored results.
+    '''
+
+    with _lock:
+        table = pd.DataFrame.from_dict(_stats, orient='index', columns=STAT_COLUMNS)
+    table.index.name = 'function'
+    calls = table['hits'] + table['misses']
+    table['hit_rate'] = table['hits'] / calls.where(calls > 0)
+
+    return table.sort_index()
+
+
+
+def entries():
+    '''
+    The stored results, most recently used first.
+    '''
+
+    table = pd.DataFrame(_entries(), columns=['function', 'key', 'bytes', 'last_used', 'path'])
+    table['last_used'] = pd.to_datetime(table['last_used'], unit='s')
+
+    return table.sort_values('last_used', ascending=False, ignore_index=True).drop(columns='path')
+
+
+
+def _count(name, field, **timings):
+    with _lock:
+        counts = _stats.setdefault(name, dict.fromkeys(STAT_COLUMNS, 0))
+        counts[field] += 1
+        for column, value in timings.items():
+            counts[column] += value
+
+
+
+# Decorator
+def memoize(function):
+    '''
+    Memoizes a function on disk while the cache is enabled. The result is looked up by the
+    content of the arguments (arrays, DataFrames, lists, scalars), calls with other arguments
+    (e.g. sparse matrices) are computed without the cache. Reloaded arrays are read only.
+    The undecorated function is available as .uncached.
+    '''
+
+    name = '{}.{}'.format(function.__module__.replace('TEVA_', ''), function.__qualname__)
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _options['dir'] is None:
+            return function(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = argument_key(name, _source_hash(function), bound.arguments)
+        except TypeError:
+            _count(name, 'uncacheable')
+            return function(*args, **kwargs)
+
+        path = os.path.join(_options['dir'], name, key)
+        result = _load(path)
+        if result is not _MISSING:
+            _count(name, 'hits', load_ms=(time.perf_counter() - start) * 1000)
+            return result
+
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        compute_ms = (time.perf_counter() - start) * 1000
+        size = _store(path, result)
+        if size is None:
+            _count(name, 'uncacheable', compute_ms=compute_ms)
+        else:
+            _count(name, 'misses', compute_ms=compute_ms, stored_kB=size / 1024)
+            _grow(size)
+
+        return result
+
+    wrapper.uncached = function
+
+    return wrapper
+
+
+
+# Keys
+def argument_key(*values):
+    '''
+    Content hash of a mix of arrays, DataFrames / Series, lists, tuples, dicts and scalars.
+    Raises TypeError for other values.
+    '''
+
+    digest = hashlib.sha1(str(CACHE_VERSION).encode())
+    for value in values:
+        _digest(digest, value)
+
+    return digest.hexdigest()
+
+
+
+def _digest(digest, value):
+    digest.update(type(value).__name__.encode())
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic, np.dtype, type)):
+        digest.update(repr(value).encode())
+    elif isinstance(value, np.ma.MaskedArray):
+        _digest(digest, np.ma.getdata(value))
+        _digest(digest, np.ma.getmaskarray(value))
+    elif isinstance(value, np.ndarray):
+        digest.update(str((value.dtype.str, value.shape)).encode())
+        if value.dtype == object:
+            for item in value.ravel():
+                _digest(digest, item)
+        else:
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, pd.DataFrame):
+        _digest(digest, value.index)
+        _digest(digest, list(value.columns))
+        digest.update(str(list(value.dtypes)).encode())
+        # columns are hashed one block of equal numpy dtypes at a time, TEVA sheets have
+        # thousands of indicator columns
+        dtypes = value.dtypes.to_numpy()
+        for dtype in pd.unique(dtypes):
+            block = value.iloc[:, np.flatnonzero(dtypes == dtype)]
+            if dtype == object:
+                digest.update(pd.util.hash_array(block.to_numpy().ravel(order='F')).tobytes())
+            elif isinstance(dtype, np.dtype):
+                digest.update(np.ascontiguousarray(block.to_numpy(dtype=dtype)).tobytes())
+            else:
+                for column in range(block.shape[1]):
+                    _digest(digest, block.iloc[:, column])
+    elif isinstance(value, pd.Series):
+        digest.update(str((value.name, value.dtype, len(value))).encode())
+        _digest(digest, value.index)
+        digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, pd.Index):
+        digest.update(str((value.dtype, len(value))).encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(str(len(value)).encode())
+        for item in value:
+            _digest(digest, item)
+    elif isinstance(value, dict):
+        digest.update(str(len(value)).encode())
+        for item, content in value.items():
+            _digest(digest, item)
+            _digest(digest, content)
+    else:
+        raise TypeError('cannot hash {} for the cache'.format(type(value).__name__))
+
+
+
+def _source_hash(function):
+    # results are only reused with the same source of the defining module
+    module = sys.modules.get(function.__module__)
+    path = getattr(module, '__file__', None)
+    if path not in _source_hashes:
+        try:
+            with open(path, 'rb') as f:
+                _source_hashes[path] = hashlib.sha1(f.read()).hexdigest()
+        except (OSError, TypeError):
+            _source_hashes[path] = ''
+
+    return _source_hashes[path]
+
+
+
+# Storage
+def _encode(value, files):
+    # json description of a result, arrays / pickles are added to files (name -> content)
+    if isinstance(value, np.ma.MaskedArray):
+        return {'masked': _encode(np.ma.getdata(value), files), 'mask': _encode(np.ma.getmaskarray(value), files)}
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        name = '{}.npy'.format(len(files))
+        files[name] = np.asarray(value)
+        return {'array': name}
+    if isinstance(value, tuple):
+        return {'tuple': [_encode(item, files) for item in value]}
+    if isinstance(value, dict) and all(isinstance(item, str) for item in value):
+        return {'dict': [[item, _encode(content, files)] for item, content in value.items()]}
+    name = '{}.pkl'.format(len(files))
+    files[name] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return {'pickle': name}
+
+
+
+def _decode(description, path):
+    if 'array' in description:
+        file = os.path.join(path, description['array'])
+        try:
+            return np.load(file, mmap_mode='r')
+        except ValueError:
+            # empty arrays cannot be memory-mapped
+            return np.load(file)
+    if 'masked' in description:
+        return np.ma.MaskedArray(_decode(description['masked'], path), mask=_decode(description['mask'], path), copy=False)
+    if 'tuple' in description:
+        return tuple(_decode(item, path) for item in description['tuple'])
+    if 'dict' in description:
+        return {item: _decode(content, path) for item, content in description['dict']}
+    with open(os.path.join(path, description['pickle']), 'rb') as f:
+        return pickle.load(f)
+
+
+
+def _store(path, result):
+    # writes the result to a temporary folder first so a half-written entry is never read.
+    # Returns the stored bytes, None if the result cannot be stored.
+    files = {}
+    try:
+        description = _encode(result, files)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+    tmp = '{}.tmp{}.{}'.format(path, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(tmp)
+        for name, content in files.items():
+            if name.endswith('.npy'):
+                np.save(os.path.join(tmp, name), content, allow_pickle=False)
+            else:
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(content)
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'result': description}, f)
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # another thread or process may have stored the same result first
+        return 0 if os.path.exists(os.path.join(path, 'manifest.json')) else None
+
+    return size
+
+
+
+def _load(path):
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != CACHE_VERSION:
+            return _MISSING
+        result = _decode(manifest['result'], path)
+        # the modification time of the manifest orders the entries for eviction
+        os.utime(os.path.join(path, 'manifest.json'))
+    except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+        return _MISSING
+
+    return result
+
+
+
+def _entries():
+    # stored results with their size and last use
+    found = []
+    if _options['dir'] is None or not os.path.isdir(_options['dir']):
+        return found
+    for function in os.scandir(_options['dir']):
+        if not function.is_dir():
+            continue
+        for entry in os.scandir(function.path):
+            manifest = os.path.join(entry.path, 'manifest.json')
+            if '.tmp' in entry.name or not os.path.exists(manifest):
+                continue
+            try:
+                size = sum(item.stat().st_size for item in os.scandir(entry.path))
+                found.append({'function': function.name, 'key': entry.name, 'bytes': size,
+                              'last_used': os.path.getmtime(manifest), 'path': entry.path})
+            except OSError:
+                continue
+
+    return found
+
+
+
+def _grow(size):
+    # adds a stored result to the running size of the cache, the folder is only scanned the
+    # first time and when the running size passes max_bytes
+    with _lock:
+        if _options['bytes'] is None:
+            _options['bytes'] = sum(entry['bytes'] for entry in _entries())
+        else:
+            _options['bytes'] += size
+        if _options['bytes'] > _options['max_bytes']:
+            _options['bytes'] = _evict(int(_options['max_bytes'] * EVICT_TO))
+
+
+
+def _evict(max_bytes):
+    # removes the least recently used results until the cache fits into max_bytes.
+    # Returns the size left.
+    found = sorted(_entries(), key=lambda entry: entry['last_used'])
+    total = sum(entry['bytes'] for entry in found)
+    for entry in found:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry['path'], ignore_errors=True)
+        total -= entry['bytes']
+
+    return total
+
+
+
+if os.environ.get('TEVA_CACHE_DIR'):
+    enable(os.environ['TEVA_CACHE_DIR'], int(float(os.environ.get('TEVA_CACHE_MAX_MB', 2048)) * 2**20))
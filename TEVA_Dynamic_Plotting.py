@@ -1,39 +1,51 @@
 
 # Import libraries
+import threading
+import traceback
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
-import holoviews as hv
-import panel as pn
-from bokeh.plotting import figure
-from bokeh.models import LinearColorMapper
-from bokeh.palettes import Viridis256
-from bokeh.models import HoverTool, CDSView, GroupFilter, NumeralTickFormatter, LinearColorMapper, ColorBar, IndexFilter, Label, LabelSet, ColumnDataSource
-from bokeh.transform import linear_cmap
 import TEVA_Post_Processing as post
+# holoviews, panel and bokeh are imported by the functions that use them, so importing this
+# module (e.g. for TabUpdater or from a batch job) does not load the plotting stack
 
 
 
 
 # Dynamic / Interactive Plots
-def feature_plotter(selected_cc, data, cc_features, feature_values_by_cc):
+def feature_plotter(selected_cc, data, cc_features, feature_values_by_cc, feature_summaries=None):
     '''
     Generates flexible region that contains KDE plots of the features associated with a selected CC.
     Also plots the feature ranges associaated with the selected CC.
 
     KDE plot for continuous data.
     Bar plot for categorical data (work in progress)
+
+    feature_summaries is an optional post.FeatureSummaries of data. The KDE curves and value
+    counts are then computed once per feature, and selecting a CC only overlays its ranges.
+    With an ObservationSummaries (TEVA_Observations.py) streamed from the observation file,
+    data is not needed and can be None.
     '''
 
+    import holoviews as hv
+    import panel as pn
+
+    if feature_summaries is None:
+        feature_summaries = post.FeatureSummaries(data)
+
     fig = []
     for i in range(len(cc_features[selected_cc])):
+        feature = cc_features[selected_cc][i]
         # check if continuous or categorical
         '''
         This is not very robust: it just checks if the column dtpye is float or not, and
         assumes that float is continuous and anything else is categorical.
         '''
-        if data[cc_features[selected_cc][i]].dtype == 'float64':
+        if feature_summaries.is_continuous(feature):
             # KDE plot
-            kde_plot = data[cc_features[selected_cc][i]].dropna().hvplot.kde(height=200, width=300, hover=False).opts(color='lightgray')
+            xs, ys = feature_summaries.density(feature)
+            kde_plot = hv.Area((xs, ys), kdims=[feature], vdims=[hv.Dimension(feature + '_density', label='Density')]).opts(height=200, width=300, color='lightgray')
 
             # VSpan glyph to show feature range        
             feat_range_plot = hv.VSpan(feature_values_by_cc[selected_cc][i][0], feature_values_by_cc[selected_cc][i][1]).opts(color='red', alpha=0.3)
@@ -45,22 +57,13 @@ def feature_plotter(selected_cc, data, cc_features, feature_values_by_cc):
         else:
             # bar plot
             # prepare data for bar
-            a = data[cc_features[selected_cc][i]].value_counts()
-            a.sort_index(inplace=True)
-            a = pd.DataFrame(a)
+            a = pd.DataFrame(feature_summaries.value_counts(feature))
 
             # bar color by feature range
-            b = feature_values_by_cc[selected_cc][i]
-            c = a.index.tolist()
-            bar_colors = []
-            for j in range(len(a)):
-                if c[j] in b:
-                    bar_colors.append('lightcoral')
-                else:
-                    bar_colors.append('lightgray')
-            a['bar_color'] = bar_colors
-
-            bar_plot = a.hvplot.bar(x=cc_features[selected_cc][i], y='count', height=200, width=300, hover=False, color='bar_color').opts(alpha=0.7)
+            in_range = a.index.isin(feature_values_by_cc[selected_cc][i])
+            a['bar_color'] = np.where(in_range, 'lightcoral', 'lightgray')
+
+            bar_plot = a.hvplot.bar(x=feature, y='count', height=200, width=300, hover=False, color='bar_color').opts(alpha=0.7)
 
             # Combine plots and add to fig list, set options
             fig.append(bar_plot)# * feat_range_plot)
@@ -77,6 +80,10 @@ def confusion_matrix_plotter(selected_cc, ccs):
     Plots a confusion matrix based on the selected CC.
     '''
 
+    from bokeh.plotting import figure
+    from bokeh.models import ColorBar, ColumnDataSource, HoverTool, LabelSet, LinearColorMapper
+    from bokeh.palettes import Viridis256
+
     conf = post.confusion_matrix(ccs, selected_cc)
     conf_percent = np.round((conf / sum(ccs.iloc[0]['tp' : 'fn'])) * 100, 1)
     conf_data = {
@@ -116,153 +123,380 @@ def confusion_matrix_plotter(selected_cc, ccs):
 
 
 
-def cc_plotter(min_sens, max_sens, fitness, x_fit, y_fit, z_fit, contour_colors, cc_plot_data, cc_len, cc_plot_source, cc_colors, ccs, dnf_len, dnf_plot_data, dnf_plot_source, dnf_colors, dnfs):
+def contour_plotter(p, geometry, **visuals):
     '''
-    Plots the main figure (PPV vs. COV) that dynamically updates based on the selected sensitivity range.
+    Adds fitness contours to figure p from precomputed post.contour_geometry output.
+
+    Works like p.contour(x, y, z, levels, **visuals), but only the precomputed polygons and
+    lines are handed to Bokeh, the fitness grid is not recontoured.
     '''
-    
-    h = 600
-    w = 800
-
-    dnf_TOOLS = [
-        ('DNF #', '@DNF'),
-        ('Order', '@Order'),
-        ('PPV', '@y_values'),
-        ('COV', '@x_values'),
-        ('CCs', '@CCs')]
-
-    cc_TOOLS = [
-        ('CC #', '@CC'),
-        ('Order', '@Order'),
-        ('PPV', '@y_values'),
-        ('COV', '@x_values'),
-        ('Min Sens.', '@min_sens'),
-        ('Max Sens.', '@max_sens'),
-        ('Features', '@Features')]
-    
-    # Figure
-    p = figure(width = w, height = h,
-            y_range=(0,1.05),
-            x_range=(0,1.05),
-            x_axis_label='Observation Coverage',
-            y_axis_label='Positive Predictive Value',
-            hidpi=True,
-            tools='crosshair, pan, tap, wheel_zoom, zoom_in, zoom_out, box_zoom, undo, redo, reset, save, lasso_select, help')
-
-    # Fitness Contours
-    cont_levels = np.linspace(min(fitness), max(fitness), 10)
-    contour_renderer = p.contour(x_fit, y_fit, z_fit,
-                                levels=cont_levels,
-                                line_color='gray',
-                                fill_color=contour_colors,
-                                line_dash='dashed')
-    
-    #### CCs
-    # filter by sensitivity
-    filter_idx = cc_plot_data[(cc_plot_data['min_sens'] >= min_sens) & (cc_plot_data['max_sens'] <= max_sens)].index.to_list()
-    sens_filtered_CCs = IndexFilter(filter_idx)
-
-    # CCs by order
-    all_cc_plots = []
-    for i in range(0, len(cc_len)):
-        # Filter by order
-        # order_filtered_CCs = GroupFilter(column_name='Order', group=len(cc_len) - i)
-        filter_cc_order_idx = cc_plot_data.index[cc_plot_data['Order'] == i].tolist()
-        order_filtered_CCs = IndexFilter(filter_cc_order_idx)
-        # Plot
-        cc_plot = p.scatter('x_values', 'y_values', source=cc_plot_source,
-                            view=CDSView(filter=sens_filtered_CCs & order_filtered_CCs),
-                            size=12,
-                            marker='square',
-                            line_color='white',
-                            fill_color=linear_cmap('Order', cc_colors, low=min(ccs['order']), high=max(ccs['order'])),
-                            hover_color='black',
-                            legend_label='CC Order {}'.format(len(cc_len) - i),
-                            fill_alpha=1)
-        all_cc_plots.append(cc_plot)
+
+    # empty placeholder grid, the renderer gets the real geometry below
+    placeholder = np.full((2, 2), np.nan)
+    contour_renderer = p.contour([0, 1], [0, 1], placeholder, levels=geometry['levels'], **visuals)
+    set_contour_geometry(contour_renderer, geometry)
+
+    return contour_renderer
+
+
+
+
+
+def set_contour_geometry(contour_renderer, geometry):
+    '''
+    Replaces the polygons and lines of a contour renderer with post.contour_geometry output
+    (computed for the same levels).
+    '''
+
+    from bokeh.plotting.contour import ContourData, FillData, LineData
+
+    levels = geometry['levels']
+    contour_renderer.set_data(ContourData(
+        FillData(xs=geometry['fill_xs'], ys=geometry['fill_ys'], lower_levels=levels[:-1], upper_levels=levels[1:]),
+        LineData(xs=geometry['line_xs'], ys=geometry['line_ys'], levels=levels)))
+
+
+
+
+
+def _slider_value(slider):
+    # the tab plotters take the slider widgets or their values (snapshots for worker threads)
+    return getattr(slider, 'value', slider)
+
+
+
+
+
+def _column_values(column, idx):
+    # rows of a plot data column, lists (tooltip features / ccs) as plain lists
+    values = column.to_numpy()[idx]
+    return values.tolist() if values.dtype == object else values
+
+
+
+
+
+def density_plotter(p, colors):
+    '''
+    Adds an (initially empty) binned density image renderer to a figure, colored from light
+    (few points) to dark (many points) with a log color scale. Empty bins are transparent.
+    '''
+
+    from bokeh.models import ColumnDataSource, LogColorMapper
+
+    mapper = LogColorMapper(palette=colors[::-1], nan_color='rgba(0, 0, 0, 0)')
+    source = ColumnDataSource(data={'image': [], 'x': [], 'y': [], 'dw': [], 'dh': []})
+
+    return p.image(image='image', x='x', y='y', dw='dw', dh='dh', source=source, color_mapper=mapper, alpha=0.8)
+
+
+
+
+
+class CCPlot:
+    '''
+    Main figure (PPV vs. COV) that is built once and updated in place when the sensitivity
+    range changes.
+
+    The figure, the fitness contours, the scatter renderers and the hover tools are only
+    created here. update() swaps the indices of the two shared sensitivity IndexFilters, so a
+    slider move only sends those index lists to the browser. Usage with Panel:
+
+                # main_plot = CCPlot(fitness, x_fit, ..., dnfs, sens_index)
+                # pn.bind(main_plot.update, sens_slider_min, sens_slider_max, watch=True)
+                # pn.pane.Bokeh(main_plot.figure)
+
+    Level of detail: when there are more than lod_threshold CCs + DNFs, the full data sources
+    are not sent to the browser. The CCs and DNFs are drawn as binned density images of the
+    visible area instead (binned again on every zoom / pan), and once at most max_points
+    points are in view these points, with their tooltip lists, are sent and drawn as usual.
+    Zoom and pan updates need a live Python kernel / server.
+    '''
+
+    def __init__(self, fitness, x_fit, y_fit, z_fit, contour_colors, cc_plot_data, cc_len, cc_plot_source, cc_colors, ccs, dnf_len, dnf_plot_data, dnf_plot_source, dnf_colors, dnfs, sens_index=None,
+                 lod_threshold=20000, max_points=5000, lod_bins=256):
+        from bokeh.plotting import figure
+        from bokeh.models import CDSView, ColumnDataSource, GroupFilter, HoverTool, IndexFilter, NumeralTickFormatter
+        from bokeh.events import RangesUpdate
+        from bokeh.transform import linear_cmap
+
+        h = 600
+        w = 800
+
+        dnf_TOOLS = [
+            ('DNF #', '@DNF'),
+            ('Order', '@Order'),
+            ('PPV', '@y_values'),
+            ('COV', '@x_values'),
+            ('CCs', '@CCs')]
+
+        cc_TOOLS = [
+            ('CC #', '@CC'),
+            ('Order', '@Order'),
+            ('PPV', '@y_values'),
+            ('COV', '@x_values'),
+            ('Min Sens.', '@min_sens'),
+            ('Max Sens.', '@max_sens'),
+            ('Features', '@Features')]
+        
+        # Figure
+        p = figure(width = w, height = h,
+                y_range=(0,1.05),
+                x_range=(0,1.05),
+                x_axis_label='Observation Coverage',
+                y_axis_label='Positive Predictive Value',
+                hidpi=True,
+                tools='crosshair, pan, tap, wheel_zoom, zoom_in, zoom_out, box_zoom, undo, redo, reset, save, lasso_select, help')
+
+        # Fitness Contours (geometry is computed once per grid and cached in post)
+        cont_levels = post.contour_levels(fitness)
+        contour_renderer = contour_plotter(p, post.contour_geometry(x_fit, y_fit, z_fit, cont_levels),
+                                           line_color='gray',
+                                           fill_color=contour_colors,
+                                           line_dash='dashed')
         
-    
-    #### DNFs        
-    # filter by sensitivity
-    filter_dnf_idx = []
-    for i in range(len(dnf_plot_data['CCs'])):
-        if set(list(map(int, dnf_plot_data['CCs'][i]))).issubset(filter_idx) == True:
-            filter_dnf_idx.append(i)
+        # sensitivity filters, shared by all views and updated in place
+        if sens_index is None:
+            sens_index = post.SensitivityIndex.from_plot_data(cc_plot_data, dnf_plot_data)
+        self.sens_index = sens_index
+        filter_idx, filter_dnf_idx = sens_index.query(-np.inf, np.inf)
+        self.sens_filtered_CCs = IndexFilter(filter_idx.tolist())
+        self.sens_filtered_DNFs = IndexFilter(filter_dnf_idx.tolist())
+        self.sens_range = (-np.inf, np.inf)
+        # optional extra cc filter (see filter_ccs)
+        self.cc_mask = None
+
+        # level of detail mode: only the points in view are sent, through small sources
+        self.lod = lod_threshold is not None and len(cc_plot_data) + len(dnf_plot_data) > lod_threshold
+        if self.lod:
+            self.cc_plot_data = cc_plot_data
+            self.dnf_plot_data = dnf_plot_data
+            self.max_points = max_points
+            self.lod_bins = lod_bins
+            self.viewport = (p.x_range.start, p.x_range.end, p.y_range.start, p.y_range.end)
+            cc_plot_source = ColumnDataSource(data={col: [] for col in cc_plot_data.columns})
+            dnf_plot_source = ColumnDataSource(data={col: [] for col in dnf_plot_data.columns})
+            self.cc_view_source = cc_plot_source
+            self.dnf_view_source = dnf_plot_source
+            self.cc_density = density_plotter(p, cc_colors)
+            self.dnf_density = density_plotter(p, dnf_colors)
+            p.add_tools(HoverTool(renderers=[self.cc_density, self.dnf_density], tooltips=[('Count', '@image')]))
+            p.on_event(RangesUpdate, self._on_ranges)
+
+        #### CCs
+        # CCs by order
+        all_cc_plots = []
+        for i in range(0, len(cc_len)):
+            # Filter by order
+            # order_filtered_CCs = GroupFilter(column_name='Order', group=len(cc_len) - i)
+            if self.lod:
+                # the view source only holds sensitivity filtered points
+                cc_view = CDSView(filter=GroupFilter(column_name='Order', group=i))
+            else:
+                filter_cc_order_idx = cc_plot_data.index[cc_plot_data['Order'] == i].tolist()
+                order_filtered_CCs = IndexFilter(filter_cc_order_idx)
+                cc_view = CDSView(filter=self.sens_filtered_CCs & order_filtered_CCs)
+            # Plot
+            cc_plot = p.scatter('x_values', 'y_values', source=cc_plot_source,
+                                view=cc_view,
+                                size=12,
+                                marker='square',
+                                line_color='white',
+                                fill_color=linear_cmap('Order', cc_colors, low=min(ccs['order']), high=max(ccs['order'])),
+                                hover_color='black',
+                                legend_label='CC Order {}'.format(len(cc_len) - i),
+                                fill_alpha=1)
+            all_cc_plots.append(cc_plot)
+            
+        
+        #### DNFs        
+        # DNFs by order
+        all_dnf_plots = []
+        for i in range(0, len(dnf_len)):
+            # filter by order
+            # order_filtered_DNFs = GroupFilter(column_name='Order', group=len(dnf_len) - i)
+            if self.lod:
+                dnf_view = CDSView(filter=GroupFilter(column_name='Order', group=i))
+            else:
+                filter_dnf_order_idx = dnf_plot_data.index[dnf_plot_data['Order'] == i].tolist()
+                order_filtered_DNFs = IndexFilter(filter_dnf_order_idx)
+                dnf_view = CDSView(filter=self.sens_filtered_DNFs & order_filtered_DNFs)
+            # plot
+            dnf_plot = p.scatter('x_values', 'y_values', source=dnf_plot_source,
+                                 view=dnf_view,
+                                 size=13,
+                                 marker='circle',
+                                 line_color='white',
+                                 fill_color=linear_cmap('Order', dnf_colors, low=min(dnfs['order']), high=max(dnfs['order'])),
+                                 hover_color='black',
+                                 legend_label='DNF Order {}'.format(len(dnf_len) - i),
+                                 fill_alpha=1)
+            all_dnf_plots.append(dnf_plot)
+
+        # Add hover tool for CCs
+        p.add_tools(HoverTool(renderers = all_cc_plots,
+                              tooltips=cc_TOOLS,
+                              mode='mouse',
+                              point_policy='follow_mouse'))
+
+        # Add seperate hover tool for DNFs
+        p.add_tools(HoverTool(renderers = all_dnf_plots,
+                              tooltips=dnf_TOOLS,
+                              mode='mouse',
+                              point_policy='follow_mouse'))
+
+        # Add color bar for fitness contours
+        colorbar = contour_renderer.construct_color_bar(height=int(h/2),
+                                                        location=(0,int(h/4)),
+                                                        formatter = NumeralTickFormatter(format='0 a'),
+                                                        bar_line_color='black',
+                                                        major_tick_line_color='black',
+                                                        title='Fitness, 10^')
+
+        # General formatting
+        p.legend.click_policy='hide'
+        p.legend.location='bottom_left'
+        p.add_layout(colorbar, 'right')
+
+        self.cc_renderers = all_cc_plots
+        self.dnf_renderers = all_dnf_plots
+        self.figure = p
+        if self.lod:
+            self._refresh()
+
+
+    def update(self, min_sens, max_sens):
+        '''
+        Applies a new sensitivity range to the existing figure and returns it.
+        '''
+
+        if self.lod:
+            if (min_sens, max_sens) != self.sens_range:
+                self.sens_range = (min_sens, max_sens)
+                self._refresh()
+            return self.figure
+
+        self.sens_range = (min_sens, max_sens)
+        self._apply_filters()
+
+        return self.figure
+
+
+    def filter_ccs(self, cc_mask=None):
+        '''
+        Only shows the ccs where cc_mask (boolean array over the cc rows, e.g. from
+        post.FeatureIntervalIndex.mask) is True, on top of the sensitivity filter. The dnfs
+        are not affected. None removes the filter.
+        '''
+
+        self.cc_mask = None if cc_mask is None else np.asarray(cc_mask, dtype=bool)
+        if self.lod:
+            self._refresh()
         else:
-            pass
-    sens_filtered_DNFs = IndexFilter(filter_dnf_idx)
-    
-    # DNFs by order
-    all_dnf_plots = []
-    for i in range(0, len(dnf_len)):
-        # filter by order
-        # order_filtered_DNFs = GroupFilter(column_name='Order', group=len(dnf_len) - i)
-        filter_dnf_order_idx = dnf_plot_data.index[dnf_plot_data['Order'] == i].tolist()
-        order_filtered_DNFs = IndexFilter(filter_dnf_order_idx)
-        # plot
-        dnf_plot = p.scatter('x_values', 'y_values', source=dnf_plot_source,
-                             view=CDSView(filter=sens_filtered_DNFs & order_filtered_DNFs),
-                             size=13,
-                             marker='circle',
-                             line_color='white',
-                             fill_color=linear_cmap('Order', dnf_colors, low=min(dnfs['order']), high=max(dnfs['order'])),
-                             hover_color='black',
-                             legend_label='DNF Order {}'.format(len(dnf_len) - i),
-                             fill_alpha=1)
-        all_dnf_plots.append(dnf_plot)
-
-    # Add hover tool for CCs
-    p.add_tools(HoverTool(renderers = all_cc_plots,
-                          tooltips=cc_TOOLS,
-                          mode='mouse',
-                          point_policy='follow_mouse'))
-
-    # Add seperate hover tool for DNFs
-    p.add_tools(HoverTool(renderers = all_dnf_plots,
-                          tooltips=dnf_TOOLS,
-                          mode='mouse',
-                          point_policy='follow_mouse'))
-
-    # Add color bar for fitness contours
-    colorbar = contour_renderer.construct_color_bar(height=int(h/2),
-                                                    location=(0,int(h/4)),
-                                                    formatter = NumeralTickFormatter(format='0 a'),
-                                                    bar_line_color='black',
-                                                    major_tick_line_color='black',
-                                                    title='Fitness, 10^')
+            self._apply_filters()
+
+        return self.figure
+
+
+    def _apply_filters(self):
+        filter_idx, filter_dnf_idx = self.sens_index.query(*self.sens_range)
+        if self.cc_mask is not None:
+            filter_idx = filter_idx[self.cc_mask[filter_idx]]
+        filter_idx = filter_idx.tolist()
+        filter_dnf_idx = filter_dnf_idx.tolist()
+
+        # only touch the filters when the selection changed, each change is sent to the browser
+        if filter_idx != self.sens_filtered_CCs.indices:
+            self.sens_filtered_CCs.indices = filter_idx
+        if filter_dnf_idx != self.sens_filtered_DNFs.indices:
+            self.sens_filtered_DNFs.indices = filter_dnf_idx
+
+
+    def _on_ranges(self, event):
+        # zoom / pan in level of detail mode
+        if None in (event.x0, event.x1, event.y0, event.y1):
+            return
+        self.viewport = (event.x0, event.x1, event.y0, event.y1)
+        self._refresh()
 
-    # General formatting
-    p.legend.click_policy='hide'
-    p.legend.location='bottom_left'
-    p.add_layout(colorbar, 'right')
-    nonselection_fill_alpha=0.2
-    
-    return p
 
+    def _refresh(self):
+        # sends the points in view if there are few enough, binned densities of the view otherwise
+        x0, x1, y0, y1 = self.viewport
+        cc_mask, dnf_mask = self.sens_index.masks(*self.sens_range)
+        if self.cc_mask is not None:
+            cc_mask = cc_mask & self.cc_mask
 
+        views = []
+        for data, mask in ((self.cc_plot_data, cc_mask), (self.dnf_plot_data, dnf_mask)):
+            x = data['x_values'].to_numpy(dtype=float)
+            y = data['y_values'].to_numpy(dtype=float)
+            in_view = mask & (x >= min(x0, x1)) & (x <= max(x0, x1)) & (y >= min(y0, y1)) & (y <= max(y0, y1))
+            views.append((x[mask], y[mask], np.flatnonzero(in_view)))
+        show_points = sum(len(idx) for x, y, idx in views) <= self.max_points
 
+        for (x, y, idx), data, source, density in zip(views, (self.cc_plot_data, self.dnf_plot_data),
+                                                    (self.cc_view_source, self.dnf_view_source),
+                                                    (self.cc_density, self.dnf_density)):
+            if show_points:
+                source.data = {col: _column_values(data[col], idx) for col in data.columns}
+                density.visible = False
+            else:
+                source.data = {col: [] for col in data.columns}
+                density.data_source.data = {'image': [post.binned_density(x, y, (x0, x1), (y0, y1), self.lod_bins)],
+                                            'x': [min(x0, x1)], 'y': [min(y0, y1)],
+                                            'dw': [abs(x1 - x0)], 'dh': [abs(y1 - y0)]}
+                density.visible = True
+
+
+
+
+
+
+def cc_plotter(min_sens, max_sens, fitness, x_fit, y_fit, z_fit, contour_colors, cc_plot_data, cc_len, cc_plot_source, cc_colors, ccs, dnf_len, dnf_plot_data, dnf_plot_source, dnf_colors, dnfs, sens_index=None):
+    '''
+    Plots the main figure (PPV vs. COV) for the selected sensitivity range.
+
+    This builds a new figure on every call; for interactive use build a CCPlot once and bind
+    its update method to the sliders instead.
+    '''
 
+    main_plot = CCPlot(fitness, x_fit, y_fit, z_fit, contour_colors, cc_plot_data, cc_len, cc_plot_source, cc_colors, ccs, dnf_len, dnf_plot_data, dnf_plot_source, dnf_colors, dnfs, sens_index)
+
+    return main_plot.update(min_sens, max_sens)
+
+
+
+
+
+def cc_heatmap_plotter(cc_heatmap_colormap, unique_features, cc_features, cc_plot_data, min_sens, max_sens, sens_index=None, incidence=None):
+    '''
+    Feature pairing heatmap of the sensitivity-filtered CCs.
+
+    incidence is an optional post.cc_incidence_matrix(unique_features, cc_features) built once
+    per run, the filtered heatmap is then one masked product over its rows and the columns of
+    the filtered features instead of a rebuild.
+    '''
+
+    from bokeh.plotting import figure
+    from bokeh.models import ColorBar, ColumnDataSource, LinearColorMapper
 
-def cc_heatmap_plotter(cc_heatmap_colormap, unique_features, cc_features, cc_plot_data, min_sens, max_sens):
-    
     cc_image_hover = [
         ('Count', '@image')
     ]
 
-    filter_idx = cc_plot_data[(cc_plot_data['min_sens'] >= min_sens.value) & (cc_plot_data['max_sens'] <= max_sens.value)].index.to_list()
+    if sens_index is None:
+        sens_index = post.SensitivityIndex.from_plot_data(cc_plot_data)
+    if incidence is None:
+        incidence = post.cc_incidence_matrix(unique_features, cc_features)
+    min_sens, max_sens = _slider_value(min_sens), _slider_value(max_sens)
+    sens_mask = sens_index.masks(min_sens, max_sens)[0]
+    filter_idx = np.flatnonzero(sens_mask)
     sens_filtered_ccs = [cc_features[i] for i in filter_idx]
     unique_features_filtered = pd.unique(post.flatten(sens_filtered_ccs))
 
-    cc_heatmap = figure(height=len(unique_features)*20,
-                        width=len(unique_features)*20,
-                        aspect_ratio=1,
-                        x_range=unique_features,
-                        y_range=unique_features,
-                        match_aspect=True,
-                        tools=['hover', 'crosshair', 'save'],
-                        tooltips=cc_image_hover)
-
-    cc_matrix = post.CC_feature_heatmap(unique_features_filtered, sens_filtered_ccs)
+    columns = pd.Index(unique_features).get_indexer(unique_features_filtered)
+    cc_matrix = post.CC_feature_heatmap(unique_features_filtered, cc_features, row_mask=sens_mask, incidence=incidence[:, columns])
 
     # CC feature image
     cc_image_data = {
@@ -309,16 +543,39 @@ def cc_heatmap_plotter(cc_heatmap_colormap, unique_features, cc_features, cc_plo
 
 
 
-def cc_feature_usage_plot(ccs, cc_plot_data, cc_features, all_features_flat, cat_map, cc_len, min_sens, max_sens):
-    
+def cc_feature_usage_plot(ccs, cc_plot_data, cc_features, all_features_flat, cat_map, cc_len, min_sens, max_sens, sens_index=None, feature_counts=None, top_k=None, page=0):
+    '''
+    Stacked bar chart of the features used in the sensitivity-filtered CCs, by CC order.
+
+    feature_counts is an optional post.StackedCounts built once from cc_features. Its views are
+    memoized by slider state. min_sens and max_sens are the slider widgets or their values.
+    With top_k only one page (from 0) of top_k features ranked by usage is drawn, the other
+    features are summed into an 'Other' bar.
+    '''
+
+    from bokeh.plotting import figure
+
     # sensitivity filter
-    filter_idx = cc_plot_data[(cc_plot_data['min_sens'] >= min_sens.value) & (cc_plot_data['max_sens'] <= max_sens.value)].index.to_list()
+    if sens_index is None:
+        sens_index = post.SensitivityIndex.from_plot_data(cc_plot_data)
+    min_sens, max_sens = _slider_value(min_sens), _slider_value(max_sens)
+    filter_idx, filter_dnf_idx = sens_index.query(min_sens, max_sens)
     sens_filtered_ccs = [cc_features[i] for i in filter_idx]
     unique_features_filtered = pd.unique(post.flatten(sens_filtered_ccs))
 
-    stacked_features, stacked_feature_names = post.stacked_features(ccs, unique_features_filtered, cc_features, all_features_flat)
-
-    p2 = figure(width=max(len(unique_features_filtered)*20, 800), height=500,
+    title = ''
+    if top_k is not None:
+        if feature_counts is None:
+            feature_counts = post.StackedCounts(cc_features, max(ccs['order']), 'Feature')
+        stacked_features, stacked_feature_names, page, n_pages = feature_counts.top(unique_features_filtered, top_k, page, key=(min_sens, max_sens))
+        title = 'Page {} of {}'.format(page + 1, n_pages) if n_pages > 1 else ''
+    elif feature_counts is None:
+        stacked_features, stacked_feature_names = post.stacked_features(ccs, unique_features_filtered, cc_features, all_features_flat)
+    else:
+        stacked_features, stacked_feature_names = feature_counts.view(unique_features_filtered, key=(min_sens, max_sens))
+
+    p2 = figure(width=max(len(stacked_features['Feature'])*20, 800), height=500,
+            title=title,
             x_range=stacked_features['Feature'],
             x_axis_label='Feature',
             y_axis_label='Count',
@@ -344,24 +601,41 @@ def cc_feature_usage_plot(ccs, cc_plot_data, cc_features, all_features_flat, cat
 
 
 
-def dnf_usage_plot(dnfs, dnf_plot_data, cc_plot_data, all_ccs, all_ccs_flat, cat_map, dnf_len, min_sens, max_sens):
+def dnf_usage_plot(dnfs, dnf_plot_data, cc_plot_data, all_ccs, all_ccs_flat, cat_map, dnf_len, min_sens, max_sens, sens_index=None, cc_counts=None, top_k=None, page=0):
+    '''
+    Stacked bar chart of the CCs used in the sensitivity-filtered DNFs, by DNF order.
+
+    cc_counts is an optional post.StackedCounts built once from all_ccs. Its views are
+    memoized by slider state. min_sens and max_sens are the slider widgets or their values.
+    With top_k only one page (from 0) of top_k CCs ranked by usage is drawn, the other CCs
+    are summed into an 'Other' bar.
+    '''
+
+    from bokeh.plotting import figure
+
     # sensitivity filter
-    # the ccs
-    filter_idx = cc_plot_data[(cc_plot_data['min_sens'] >= min_sens.value) & (cc_plot_data['max_sens'] <= max_sens.value)].index.to_list()
-
-    # used to filter the dnfs
-    filter_dnf_idx = []
-    for i in range(len(dnf_plot_data['CCs'])):
-        if set(list(map(int, dnf_plot_data['CCs'][i]))).issubset(filter_idx) == True:
-            filter_dnf_idx.append(i)
-        else:
-            pass
+    # the ccs, and the dnfs whose ccs all pass
+    if sens_index is None:
+        sens_index = post.SensitivityIndex.from_plot_data(cc_plot_data, dnf_plot_data)
+    min_sens, max_sens = _slider_value(min_sens), _slider_value(max_sens)
+    filter_idx, filter_dnf_idx = sens_index.query(min_sens, max_sens)
+
     sens_filtered_dnfs = [all_ccs[i] for i in filter_dnf_idx]
     unique_ccs_filtered = pd.unique(post.flatten(sens_filtered_dnfs))
 
-    stacked_ccs, stacked_cc_names = post.stacked_ccs(dnfs, unique_ccs_filtered, all_ccs, all_ccs_flat)
-
-    p3 = figure(width=max(len(unique_ccs_filtered)*13, 800), height=500,
+    title = ''
+    if top_k is not None:
+        if cc_counts is None:
+            cc_counts = post.StackedCounts(all_ccs, max(dnfs['order']), 'CC')
+        stacked_ccs, stacked_cc_names, page, n_pages = cc_counts.top(unique_ccs_filtered, top_k, page, key=(min_sens, max_sens))
+        title = 'Page {} of {}'.format(page + 1, n_pages) if n_pages > 1 else ''
+    elif cc_counts is None:
+        stacked_ccs, stacked_cc_names = post.stacked_ccs(dnfs, unique_ccs_filtered, all_ccs, all_ccs_flat)
+    else:
+        stacked_ccs, stacked_cc_names = cc_counts.view(unique_ccs_filtered, key=(min_sens, max_sens))
+
+    p3 = figure(width=max(len(stacked_ccs['CC'])*13, 800), height=500,
+                title=title,
                 x_range=stacked_ccs['CC'],
                 x_axis_label='CC',
                 y_axis_label='Count',
@@ -381,4 +655,169 @@ def dnf_usage_plot(dnfs, dnf_plot_data, cc_plot_data, all_ccs, all_ccs_flat, cat
     p3.legend.location = 'top_right'
     p3.legend.orientation = 'vertical'
 
-    return p3
\ No newline at end of file
+    return p3
+
+
+
+
+
+class TabUpdater:
+    '''
+    Rebuilds the tabbed plots off the Panel event loop.
+
+    Requests are debounced: once no newer request has arrived for `delay` seconds, every tab
+    builder runs on a thread pool and each tab is swapped in as soon as its figure is ready.
+    A newer request makes the running one stale: builds that have not started are cancelled
+    and stale figures are dropped instead of shown.
+
+            tabs            pn.Tabs holding one pn.pane.Bokeh per builder
+            builders        callables, builder(*args) returns the figure of one tab
+            delay           debounce delay in seconds
+            max_workers     threads of the pool (default: one per builder)
+
+    Figures are built in worker threads and assigned on the Bokeh document thread when the
+    dashboard runs on a server (in a notebook they are assigned directly).
+    '''
+
+    def __init__(self, tabs, builders, delay=0.3, max_workers=None):
+        self.tabs = tabs
+        self.builders = list(builders)
+        self.delay = delay
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(self.builders), thread_name_prefix='teva-tabs')
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._timer = None
+        self._futures = []
+        self._pending = 0
+        self._ready = threading.Event()
+        self._ready.set()
+        self._doc = None
+
+
+    def request(self, *args, delay=None):
+        '''
+        Schedules a rebuild of all tabs with builder(*args), replacing any earlier request.
+        '''
+
+        import panel as pn
+
+        delay = self.delay if delay is None else delay
+        with self._lock:
+            generation = self._invalidate()
+            self._doc = pn.state.curdoc
+            self._pending = len(self.builders)
+            self._ready.clear()
+            if delay > 0:
+                self._timer = threading.Timer(delay, self._start, (generation, args))
+                self._timer.daemon = True
+                self._timer.start()
+            else:
+                self._start(generation, args)
+
+        return generation
+
+
+    def refresh(self, *args):
+        '''
+        Rebuilds all tabs synchronously (e.g. for the first render), cancelling pending requests.
+        '''
+
+        with self._lock:
+            self._invalidate()
+        for pane, builder in zip(self.tabs, self.builders):
+            pane.object = builder(*args)
+            pane.loading = False
+        self._ready.set()
+
+
+    def wait(self, timeout=None):
+        '''
+        Blocks until the latest request has been shown. Returns False on timeout.
+        '''
+
+        return self._ready.wait(timeout)
+
+
+    def shutdown(self):
+        with self._lock:
+            self._invalidate()
+            self._drop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def _invalidate(self):
+        # makes everything requested so far stale
+        self.generation += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+
+        return self.generation
+
+
+    def _start(self, generation, args):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._timer = None
+            for index, builder in enumerate(self.builders):
+                try:
+                    future = self.executor.submit(builder, *args)
+                except RuntimeError:
+                    # the pool was shut down (or the interpreter is exiting) while the request was pending
+                    self._invalidate()
+                    self._drop(index)
+                    return
+                self._dispatch(partial(self._set_loading, generation, index))
+                self._futures.append(future)
+                future.add_done_callback(partial(self._done, generation, index))
+
+
+    def _drop(self, n_marked=None):
+        # no request is live anymore: the tabs marked loading are reset and waiters released
+        self._pending = 0
+        self._ready.set()
+        self._dispatch(partial(self._clear_loading, len(self.tabs) if n_marked is None else n_marked))
+
+
+    def _clear_loading(self, n_marked):
+        for pane in list(self.tabs)[:n_marked]:
+            pane.loading = False
+
+
+    def _done(self, generation, index, future):
+        if future.cancelled() or generation != self.generation:
+            return
+        error = future.exception()
+        if error is not None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        self._dispatch(partial(self._show, generation, index, None if error is not None else future.result()))
+
+
+    def _dispatch(self, callback):
+        doc = self._doc
+        if doc is not None and doc.session_context is not None:
+            doc.add_next_tick_callback(callback)
+        else:
+            callback()
+
+
+    def _set_loading(self, generation, index):
+        if generation == self.generation:
+            self.tabs[index].loading = True
+
+
+    def _show(self, generation, index, figure):
+        with self._lock:
+            if generation != self.generation:
+                return
+            pane = self.tabs[index]
+            if figure is not None:
+                pane.object = figure
+            pane.loading = False
+            self._pending -= 1
+            if self._pending == 0:
+                self._ready.set()
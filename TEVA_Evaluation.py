@@ -0,0 +1,557 @@
+# Evaluation of TEVA CCs and DNFs on observation tables.
+#
+# Compiles the feature ranges of every CC into interval tests (or value set tests for
+# categorical features), evaluates all CCs over an observation table chunk by chunk, ORs the
+# CC hits into DNF predictions and counts fresh confusion matrices. CC and DNF hits are
+# bit-packed (64 observations per uint64 word), and only one chunk of observations is
+# expanded at a time, so memory is bounded by the chunk size and not by the table size.
+#
+# Example:
+#           archive = post.TevaArchive.from_frames(ccs, dnfs)
+#           rules = evaluation.RuleSet.from_archive(archive)
+#           cc_scores, dnf_scores = evaluation.evaluate(rules, observations, 'DOC_Class', 'High')
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+# Default number of (observation, cc -> feature entry) tests expanded at once
+MAX_CELLS = 1 << 24
+
+
+
+# Compiled rules
+class RuleSet:
+    '''
+    CCs and DNFs compiled for evaluation.
+
+            features        names of the observation columns used by the CCs
+            entry_feature   column (index into features) tested by every cc -> feature entry
+            lo, hi          inclusive interval bounds of every entry
+            value_sets      dict entry position -> accepted values, for entries tested as value sets
+            cc_indptr       CSR row pointer of cc -> entry
+            cc_numbers      cc numbers ('Unnamed: 0' of the cc sheet)
+            dnf_indptr      CSR row pointer of dnf -> cc
+            dnf_cc          cc row of every dnf -> cc entry (-1 if the cc is not in the cc sheet)
+            dnf_numbers     dnf numbers ('Unnamed: 0' of the dnf sheet)
+            label           output class the rules predict (e.g. 'High')
+    '''
+
+    def __init__(self, features, entry_feature, lo, hi, value_sets, cc_indptr, cc_numbers,
+                 dnf_indptr, dnf_cc, dnf_numbers, label=None):
+        self.features = np.asarray(features, dtype=object)
+        self.entry_feature = np.asarray(entry_feature, dtype=np.int64)
+        self.lo = np.asarray(lo, dtype=float)
+        self.hi = np.asarray(hi, dtype=float)
+        self.value_sets = value_sets
+        self.cc_indptr = np.asarray(cc_indptr, dtype=np.int64)
+        self.cc_numbers = np.asarray(cc_numbers)
+        self.dnf_indptr = np.asarray(dnf_indptr, dtype=np.int64)
+        self.dnf_cc = np.asarray(dnf_cc, dtype=np.int64)
+        self.dnf_numbers = np.asarray(dnf_numbers)
+        self.label = label
+
+        # entries grouped by feature, every feature column is then compared once per chunk
+        order = np.argsort(self.entry_feature, kind='stable')
+        interval = np.ones(len(order), dtype=bool)
+        interval[list(self.value_sets)] = False
+        order = order[interval[order]]
+        bounds = np.searchsorted(self.entry_feature[order], np.arange(len(self.features) + 1))
+        self._feature_entries = [order[bounds[f]:bounds[f + 1]] for f in range(len(self.features))]
+
+
+    @classmethod
+    def from_archive(cls, archive, categorical=None):
+        '''
+        Compiles the CCs and DNFs of a post.TevaArchive.
+
+                archive         post.TevaArchive
+                categorical     optional names of categorical features, their ranges are tested
+                                as value sets (like the dashboard bar plots) instead of intervals
+
+        Ranges that are not a [lo, hi] pair of numbers are always tested as value sets.
+        '''
+
+        used, entry_feature = np.unique(archive.cc_feature, return_inverse=True)
+        features = archive.feature_names[used]
+
+        value_sets = {i: np.atleast_1d(np.array(values, dtype=object)) for i, values in archive.categorical.items()}
+        if categorical is not None:
+            for i in np.flatnonzero(np.isin(features[entry_feature], list(categorical))):
+                value_sets.setdefault(int(i), np.array([archive.range_lo[i], archive.range_hi[i]], dtype=object))
+
+        return cls(features, entry_feature, archive.range_lo, archive.range_hi, value_sets, archive.cc_indptr,
+                   archive.cc_numbers, archive.dnf_indptr, archive.dnf_cc, archive.dnf_numbers, archive.label)
+
+
+    @property
+    def n_ccs(self):
+        return len(self.cc_indptr) - 1
+
+
+    @property
+    def n_dnfs(self):
+        return len(self.dnf_indptr) - 1
+
+
+    def default_chunk_size(self, max_cells=MAX_CELLS):
+        '''
+        Observations per chunk so that at most max_cells entry tests are expanded at once
+        (a multiple of 64, so chunks pack into whole words).
+        '''
+
+        return max(64, max_cells // max(len(self.entry_feature), 1) // 64 * 64)
+
+
+
+# Bit-packed masks
+def pack_bits(mask):
+    '''
+    Packs a boolean (rows x observations) matrix into uint64 words, 64 observations per word.
+    Padding bits are zero.
+    '''
+
+    mask = np.asarray(mask, dtype=bool)
+    n_obs = mask.shape[-1]
+    packed = np.zeros(mask.shape[:-1] + (-(-n_obs // 64) * 8,), dtype=np.uint8)
+    packed[..., :-(-n_obs // 8)] = np.packbits(mask, axis=-1, bitorder='little')
+
+    return packed.view(np.uint64)
+
+
+
+def unpack_bits(words, n_obs):
+    '''
+    Inverse of pack_bits.
+    '''
+
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1, count=n_obs, bitorder='little').astype(bool)
+
+
+
+def popcount(words):
+    '''
+    Number of set bits in every row of a packed mask.
+    '''
+
+    return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+
+
+def dnf_bits(rules, cc_words):
+    '''
+    ORs packed CC masks (ccs x words) into packed DNF masks (dnfs x words).
+    CCs missing from the cc sheet never match.
+    '''
+
+    # extra all-zero row, dnf_cc == -1 picks it
+    cc_words = np.concatenate([cc_words, np.zeros((1, cc_words.shape[1]), dtype=np.uint64)])
+    words = np.zeros((rules.n_dnfs, cc_words.shape[1]), dtype=np.uint64)
+    nonempty = np.diff(rules.dnf_indptr) > 0
+    if nonempty.any():
+        words[nonempty] = np.bitwise_or.reduceat(cc_words[rules.dnf_cc], rules.dnf_indptr[:-1][nonempty], axis=0)
+
+    return words
+
+
+
+# Evaluation
+def cc_hits(rules, chunk):
+    '''
+    Evaluates all CCs on one chunk of observations.
+
+            chunk       DataFrame holding (at least) the rules.features columns
+
+        Returns:
+            boolean (ccs x observations) matrix, True where the cc covers the observation
+    '''
+
+    missing = [feature for feature in rules.features if feature not in chunk.columns]
+    if missing:
+        raise ValueError('observations are missing the CC features: {}'.format(', '.join(map(str, missing))))
+
+    n_obs = len(chunk)
+    tests = np.empty((len(rules.entry_feature), n_obs), dtype=bool)
+    for f, feature in enumerate(rules.features):
+        entries = rules._feature_entries[f]
+        if len(entries) == 0:
+            continue
+        # nan values are outside every interval
+        x = pd.to_numeric(chunk[feature], errors='coerce').to_numpy(dtype=float)
+        tests[entries] = (x >= rules.lo[entries, None]) & (x <= rules.hi[entries, None])
+    for i, values in rules.value_sets.items():
+        tests[i] = chunk[rules.features[rules.entry_feature[i]]].isin(values).to_numpy()
+
+    # a cc covers an observation if all of its entries do
+    hits = np.ones((rules.n_ccs, n_obs), dtype=bool)
+    nonempty = np.diff(rules.cc_indptr) > 0
+    if nonempty.any():
+        hits[nonempty] = np.logical_and.reduceat(tests, rules.cc_indptr[:-1][nonempty], axis=0)
+
+    return hits
+
+
+
+def row_chunks(observations, chunk_size):
+    '''
+    Re-chunks a DataFrame, or an iterable of DataFrames (e.g. pd.read_csv(..., chunksize=...)),
+    into chunks of exactly chunk_size rows (the last one may be shorter).
+    '''
+
+    if isinstance(observations, pd.DataFrame):
+        for start in range(0, len(observations), chunk_size):
+            yield observations.iloc[start:start + chunk_size]
+        return
+
+    pending = []
+    n_pending = 0
+    for frame in observations:
+        pending.append(frame)
+        n_pending += len(frame)
+        if n_pending < chunk_size:
+            continue
+        frame = pd.concat(pending) if len(pending) > 1 else pending[0]
+        n_full = len(frame) // chunk_size * chunk_size
+        for start in range(0, n_full, chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+        pending = [frame.iloc[n_full:]]
+        n_pending = len(pending[0])
+    if n_pending:
+        yield pd.concat(pending) if len(pending) > 1 else pending[0]
+
+
+
+def _positives(chunk, target, positive, offset):
+    # boolean array of the positive observations of a chunk
+    if isinstance(target, str):
+        labels = chunk[target].to_numpy()
+    else:
+        labels = np.asarray(target)[offset:offset + len(chunk)]
+
+    if positive is None:
+        return labels.astype(bool)
+
+    return labels == positive
+
+
+
+def cc_masks(rules, observations, chunk_size=None):
+    '''
+    Packed masks of the observations covered by each CC.
+
+            observations    DataFrame or iterable of DataFrames
+
+        Returns:
+            cc_words        uint64 array (ccs x words), bit j of a row is set if the cc covers observation j
+            n_obs           number of observations
+    '''
+
+    if chunk_size is None:
+        chunk_size = rules.default_chunk_size()
+    chunk_size = max(64, chunk_size // 64 * 64)
+
+    words = []
+    n_obs = 0
+    for chunk in row_chunks(observations, chunk_size):
+        words.append(pack_bits(cc_hits(rules, chunk)))
+        n_obs += len(chunk)
+    if not words:
+        return np.zeros((rules.n_ccs, 0), dtype=np.uint64), 0
+
+    return np.concatenate(words, axis=1), n_obs
+
+
+
+def scores(tp, predicted, n_pos, n_obs, index):
+    '''
+    Confusion matrix counts, coverage and PPV from true positive and predicted positive counts.
+    '''
+
+    fp = predicted - tp
+    fn = n_pos - tp
+    tn = n_obs - n_pos - fp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = tp / (tp + fn)
+        ppv = tp / predicted
+
+    return pd.DataFrame({'tp': tp, 'fn': fn, 'fp': fp, 'tn': tn, 'cov': cov, 'ppv': ppv}, index=index)
+
+
+
+def evaluate(rules, observations, target, positive=None, chunk_size=None):
+    '''
+    Scores every CC and DNF on an observation table.
+
+            rules           RuleSet
+            observations    DataFrame, or iterable of DataFrame chunks (e.g. pd.read_csv(..., chunksize=...))
+            target          name of the class column, or an array of class labels aligned with the rows
+            positive        class label counted as positive (default: rules.label). Pass False to use
+                            target as a boolean array directly.
+            chunk_size      observations evaluated at once (default: RuleSet.default_chunk_size)
+
+        Returns:
+            cc_scores, dnf_scores   DataFrames with tp, fn, fp, tn, cov and ppv, indexed by cc / dnf number.
+                                    post.confusion_matrix(cc_scores, i) gives the matrix of the i-th cc.
+    '''
+
+    if positive is None:
+        positive = rules.label
+    elif positive is False:
+        positive = None
+    if chunk_size is None:
+        chunk_size = rules.default_chunk_size()
+    chunk_size = max(64, chunk_size // 64 * 64)
+
+    cc_tp = np.zeros(rules.n_ccs, dtype=np.int64)
+    cc_predicted = np.zeros(rules.n_ccs, dtype=np.int64)
+    dnf_tp = np.zeros(rules.n_dnfs, dtype=np.int64)
+    dnf_predicted = np.zeros(rules.n_dnfs, dtype=np.int64)
+    n_pos = 0
+    n_obs = 0
+    for chunk in row_chunks(observations, chunk_size):
+        y = pack_bits(_positives(chunk, target, positive, n_obs))
+        cc_words = pack_bits(cc_hits(rules, chunk))
+        dnf_words = dnf_bits(rules, cc_words)
+
+        cc_tp += popcount(cc_words & y)
+        cc_predicted += popcount(cc_words)
+        dnf_tp += popcount(dnf_words & y)
+        dnf_predicted += popcount(dnf_words)
+        n_pos += int(popcount(y))
+        n_obs += len(chunk)
+
+    cc_scores = scores(cc_tp, cc_predicted, n_pos, n_obs, pd.Index(rules.cc_numbers, name='CC'))
+    dnf_scores = scores(dnf_tp, dnf_predicted, n_pos, n_obs, pd.Index(rules.dnf_numbers, name='DNF'))
+
+    return cc_scores, dnf_scores
+
+
+
+# Coverage analysis
+class Coverage:
+    '''
+    Packed coverage bitsets of the CCs and DNFs of a RuleSet on one observation table, and the
+    set metrics derived from them (CC overlap and redundancy, marginal DNF contributions and a
+    deduplicated archive). Everything is computed with bitwise ops and popcounts on the
+    packed words, 64 observations per operation.
+
+            rules           RuleSet
+            cc_words        uint64 (ccs x words), bit j of row i is set if cc i covers observation j
+            dnf_words       uint64 (dnfs x words), OR of the cc rows of every dnf
+            positives       packed positive observations (words,), None without a target
+            n_obs           number of observations
+
+    Unlike evaluate, the bitsets of the whole table are kept: ccs x observations / 8 bytes.
+    '''
+
+    def __init__(self, rules, cc_words, n_obs, positives=None):
+        self.rules = rules
+        self.cc_words = cc_words
+        self.n_obs = n_obs
+        self.positives = positives
+        self.dnf_words = dnf_bits(rules, cc_words)
+
+
+    @classmethod
+    def from_observations(cls, rules, observations, target=None, positive=None, chunk_size=None):
+        '''
+        Evaluates the CCs on an observation table (arguments as for evaluate). Without a target
+        only the coverage metrics are available.
+        '''
+
+        if positive is None:
+            positive = rules.label
+        elif positive is False:
+            positive = None
+        if chunk_size is None:
+            chunk_size = rules.default_chunk_size()
+        chunk_size = max(64, chunk_size // 64 * 64)
+
+        cc_words = []
+        positives = []
+        n_obs = 0
+        for chunk in row_chunks(observations, chunk_size):
+            cc_words.append(pack_bits(cc_hits(rules, chunk)))
+            if target is not None:
+                positives.append(pack_bits(_positives(chunk, target, positive, n_obs)))
+            n_obs += len(chunk)
+
+        cc_words = np.concatenate(cc_words, axis=1) if cc_words else np.zeros((rules.n_ccs, 0), dtype=np.uint64)
+        positives = np.concatenate(positives) if target is not None and positives else None
+
+        return cls(rules, cc_words, n_obs, positives)
+
+
+    def sizes(self):
+        '''
+        Number of observations covered by every cc.
+        '''
+
+        return popcount(self.cc_words)
+
+
+    def scores(self):
+        '''
+        cc_scores, dnf_scores as returned by evaluate (needs a target).
+        '''
+
+        self._need_positives()
+        n_pos = int(popcount(self.positives))
+        cc_index = pd.Index(self.rules.cc_numbers, name='CC')
+        dnf_index = pd.Index(self.rules.dnf_numbers, name='DNF')
+
+        return (scores(popcount(self.cc_words & self.positives), popcount(self.cc_words), n_pos, self.n_obs, cc_index),
+                scores(popcount(self.dnf_words & self.positives), popcount(self.dnf_words), n_pos, self.n_obs, dnf_index))
+
+
+    def overlap(self, max_cells=MAX_CELLS):
+        '''
+        Pairwise intersections |Ci & Cj| of the cc coverage sets (ccs x ccs int matrix),
+        computed in blocks of rows of about max_cells words.
+        '''
+
+        return _pairwise_counts(self.cc_words, self.cc_words, max_cells)
+
+
+    def jaccard(self, intersections=None):
+        '''
+        Pairwise Jaccard index |Ci & Cj| / |Ci | Cj| of the cc coverage sets (nan for two empty ccs).
+        '''
+
+        if intersections is None:
+            intersections = self.overlap()
+        sizes = self.sizes()
+        union = sizes[:, None] + sizes[None, :] - intersections
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(union > 0, intersections / union, np.nan)
+
+
+    def redundant_pairs(self, threshold=1.0, intersections=None):
+        '''
+        Pairs of different ccs (a, b) where at least `threshold` of the observations covered by
+        cc a are also covered by cc b (threshold=1: a covers a subset of b). Empty ccs are left out.
+
+            Returns:
+                DataFrame with CC, covered_by (cc numbers), overlap, containment (share of a in b),
+                jaccard and identical (same coverage)
+        '''
+
+        if intersections is None:
+            intersections = self.overlap()
+        sizes = self.sizes()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            containment = intersections / sizes[:, None]
+        a, b = np.nonzero((containment >= threshold) & (sizes[:, None] > 0))
+        keep = a != b
+        a, b = a[keep], b[keep]
+        common = intersections[a, b]
+        union = sizes[a] + sizes[b] - common
+
+        return pd.DataFrame({'CC': self.rules.cc_numbers[a], 'covered_by': self.rules.cc_numbers[b],
+                             'overlap': common, 'containment': containment[a, b], 'jaccard': common / union,
+                             'identical': (common == sizes[a]) & (common == sizes[b])})
+
+
+    def marginal_contributions(self):
+        '''
+        Contribution of every cc to each dnf it is part of: the observations the dnf covers only
+        through this cc (with the true / false positives among them when there is a target). A cc
+        without unique observations can be dropped from the dnf without changing its predictions.
+
+            Returns:
+                DataFrame with one row per dnf -> cc entry: DNF, CC, covered, unique (and unique_tp, unique_fp)
+        '''
+
+        rules = self.rules
+        orders = np.diff(rules.dnf_indptr)
+        entry_dnf = np.repeat(np.arange(rules.n_dnfs), orders)
+        position = np.arange(len(entry_dnf)) - np.repeat(rules.dnf_indptr[:-1], orders)
+        # ccs missing from the cc sheet cover nothing
+        cc_words = np.concatenate([self.cc_words, np.zeros((1, self.cc_words.shape[1]), dtype=np.uint64)])
+        entry_words = cc_words[rules.dnf_cc]
+
+        # observations covered by exactly one cc of each dnf, one pass per position within the dnfs
+        once = np.zeros((rules.n_dnfs, cc_words.shape[1]), dtype=np.uint64)
+        more = np.zeros_like(once)
+        for k in range(orders.max() if len(orders) else 0):
+            at = position == k
+            words, dnfs = entry_words[at], entry_dnf[at]
+            more[dnfs] |= once[dnfs] & words
+            once[dnfs] |= words
+        unique = entry_words & (once & ~more)[entry_dnf]
+
+        contributions = pd.DataFrame({'DNF': rules.dnf_numbers[entry_dnf],
+                                      'CC': np.append(rules.cc_numbers, -1)[rules.dnf_cc],
+                                      'covered': popcount(entry_words),
+                                      'unique': popcount(unique)})
+        if self.positives is not None:
+            contributions['unique_tp'] = popcount(unique & self.positives)
+            contributions['unique_fp'] = contributions['unique'] - contributions['unique_tp']
+
+        return contributions
+
+
+    def minimal_archive(self, dominated=True):
+        '''
+        Deduplicated archive. CCs with identical coverage are merged into one representative
+        (the lowest order cc, then the first one). With dominated=True (needs a target) a
+        remaining cc is also dropped when another remaining cc covers all of its true positives
+        and only some of its false positives.
+
+            Returns:
+                DataFrame indexed by cc number: keep, representative (cc number of the cc that
+                replaces it) and reason ('duplicate', 'dominated' or '')
+        '''
+
+        rules = self.rules
+        n = rules.n_ccs
+        orders = np.diff(rules.cc_indptr)
+        if n == 0:
+            return pd.DataFrame({'keep': [], 'representative': [], 'reason': []}, index=pd.Index(rules.cc_numbers, name='CC'))
+
+        # identical bitsets: first cc of each group in (order, row) order
+        groups = np.unique(self.cc_words, axis=0, return_inverse=True)[1].ravel()
+        ranked = np.lexsort((np.arange(n), orders, groups))
+        starts = np.flatnonzero(np.r_[True, groups[ranked][1:] != groups[ranked][:-1]])
+        first = np.empty(groups.max() + 1, dtype=np.int64)
+        first[groups[ranked][starts]] = ranked[starts]
+        representative = first[groups]
+        reason = np.where(representative != np.arange(n), 'duplicate', '').astype(object)
+
+        if dominated:
+            self._need_positives()
+            kept = np.flatnonzero(representative == np.arange(n))
+            tp = self.cc_words[kept] & self.positives
+            fp = self.cc_words[kept] & ~self.positives
+            # row i, column j: tp_i is a subset of tp_j and fp_j a subset of fp_i
+            missed = _pairwise_counts(tp, ~tp) == 0
+            extra = _pairwise_counts(fp, ~fp).T == 0
+            dominates = missed & extra
+            np.fill_diagonal(dominates, False)
+            is_dominated = dominates.any(axis=1)
+            # dominance is transitive, so every dominated cc has an undominated dominator
+            choice = np.where(dominates & ~is_dominated[None, :], 1, 0).argmax(axis=1)
+            for i in np.flatnonzero(is_dominated):
+                representative[kept[i]] = kept[choice[i]]
+                reason[kept[i]] = 'dominated'
+            # duplicates follow their representative
+            representative = representative[representative]
+
+        return pd.DataFrame({'keep': reason == '', 'representative': rules.cc_numbers[representative], 'reason': reason},
+                            index=pd.Index(rules.cc_numbers, name='CC'))
+
+
+    def _need_positives(self):
+        if self.positives is None:
+            raise ValueError('this metric needs the target: build the Coverage with a target column')
+
+
+
+def _pairwise_counts(a, b, max_cells=MAX_CELLS):
+    # popcount(a[i] & b[j]) for all row pairs, in blocks of rows of a
+    counts = np.empty((a.shape[0], b.shape[0]), dtype=np.int64)
+    block = max(1, max_cells // max(b.shape[0] * b.shape[1], 1))
+    for start in range(0, a.shape[0], block):
+        counts[start:start + block] = np.bitwise_count(a[start:start + block, None, :] & b[None, :, :]).sum(axis=2, dtype=np.int64)
+
+    return counts
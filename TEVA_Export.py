@@ -0,0 +1,437 @@
+# Compact HTML export of the TEVA dashboard.
+#
+# dashboard.save() inlines every data source the way it is held in Python: float64 arrays,
+# columns no plot uses and the fitness contours at full grid resolution. export_dashboard()
+# saves a copy of the dashboard document instead in which
+#   - float columns are stored as float32 and integer columns as int32 typed arrays,
+#   - columns that no glyph, filter or tooltip refers to are dropped, and sources with
+#     identical content are shared,
+#   - the fitness contours are recomputed on a coarser grid,
+#   - optionally, large sources are written to binary sidecar files next to the page and
+#     loaded by the page once it is open,
+# and reports the size of the export by component. The live dashboard is not modified.
+#
+# Example:
+#           report = export.export_dashboard(app, 'TEVA_dashboard.html', contour_grid=(x_fit, y_fit, z_fit))
+
+# Import libraries
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource, GlyphRenderer, ContourRenderer, HoverTool, GroupFilter, LegendItem, CustomJS
+from bokeh.core.property.vectorization import Field
+from bokeh.core.serialization import Serializer
+from pyviz_comms import Comm
+from panel.io.model import add_to_doc
+from panel.io.save import save
+import TEVA_Post_Processing as post
+import TEVA_Dynamic_Plotting as teva_plot
+
+_TYPED_ARRAYS = {'float32', 'float64', 'int8', 'int16', 'int32', 'uint8', 'uint16', 'uint32'}
+
+# Rebuilds the sidecar sources in the browser when the page is ready
+_LOAD_SIDECARS = '''
+const typed = {float32: Float32Array, float64: Float64Array, int8: Int8Array, int16: Int16Array,
+               int32: Int32Array, uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array}
+
+function rebuild(node, values, state) {
+    // nested lists of arrays, leaves are the array lengths
+    if (typeof node === 'number') {
+        const array = values.subarray(state.offset, state.offset + node)
+        state.offset += node
+        return array
+    }
+    return node.map((child) => rebuild(child, values, state))
+}
+
+function load(spec) {
+    return fetch(folder + '/' + spec.file).then((response) => {
+        if (!response.ok)
+            throw new Error(spec.file + ': ' + response.status)
+        return spec.type == 'json' ? response.json() : response.arrayBuffer()
+    }).then((content) => {
+        if (spec.type == 'json')
+            return content
+        const values = new typed[spec.dtype](content)
+        return spec.type == 'array' ? values : rebuild(spec.structure, values, {offset: 0})
+    })
+}
+
+sources.forEach((source, i) => {
+    const names = Object.keys(specs[i])
+    Promise.all(names.map((name) => load(specs[i][name]))).then((columns) => {
+        const data = {}
+        names.forEach((name, j) => { data[name] = columns[j] })
+        source.data = data
+    }).catch((error) => console.error('TEVA export: could not load ' + folder, error))
+})
+'''
+
+
+
+# Document copy
+def document_copy(dashboard):
+    '''
+    Independent copy of the Bokeh document of a Panel dashboard (changes to the copy do
+    not affect the live dashboard).
+    '''
+
+    doc = Document()
+    root = dashboard.get_root(doc, Comm())
+    add_to_doc(root, doc, True)
+
+    return Document.from_json(doc.to_json(deferred=False))
+
+
+
+def document_models(doc):
+    '''
+    Models reachable from the roots of a document (doc.models can still hold replaced ones).
+    '''
+
+    models = {}
+    for root in doc.roots:
+        for model in root.references():
+            models[model.id] = model
+
+    return list(models.values())
+
+
+
+def serialized_size(obj):
+    '''
+    Size in bytes of an object (e.g. source.data) as it is embedded in the page.
+    '''
+
+    return len(json.dumps(Serializer(deferred=False).encode(obj), separators=(',', ':')))
+
+
+
+def document_size(doc):
+    '''
+    Size in bytes of the serialized document embedded in the page.
+    '''
+
+    return len(json.dumps(doc.to_json(deferred=False), separators=(',', ':')))
+
+
+
+# Compaction
+def used_columns(doc):
+    '''
+    Columns of each ColumnDataSource that are referred to by glyphs, view filters, legend
+    labels or hover tooltips.
+
+        Returns:
+            dict source id -> set of column names, None for sources that other models (tables,
+            JS callbacks, ...) use directly, all their columns are kept
+    '''
+
+    used = {}
+    renderer_sources = {}
+    for model in document_models(doc):
+        if isinstance(model, GlyphRenderer):
+            source = model.data_source
+            renderer_sources[model.id] = source.id
+            fields = used.setdefault(source.id, set())
+            for glyph in (model.glyph, model.selection_glyph, model.nonselection_glyph, model.hover_glyph, model.muted_glyph):
+                if glyph is not None and not isinstance(glyph, str):
+                    fields.update(_glyph_fields(glyph, source))
+            fields.update(m.column_name for m in model.view.references() if isinstance(m, GroupFilter))
+
+    keep_all = set()
+    for model in document_models(doc):
+        if isinstance(model, HoverTool):
+            tooltips = model.tooltips if isinstance(model.tooltips, str) else ' '.join(str(value) for label, value in model.tooltips or [])
+            names = {a or b for a, b in re.findall(r'@\{([^}]+)\}|@(\w+)', tooltips)}
+            renderers = model.renderers if isinstance(model.renderers, list) else []
+            ids = [renderer_sources[r.id] for r in renderers if r.id in renderer_sources] or list(used)
+            for source_id in ids:
+                used[source_id].update(names)
+        elif isinstance(model, LegendItem):
+            label = model.label
+            if isinstance(label, Field):
+                for renderer in model.renderers:
+                    if renderer.id in renderer_sources:
+                        used[renderer_sources[renderer.id]].add(label.field)
+        elif isinstance(model, ContourRenderer):
+            # the contour sources are filled by ContourRenderer.set_data, kept as they are
+            keep_all.update([model.fill_renderer.data_source.id, model.line_renderer.data_source.id])
+        elif not isinstance(model, (GlyphRenderer, ColumnDataSource)):
+            keep_all.update(source.id for source in _direct_sources(model))
+
+    return {source_id: (None if source_id in keep_all else fields) for source_id, fields in used.items()}
+
+
+
+def _glyph_fields(glyph, source):
+    # column names used by the data specs of a glyph
+    fields = set()
+    for name in glyph.dataspecs():
+        value = getattr(glyph, name)
+        if isinstance(value, Field):
+            fields.add(value.field)
+        elif isinstance(value, dict) and 'field' in value:
+            fields.add(value['field'])
+        elif isinstance(value, str) and value in source.data:
+            fields.add(value)
+
+    return fields
+
+
+
+def _direct_sources(model):
+    # ColumnDataSources held directly by the properties of a model
+    found = []
+    for value in model.properties_with_values(include_defaults=False).values():
+        items = value.values() if isinstance(value, dict) else value if isinstance(value, (list, tuple)) else [value]
+        found.extend(item for item in items if isinstance(item, ColumnDataSource))
+
+    return found
+
+
+
+def compact_values(values):
+    '''
+    float32 / int32 version of a column. Nested lists of arrays (e.g. contour polygons) are
+    compacted element-wise; other columns (strings, lists of names) are returned unchanged.
+    '''
+
+    if isinstance(values, (list, tuple)):
+        if len(values) and all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values):
+            values = np.asarray(values)
+        elif any(isinstance(v, (list, tuple, np.ndarray)) for v in values):
+            return [compact_values(v) for v in values]
+        else:
+            return values
+
+    if not isinstance(values, np.ndarray):
+        return values
+    if values.dtype.kind == 'f':
+        return values.astype(np.float32)
+    if values.dtype.kind in 'iu' and values.size and values.min() >= -2**31 and values.max() < 2**31:
+        return values.astype(np.int32)
+
+    return values
+
+
+
+def compact_sources(doc):
+    '''
+    Drops the unused columns of every ColumnDataSource, stores the rest as float32/int32
+    and makes renderers with identical sources share one.
+
+        Returns:
+            number of columns dropped, number of sources merged
+    '''
+
+    dropped = 0
+    columns = used_columns(doc)
+    sources = [model for model in document_models(doc) if isinstance(model, ColumnDataSource)]
+    for source in sources:
+        keep = columns.get(source.id)
+        data = {}
+        for name, values in source.data.items():
+            if keep is not None and name not in keep:
+                dropped += 1
+                continue
+            data[name] = compact_values(values)
+        source.data = data
+
+    # sources only used by glyph renderers can be shared when their content is identical
+    shared = {}
+    merged = 0
+    for renderer in [model for model in document_models(doc) if isinstance(model, GlyphRenderer)]:
+        source = renderer.data_source
+        if columns.get(source.id) is None or type(source) is not ColumnDataSource:
+            continue
+        key = json.dumps(Serializer(deferred=False).encode(source.data), sort_keys=True)
+        first = shared.setdefault(key, source)
+        if first is not source:
+            renderer.data_source = first
+            merged += 1
+
+    return dropped, merged
+
+
+
+def downsample_contours(doc, x, y, z, grid_size=200):
+    '''
+    Recomputes the fitness contours of the document on a grid of about grid_size x grid_size
+    points (every n-th point of the full x, y, z grid).
+    '''
+
+    step = max(1, int(np.ceil(max(len(x), len(y)) / grid_size)))
+    for renderer in [model for model in document_models(doc) if isinstance(model, ContourRenderer)]:
+        levels = np.asarray(renderer.levels, dtype=float)
+        geometry = post.contour_geometry(np.asarray(x)[::step], np.asarray(y)[::step], z[::step, ::step], levels)
+        teva_plot.set_contour_geometry(renderer, geometry)
+
+
+
+# Sidecar files
+def write_sidecars(doc, folder, min_kb=64):
+    '''
+    Moves the data of every source larger than min_kb into binary files in folder, and adds a
+    document ready callback that loads them into the page. The page has to be opened through
+    a web server (e.g. python -m http.server) for the browser to allow loading the files.
+
+        Returns:
+            dict source id -> bytes written
+    '''
+
+    os.makedirs(folder, exist_ok=True)
+    relative = os.path.basename(os.path.normpath(folder))
+    sources, specs, written = [], [], {}
+    for source in [model for model in document_models(doc) if isinstance(model, ColumnDataSource)]:
+        if serialized_size(source.data) < min_kb * 1024:
+            continue
+        spec = {}
+        for j, (name, values) in enumerate(source.data.items()):
+            spec[name] = _write_column(folder, '{}_{}'.format(source.id, j), values)
+        written[source.id] = sum(os.path.getsize(os.path.join(folder, item['file'])) for item in spec.values())
+        sources.append(source)
+        specs.append(spec)
+        source.data = {name: [] for name in source.data}
+
+    if sources:
+        doc.js_on_event('document_ready', CustomJS(args=dict(sources=sources, specs=specs, folder=relative), code=_LOAD_SIDECARS))
+
+    return written
+
+
+
+def _write_column(folder, stem, values):
+    # one column as a typed array file, a ragged (nested) typed array file or JSON
+    leaves = []
+    structure = _ragged_structure(values, leaves)
+    dtypes = {leaf.dtype.name for leaf in leaves}
+    if structure is not None and len(dtypes) == 1 and dtypes <= _TYPED_ARRAYS:
+        file_name = stem + '.bin'
+        with open(os.path.join(folder, file_name), 'wb') as f:
+            for leaf in leaves:
+                f.write(np.ascontiguousarray(leaf).tobytes())
+        kind = 'array' if isinstance(structure, int) else 'ragged'
+        return {'type': kind, 'file': file_name, 'dtype': dtypes.pop(), 'structure': structure}
+
+    file_name = stem + '.json'
+    with open(os.path.join(folder, file_name), 'w') as f:
+        json.dump(values.tolist() if isinstance(values, np.ndarray) else values, f, separators=(',', ':'), default=_json_default)
+
+    return {'type': 'json', 'file': file_name}
+
+
+
+def _ragged_structure(values, leaves):
+    # nested lengths of a column of (nested lists of) numeric arrays, None for other columns
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'fiu':
+        leaves.append(values)
+        # multi-dimensional arrays (images) are rebuilt as nested lists of rows
+        structure = values.shape[-1]
+        for n in values.shape[-2::-1]:
+            structure = [structure] * n
+        return structure
+    if isinstance(values, (list, tuple)) and len(values):
+        structure = [_ragged_structure(v, leaves) for v in values]
+        return None if any(item is None for item in structure) else structure
+
+    return None
+
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(type(value).__name__)
+
+
+
+# Export
+def export_dashboard(dashboard, filename, contour_grid=None, contour_size=200, sidecars=False,
+                     sidecar_min_kb=64, resources='cdn', title='TEVA Output Explorer'):
+    '''
+    Saves a compact HTML export of a Panel dashboard.
+
+            dashboard       Panel layout (e.g. the app of the notebook)
+            filename        .html file to write
+            contour_grid    optional (x_fit, y_fit, z_fit) of the fitness contours, the contours are
+                            then recomputed on a grid of about contour_size x contour_size points
+            sidecars        if True, sources larger than sidecar_min_kb are written to binary files
+                            in a <filename>_data folder and loaded when the page opens (the page then
+                            needs to be served over http)
+            resources       'cdn' or 'inline' Bokeh/Panel resources
+
+        Returns:
+            DataFrame with the size (kB) of each component of the export
+    '''
+
+    doc = document_copy(dashboard)
+    full_kb = document_size(doc) / 1024
+
+    if contour_grid is not None:
+        downsample_contours(doc, *contour_grid, grid_size=contour_size)
+    compact_sources(doc)
+
+    written = {}
+    if sidecars:
+        folder = os.path.splitext(filename)[0] + '_data'
+        written = write_sidecars(doc, folder, sidecar_min_kb)
+
+    save(doc, filename, resources=resources, title=title)
+
+    return size_report(doc, filename, written, full_kb)
+
+
+
+def size_report(doc, filename, sidecar_bytes=None, full_kb=None):
+    '''
+    Size (kB) of an exported page by component: each data source embedded in the page, the
+    other document models, the page itself (template and resources) and the sidecar files.
+    '''
+
+    sidecar_bytes = sidecar_bytes or {}
+    labels = _source_labels(doc)
+    rows = []
+    sources_kb = 0
+    for source in [model for model in document_models(doc) if isinstance(model, ColumnDataSource)]:
+        kb = serialized_size(source.data) / 1024
+        sources_kb += kb
+        rows.append({'component': labels.get(source.id, 'source ' + source.id), 'location': 'page', 'kB': kb})
+        if source.id in sidecar_bytes:
+            rows.append({'component': labels.get(source.id, 'source ' + source.id), 'location': 'sidecar',
+                         'kB': sidecar_bytes[source.id] / 1024})
+
+    doc_kb = document_size(doc) / 1024
+    page_kb = os.path.getsize(filename) / 1024
+    rows.append({'component': 'other models (layout, widgets, tools)', 'location': 'page', 'kB': max(doc_kb - sources_kb, 0)})
+    rows.append({'component': 'template and resources', 'location': 'page', 'kB': max(page_kb - doc_kb, 0)})
+
+    report = pd.DataFrame(rows).groupby(['component', 'location'], as_index=False)['kB'].sum()
+    report = report.sort_values('kB', ascending=False, kind='stable').reset_index(drop=True)
+    total = {'component': 'total', 'location': 'page + sidecars', 'kB': page_kb + sum(sidecar_bytes.values()) / 1024}
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    if full_kb is not None:
+        report.attrs['uncompacted_document_kB'] = full_kb
+
+    return report
+
+
+
+def _source_labels(doc):
+    # readable name of each source: glyph type and columns, contour parts by name
+    labels = {}
+    for model in document_models(doc):
+        if isinstance(model, ContourRenderer):
+            labels[model.fill_renderer.data_source.id] = 'fitness contours (fill)'
+            labels[model.line_renderer.data_source.id] = 'fitness contours (lines)'
+    for model in document_models(doc):
+        if isinstance(model, GlyphRenderer) and model.data_source.id not in labels:
+            columns = list(model.data_source.data)
+            labels[model.data_source.id] = '{} ({})'.format(type(model.glyph).__name__, ', '.join(columns[:4]) + (', ...' if len(columns) > 4 else ''))
+
+    return labels
@@ -0,0 +1,270 @@
+# Import libraries
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import TEVA_Post_Processing as post
+
+# Bump when the sidecar layout changes, older sidecars are then rebuilt
+SIDECAR_VERSION = 1
+
+
+
+# Binary sidecar cache for TEVA .xlsx exports
+def file_key(path):
+    '''
+    Identifies the current content of a workbook.
+
+        Returns:
+            dict with the sha256 hash, mtime and size of the file
+    '''
+
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return {'sha256': digest.hexdigest(), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+
+def sidecar_dir(path, sheet_name, cache_dir=None):
+    '''
+    Directory holding the sidecar of one workbook sheet. By default it sits next to the workbook.
+    '''
+
+    folder = os.path.dirname(os.path.abspath(path)) if cache_dir is None else cache_dir
+    return os.path.join(folder, '{}.{}.teva'.format(os.path.basename(path), sheet_name))
+
+
+
+def write_sidecar(df, path, sheet_name, cache_dir=None, key=None):
+    '''
+    Converts a TEVA CC or DNF sheet into a sidecar of .npy arrays plus a manifest.
+
+            df              sheet as returned by pd.read_excel
+            path            path of the source workbook
+            sheet_name      sheet of the workbook (e.g. 'CCEA_High')
+            cache_dir       optional folder for the sidecar, defaults to the workbook folder
+            key             optional file_key(path), computed if not given
+
+    The metadata columns are stored one array per column. The feature/CC block is stored
+    pre-parsed: CSR membership arrays, and for CC sheets the raw range strings together
+    with their decoded lo/hi bounds.
+    '''
+
+    if key is None:
+        key = file_key(path)
+
+    meta, block = post.split_sheet(df)
+    arrays = {}
+    meta_info = []
+    for i, (col, values) in enumerate(meta.items()):
+        name = 'meta_{}'.format(i)
+        if values.dtype == object:
+            isna = pd.isna(values)
+            arrays[name] = np.where(isna, '', values).astype(str)
+            if isna.any():
+                arrays[name + '_isna'] = isna
+        else:
+            arrays[name] = values
+        meta_info.append({'column': col, 'array': name, 'object': bool(values.dtype == object)})
+
+    # DNF sheets hold 0/1 cc_ indicators, CC sheets hold range strings
+    is_dnf = len(block.columns) > 0 and all(str(col).startswith('cc_') for col in block.columns)
+    if is_dnf:
+        invalid = ~block.isin([0, 1]).to_numpy()
+        if invalid.any():
+            row, col = np.argwhere(invalid)[0]
+            raise ValueError('{} [{}]: the cc_ columns of a DNF sheet must hold 0/1 indicators, found {} in row {}, column {}'.format(
+                             path, sheet_name, block.iat[row, col], row, block.columns[col]))
+        kind = 'dnf'
+        indptr, indices = post.block_csr(block.eq(1).to_numpy())
+        names = block.columns.to_numpy(dtype=object)
+    else:
+        kind = 'cc'
+        indptr, indices, names, values, lo, hi = post.cc_ranges(df)
+        arrays['ranges'] = block.to_numpy(dtype=object)[block.notna().to_numpy()].astype(str)
+        arrays['lo'] = lo
+        arrays['hi'] = hi
+    arrays['indptr'] = indptr
+    arrays['indices'] = indices
+    arrays['names'] = np.asarray(names).astype(str)
+
+    manifest = dict(key)
+    manifest.update({'version': SIDECAR_VERSION,
+                     'sheet_name': sheet_name,
+                     'kind': kind,
+                     'n_rows': len(df),
+                     'meta': meta_info,
+                     'arrays': sorted(arrays)})
+
+    # write to a temporary folder first so a half-written sidecar is never picked up
+    target = sidecar_dir(path, sheet_name, cache_dir)
+    tmp = target + '.tmp{}'.format(os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp, name + '.npy'), values, allow_pickle=False)
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+    return target
+
+
+
+def read_sidecar(path, sheet_name, cache_dir=None, mmap=True):
+    '''
+    Reads the sidecar of a workbook sheet if it is still up to date.
+
+    The sidecar is reused when the workbook mtime and size match the manifest. If only the
+    mtime changed, the file hash decides (and the manifest mtime is refreshed on a match).
+
+        Returns:
+            (manifest, dict of arrays) or None if there is no valid sidecar
+    '''
+
+    target = sidecar_dir(path, sheet_name, cache_dir)
+    try:
+        with open(os.path.join(target, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != SIDECAR_VERSION or manifest.get('sheet_name') != sheet_name:
+        return None
+
+    stat = os.stat(path)
+    if stat.st_mtime != manifest['mtime'] or stat.st_size != manifest['size']:
+        key = file_key(path)
+        if key['sha256'] != manifest['sha256']:
+            return None
+        # touched but unchanged workbook
+        manifest.update(key)
+        with open(os.path.join(target, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+    mmap_mode = 'r' if mmap else None
+    try:
+        arrays = {name: np.load(os.path.join(target, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in manifest['arrays']}
+    except (OSError, ValueError):
+        return None
+
+    return manifest, arrays
+
+
+
+def sidecar_to_frame(manifest, arrays):
+    '''
+    Rebuilds the sheet DataFrame (as returned by pd.read_excel) from a sidecar.
+    '''
+
+    n_rows = manifest['n_rows']
+    columns = {}
+    for item in manifest['meta']:
+        values = np.asarray(arrays[item['array']])
+        if item['object']:
+            values = values.astype(object)
+            if item['array'] + '_isna' in arrays:
+                values[np.asarray(arrays[item['array'] + '_isna'])] = np.nan
+        columns[item['column']] = values
+    meta = pd.DataFrame(columns)
+
+    names = np.asarray(arrays['names']).tolist()
+    indptr = np.asarray(arrays['indptr'])
+    rows = np.repeat(np.arange(n_rows), np.diff(indptr))
+    cols = np.asarray(arrays['indices'])
+    if manifest['kind'] == 'dnf':
+        cells = np.zeros((n_rows, len(names)), dtype=np.int64)
+        cells[rows, cols] = 1
+        block = pd.DataFrame(cells, columns=names)
+    else:
+        cells = np.full((n_rows, len(names)), np.nan, dtype=object)
+        cells[rows, cols] = np.asarray(arrays['ranges']).astype(object)
+        # all-empty feature columns come back as float, like pd.read_excel
+        block = pd.DataFrame(cells, columns=names).infer_objects()
+
+    return pd.concat([meta, block], axis=1)
+
+
+
+def load_sheet(path, sheet_name, cache_dir=None, use_cache=True):
+    '''
+    Drop-in replacement for pd.read_excel(path, sheet_name=sheet_name) on TEVA CC/DNF workbooks.
+
+    The first load converts the sheet into a binary sidecar, later loads of the same workbook
+    content are read from the sidecar instead of the .xlsx file.
+    '''
+
+    if use_cache:
+        cached = read_sidecar(path, sheet_name, cache_dir)
+        if cached is not None:
+            return sidecar_to_frame(*cached)
+
+    key = file_key(path)
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    if use_cache:
+        write_sidecar(df, path, sheet_name, cache_dir, key)
+
+    return df
+
+
+
+def load_parsed(path, sheet_name, cache_dir=None):
+    '''
+    Pre-parsed arrays of a TEVA sheet, read (memory-mapped) from its sidecar.
+
+        Returns:
+            dict with
+                indptr, indices, names      CSR membership (cc -> feature, or dnf -> cc_ column)
+                ranges, lo, hi              range strings and bounds aligned with indices (cc sheets only)
+                meta                        dict of metadata column arrays
+
+    The sidecar is built first if it is missing or stale.
+    '''
+
+    cached = read_sidecar(path, sheet_name, cache_dir)
+    if cached is None:
+        load_sheet(path, sheet_name, cache_dir)
+        cached = read_sidecar(path, sheet_name, cache_dir)
+    manifest, arrays = cached
+
+    parsed = {name: arrays[name] for name in ('indptr', 'indices', 'names', 'ranges', 'lo', 'hi') if name in arrays}
+    parsed['meta'] = {item['column']: arrays[item['array']] for item in manifest['meta']}
+    if manifest['kind'] == 'dnf':
+        # cc numbers without the 'cc_' prefix, as returned by post.dnf_membership
+        parsed['names'] = np.array([name[3:] for name in np.asarray(arrays['names']).tolist()], dtype=object)
+
+    return parsed
+
+
+
+def load_runs(runs, output_class='High', cache_dir=None, store=None):
+    '''
+    Loads several TEVA runs of one output class into a post.RunStore (shared feature and CC
+    dictionaries, see post.RunStore).
+
+            runs            dict run name -> (cc workbook path, dnf workbook path)
+            output_class    class of the CCEA_<class> / DNFEA_<class> sheets
+            cache_dir       optional folder for the sidecars (see load_sheet)
+            store           optional RunStore to add the runs to
+
+        Returns:
+            post.RunStore
+    '''
+
+    if store is None:
+        store = post.RunStore()
+    for name, (cc_path, dnf_path) in runs.items():
+        ccs = load_sheet(cc_path, 'CCEA_' + output_class, cache_dir)
+        dnfs = load_sheet(dnf_path, 'DNFEA_' + output_class, cache_dir)
+        store.add(name, ccs, dnfs)
+
+    return store
@@ -0,0 +1,351 @@
+# Streaming access to TEVA observation tables.
+#
+# Observation tables can be far larger than memory, so they are read in chunks of rows
+# (CSV, or Parquet when pyarrow is installed), restricted to the columns the CCs use. The
+# summaries the dashboard needs are accumulated in one pass: count, mean and variance,
+# min/max and a fixed-size histogram (whose range doubles as new values arrive) for the
+# numeric features, and value counts for the categorical ones. The KDE curves of the CC
+# feature subplots are then computed from the histograms instead of from the raw rows.
+#
+# Example:
+#           summaries = observations.ObservationSummaries.from_file('obs.csv', columns=unique_features)
+#           teva_plot.feature_plotter(cc, None, cc_features, feature_values_by_cc, summaries)
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+
+
+# Chunked readers
+def read_chunks(path, columns=None, chunksize=100000):
+    '''
+    Reads an observation table in chunks of rows.
+
+            path        .csv file, or .parquet / .pq file (needs pyarrow)
+            columns     optional list of the columns to read (default: all)
+            chunksize   rows per chunk
+
+        Returns:
+            iterator of DataFrames
+    '''
+
+    if columns is not None:
+        columns = list(columns)
+
+    if str(path).endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('reading Parquet observation files requires pyarrow')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+
+# One-pass summaries
+class ObservationSummaries:
+    '''
+    Plotting summaries of an observation table, accumulated chunk by chunk. Has the same
+    interface as post.FeatureSummaries, so it can be passed to feature_plotter.
+
+            n_samples       KDE evaluation points per feature
+            n_bins          histogram bins per numeric feature (even)
+            max_categories  most distinct values counted per categorical feature. An integer
+                            feature with more values is summarized as continuous (from its
+                            histogram); a string feature keeps its max_categories most frequent
+                            values and the others are counted in one OTHER bucket
+
+    As with pd.read_csv on the whole table, columns with float values are treated as
+    continuous and all other columns as categorical. Summaries of separate parts of a
+    table can be combined with merge(). Once a string feature has overflowed, the counts of
+    the kept values are lower bounds: rows of a value read while it was in the OTHER bucket
+    stay there.
+    '''
+
+    # label of the bucket of the values beyond max_categories
+    OTHER = 'Other'
+
+    def __init__(self, n_samples=100, n_bins=1024, max_categories=10000):
+        self.n_samples = n_samples
+        self.n_bins = n_bins + n_bins % 2
+        self.max_categories = max_categories
+        self.columns = []
+        self.n_rows = 0
+        self._kind = {}
+        self._moments = {}
+        self._hist = {}
+        self._counts = {}
+        self._other = {}
+        self._density = {}
+
+
+    @classmethod
+    def from_file(cls, path, columns=None, chunksize=100000, **kwargs):
+        '''
+        Summarizes an observation file in one pass (see read_chunks). Only `columns` are read,
+        e.g. the features used by the CCs.
+        '''
+
+        summaries = cls(**kwargs)
+        for chunk in read_chunks(path, columns, chunksize):
+            summaries.update(chunk)
+
+        return summaries
+
+
+    def update(self, chunk):
+        '''
+        Adds a chunk of observations (DataFrame) to the summaries.
+        '''
+
+        self._density.clear()
+        self.n_rows += len(chunk)
+        for name in chunk.columns:
+            column = chunk[name]
+            if name not in self._kind:
+                self.columns.append(name)
+                self._kind[name] = None
+            if column.isna().all():
+                # an all-missing chunk says nothing about the column type
+                continue
+            if pd.api.types.is_float_dtype(column.dtype):
+                kind = 'float'
+            elif pd.api.types.is_integer_dtype(column.dtype):
+                kind = 'int'
+            else:
+                kind = 'object'
+            self._kind[name] = _merge_kind(self._kind[name], kind)
+
+            if kind != 'object':
+                values = column.to_numpy(dtype=float)
+                values = values[np.isfinite(values)]
+                self._add_moments(name, _moments(values))
+                self._add_histogram(name, values)
+            if self._kind[name] != 'float':
+                self._add_counts(name, column.value_counts())
+
+        return self
+
+
+    def merge(self, other):
+        '''
+        Adds the summaries of another part of the table.
+        '''
+
+        self._density.clear()
+        self.n_rows += other.n_rows
+        for name in other.columns:
+            if name not in self._kind:
+                self.columns.append(name)
+                self._kind[name] = None
+            if other._kind[name] is None:
+                continue
+            self._kind[name] = _merge_kind(self._kind[name], other._kind[name])
+            if name in other._moments:
+                self._add_moments(name, other._moments[name])
+                origin, width, counts, sums = other._hist[name]
+                filled = counts > 0
+                self._add_histogram(name, sums[filled] / counts[filled], counts[filled])
+            if name in other._counts and self._kind[name] != 'float':
+                self._add_counts(name, other._counts[name], other._other.get(name, 0))
+
+        return self
+
+
+    def _add_moments(self, name, moments):
+        if name not in self._moments:
+            self._moments[name] = moments
+        else:
+            self._moments[name] = _merge_moments(self._moments[name], moments)
+
+
+    def _add_histogram(self, name, values, weights=None):
+        if len(values) == 0:
+            return
+        if name not in self._hist:
+            lo, hi = values.min(), values.max()
+            width = (hi - lo) / (self.n_bins - 1) if hi > lo else max(abs(lo), 1.0) * 2.0 ** -20
+            self._hist[name] = [lo, width, np.zeros(self.n_bins), np.zeros(self.n_bins)]
+        hist = self._hist[name]
+        _extend_histogram(hist, values.min(), values.max())
+
+        origin, width, counts, sums = hist
+        bins = np.clip(((values - origin) // width).astype(np.int64), 0, self.n_bins - 1)
+        weights = np.ones(len(values)) if weights is None else weights
+        counts += np.bincount(bins, weights=weights, minlength=self.n_bins)
+        sums += np.bincount(bins, weights=weights * values, minlength=self.n_bins)
+
+
+    def _add_counts(self, name, counts, other=0):
+        if self._counts.get(name, 0) is None:
+            return
+        if counts is None:
+            # the other part summarized the column as continuous
+            self._counts[name] = None
+            return
+        if name in self._counts:
+            counts = self._counts[name].add(counts, fill_value=0)
+        counts = counts.astype(np.int64)
+        other += self._other.get(name, 0)
+
+        if len(counts) > self.max_categories:
+            if self._kind[name] != 'object':
+                # numeric values, summarized by the histogram instead
+                self._counts[name] = None
+                self._other.pop(name, None)
+                return
+            counts = counts.sort_values(ascending=False, kind='stable')
+            other += int(counts.iloc[self.max_categories:].sum())
+            counts = counts.iloc[:self.max_categories]
+        self._counts[name] = counts
+        if other:
+            self._other[name] = other
+
+
+    def is_continuous(self, name):
+        '''
+        Float columns (and categorical columns with too many values) are treated as continuous.
+        '''
+
+        return self._kind[name] == 'float' or (self._counts.get(name) is None and name in self._hist)
+
+
+    def stats(self, name):
+        '''
+        count, mean, std, min and max of a numeric feature.
+        '''
+
+        n, mean, m2, lo, hi = self._moments[name]
+        std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+
+        return {'count': int(n), 'mean': mean, 'std': std, 'min': lo, 'max': hi}
+
+
+    def histogram(self, name):
+        '''
+        Histogram of a numeric feature.
+
+            Returns:
+                edges, counts
+        '''
+
+        origin, width, counts, sums = self._hist[name]
+        return origin + width * np.arange(self.n_bins + 1), counts.copy()
+
+
+    def density(self, name, cut=3):
+        '''
+        KDE curve (xs, ys) of a continuous feature, with the same support and bandwidth
+        (Scott's rule) as post.kde_curves on the raw values. Each histogram bin contributes a
+        kernel at the mean of its values.
+        '''
+
+        if name in self._density:
+            return self._density[name]
+
+        xs = np.linspace(0, 1, self.n_samples)
+        ys = np.zeros(self.n_samples)
+        if name not in self._hist:
+            self._density[name] = (xs, ys)
+            return self._density[name]
+
+        n, mean, m2, lo, hi = self._moments[name]
+        bw = n ** -0.2 * np.sqrt(m2 / (n - 1)) if n > 1 else 0
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        usable = np.isfinite(bw) and bw > 0
+        if usable:
+            lo, hi = lo - cut * bw, hi + cut * bw
+        xs = lo + xs * (hi - lo)
+
+        if usable:
+            origin, width, counts, sums = self._hist[name]
+            filled = counts > 0
+            centers = sums[filled] / counts[filled]
+            d = (xs[:, None] - centers[None, :]) / bw
+            ys = np.exp(-0.5 * d * d) @ counts[filled] / (n * bw * np.sqrt(2 * np.pi))
+        self._density[name] = (xs, ys)
+
+        return self._density[name]
+
+
+    def value_counts(self, name):
+        '''
+        Value counts of a categorical feature, sorted by value (as DataFrame.value_counts).
+        The values beyond max_categories of a string feature come last, as one OTHER row.
+        '''
+
+        counts = self._counts[name].sort_index()
+        if name in self._other:
+            counts = pd.concat([counts, pd.Series([self._other[name]], index=[self.OTHER], dtype=np.int64)])
+        counts.index.name = name
+        counts.name = 'count'
+
+        return counts
+
+
+    def precompute(self, names=None):
+        '''
+        Computes the KDE curves of the given features (default: all columns) up front.
+        '''
+
+        for name in (self.columns if names is None else names):
+            if self.is_continuous(name):
+                self.density(name)
+
+        return self
+
+
+
+def _merge_kind(kind, other):
+    # the column type pd.read_csv would give the whole column
+    if kind is None or kind == other:
+        return other
+    if 'object' in (kind, other):
+        return 'object'
+
+    return 'float'
+
+
+
+def _moments(values):
+    # count, mean, sum of squared deviations, min and max
+    if len(values) == 0:
+        return (0, 0.0, 0.0, np.inf, -np.inf)
+    mean = values.mean()
+
+    return (len(values), mean, ((values - mean) ** 2).sum(), values.min(), values.max())
+
+
+
+def _merge_moments(a, b):
+    # parallel variance update (Chan et al.)
+    n = a[0] + b[0]
+    if n == 0:
+        return a
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / n
+    m2 = a[2] + b[2] + delta * delta * a[0] * b[0] / n
+
+    return (n, mean, m2, min(a[3], b[3]), max(a[4], b[4]))
+
+
+
+def _extend_histogram(hist, lo, hi):
+    # doubles the bin width until [lo, hi] is covered, merging pairs of bins
+    origin, width, counts, sums = hist
+    n_bins = len(counts)
+    while lo < origin or hi >= origin + n_bins * width:
+        pairs = counts.reshape(-1, 2).sum(axis=1), sums.reshape(-1, 2).sum(axis=1)
+        half = np.zeros(n_bins // 2)
+        if lo < origin:
+            # grow downwards, the old range becomes the upper half
+            origin -= n_bins * width
+            counts, sums = np.concatenate([half, pairs[0]]), np.concatenate([half, pairs[1]])
+        else:
+            counts, sums = np.concatenate([pairs[0], half]), np.concatenate([pairs[1], half])
+        width *= 2
+    hist[:] = [origin, width, counts, sums]
@@ -2,7 +2,19 @@
 import numpy as np
 import pandas as pd
 import ast
-import matplotlib.tri as tri
+import hashlib
+# matplotlib.tri and scipy.sparse are imported by the functions that use them, which keeps
+# the import of this module light for batch jobs
+import TEVA_Cache as cache
+
+# The metadata columns at the start of every TEVA CC/DNF sheet. The remaining columns are
+# either feature ranges (CC sheet) or cc_ membership indicators (DNF sheet). Older exports
+# do not have the min/max_feat_sensitivity columns.
+META_COLUMNS = ['Unnamed: 0', 'class', 'mask', 'fitness', 'order', 'age', 'cov', 'ppv',
+                'min_feat_sensitivity', 'max_feat_sensitivity', 'tp', 'tn', 'fp', 'fn']
+
+# '[lo, hi]' or '(lo, hi)' range strings, used for the vectorized lo/hi decode
+_RANGE_PATTERN = r'^\s*[\[(]\s*([^,\[\]()]+?)\s*,\s*([^,\[\]()]+?)\s*,?\s*[\])]\s*$'
 
 # Define post-processing functions
 def flatten(xss):
@@ -14,19 +26,105 @@ def flatten(xss):
 
 
 
+def split_sheet(df):
+    '''
+    Splits a TEVA CC or DNF sheet into its metadata block (the leading META_COLUMNS present,
+    14 columns, or 12 in older exports without the sensitivity columns) and its feature/CC
+    block (everything after).
+
+        Returns:
+            meta        dict of numpy arrays, one per metadata column
+            block       DataFrame of the feature range (CC) or cc_ indicator (DNF) columns
+    '''
+
+    n_meta = 0
+    while n_meta < len(df.columns) and df.columns[n_meta] in META_COLUMNS:
+        n_meta += 1
+    if n_meta == 0:
+        raise ValueError('Not a TEVA CC/DNF sheet: it does not start with the metadata columns {}'.format(META_COLUMNS))
+    misplaced = [col for col in df.columns[n_meta:] if col in META_COLUMNS]
+    if misplaced:
+        raise ValueError('Not a TEVA CC/DNF sheet: the metadata columns {} come after the feature/CC columns'.format(misplaced))
+
+    meta = {col: df[col].to_numpy() for col in df.columns[:n_meta]}
+    block = df.iloc[:, n_meta:]
+
+    return meta, block
+
+
+
+def block_csr(present):
+    '''
+    Compresses a 2d boolean array (rows x columns) into CSR arrays.
+
+        Returns:
+            indptr      row i owns indices[indptr[i]:indptr[i+1]]
+            indices     column numbers, in column order within each row
+    '''
+
+    present = np.asarray(present, dtype=bool)
+    rows, indices = np.nonzero(present)
+    indptr = np.zeros(present.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=present.shape[0]), out=indptr[1:])
+
+    return indptr, indices
+
+
+
+def csr_to_lists(indptr, indices, names):
+    '''
+    Thin list-of-lists view of CSR arrays, with column numbers replaced by names.
+    '''
+
+    labels = np.asarray(names, dtype=object)[indices].tolist()
+    return [labels[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)]
+
+
+
+@cache.memoize
+def dnf_membership(dnfs):
+    '''
+    Columnar parse of the DNF sheet indicator block.
+
+        Returns:
+            indptr      CSR row pointer (one row per dnf)
+            indices     CSR column numbers into cc_names
+            cc_names    numpy array of cc numbers (as strings, 'cc_' prefix removed)
+    '''
+
+    meta, block = split_sheet(dnfs)
+    indptr, indices = block_csr(block.eq(1).to_numpy())
+    cc_names = np.array([name[3:] for name in block.columns], dtype=object)
+
+    return indptr, indices, cc_names
+
+
+
+@cache.memoize
+def cc_membership(ccs):
+    '''
+    Columnar parse of the CC sheet feature block.
+
+        Returns:
+            indptr          CSR row pointer (one row per cc)
+            indices         CSR column numbers into feature_names
+            feature_names   numpy array of feature names
+    '''
+
+    meta, block = split_sheet(ccs)
+    present = block.notna() & block.ne(0)
+    indptr, indices = block_csr(present.to_numpy())
+
+    return indptr, indices, block.columns.to_numpy(dtype=object)
+
+
+
 def parse_dnf(dnfs):
     '''
     Creates a list of the ccs composing each dnf.
     '''
 
-    all_ccs = []
-    for i in range(0, len(dnfs['mask'])):
-        # don't include the first 14 columns
-        item = dnfs.iloc[i].iloc[14:]
-        item_ccs = item[item==1].index.values.tolist()
-        item_ccs = list(map(lambda j: j[3:], item_ccs))
-        all_ccs.append(item_ccs)
-    return all_ccs
+    return csr_to_lists(*dnf_membership(dnfs))
 
 
 
@@ -35,81 +133,395 @@ def parse_cc(ccs):
     Creates a list of the features composing each cc.
     '''
 
-    cc_features = []
-    for i in range(0, len(ccs)):
-        # don't include the first 14 columns
-        cc_values = ccs.iloc[i].iloc[14:]
-        cc_values.fillna(value = 0, method=None, inplace=True)
-        cc_values = dict(cc_values[cc_values != 0])
-        cc_features.append(list(cc_values.keys()))
-    return cc_features
+    return csr_to_lists(*cc_membership(ccs))
 
 
 
-def fitness_contours(n_grid, dnfs, ccs):
+def parse_range(text):
+    '''
+    Fast parser for a single feature range cell, e.g. '[0.8, 2.7]' -> [0.8, 2.7].
+
+    Flat lists/tuples of numbers are decoded directly; anything else (nested lists,
+    quoted categories, ...) falls back to ast.literal_eval.
+    '''
+
+    inner = text.strip()
+    if inner[:1] in ('[', '(') and inner[-1:] in (']', ')'):
+        try:
+            values = [_parse_number(item) for item in inner[1:-1].split(',') if item.strip()]
+            return values if inner[0] == '[' else tuple(values)
+        except ValueError:
+            pass
+
+    return ast.literal_eval(text)
+
+
+
+def _parse_number(item):
+    try:
+        return int(item)
+    except ValueError:
+        return float(item)
+
+
+
+def range_bounds(range_strings):
+    '''
+    Vectorized decode of the lower and upper bounds of '[lo, hi]' range strings.
+
+        Returns:
+            lo, hi      float arrays, nan where the cell is not a two-number range (e.g. categorical)
+    '''
+
+    bounds = pd.Series(range_strings, dtype=object).astype(str).str.extract(_RANGE_PATTERN)
+    lo = pd.to_numeric(bounds[0], errors='coerce').to_numpy(dtype=float)
+    hi = pd.to_numeric(bounds[1], errors='coerce').to_numpy(dtype=float)
+
+    return lo, hi
+
+
+
+@cache.memoize
+def cc_ranges(ccs, by_feature=False):
+    '''
+    Columnar parse of the feature range block of the CC sheet.
+
+            ccs             TEVA cc output excel file
+            by_feature      if True, the CSR rows are features and the columns are ccs
+
+        Returns:
+            indptr          CSR row pointer
+            indices         CSR column numbers (feature column by cc, or cc row by feature)
+            feature_names   numpy array of feature names
+            values          list of parsed ranges, aligned with indices
+            lo, hi          float arrays of the range bounds, aligned with indices
+    '''
+
+    meta, block = split_sheet(ccs)
+    present = block.notna().to_numpy()
+    cells = block.to_numpy(dtype=object)
+    if by_feature:
+        present = present.T
+        cells = cells.T
+
+    indptr, indices = block_csr(present)
+    range_strings = cells[present]
+    values = [parse_range(item) for item in range_strings]
+    lo, hi = range_bounds(range_strings)
+
+    return indptr, indices, block.columns.to_numpy(dtype=object), values, lo, hi
+
+
+
+def _array_key(*items):
+    '''
+    Content hash of a mix of arrays and scalars, used as a cache key.
+    '''
+
+    digest = hashlib.sha1()
+    for item in items:
+        values = np.ascontiguousarray(np.ma.filled(item, np.nan) if np.ma.isMaskedArray(item) else item)
+        digest.update(str((values.dtype, values.shape)).encode())
+        digest.update(values.tobytes())
+        if np.ma.isMaskedArray(item):
+            digest.update(np.ma.getmaskarray(item).tobytes())
+
+    return digest.hexdigest()
+
+
+
+def _cache_put(store, key, value, max_items=8):
+    store[key] = value
+    while len(store) > max_items:
+        store.pop(next(iter(store)))
+    return value
+
+
+
+def _cache_get(store, key):
+    # the entry of key (None if missing), moved to the end so that _cache_put drops it last
+    value = store.pop(key, None)
+    if value is not None:
+        store[key] = value
+    return value
+
+
+
+# triangulations / interpolators keyed on the input points, and interpolated grids keyed on
+# the points and grid options (both hold the most recent entries only)
+_INTERPOLATOR_CACHE = {}
+_SURFACE_CACHE = {}
+_GEOMETRY_CACHE = {}
+
+
+
+def fitness_interpolator(cov, ppv, fitness):
+    '''
+    Linear triangular interpolator of fitness over (cov, ppv), cached on the input points.
+    '''
+
+    cov = np.asarray(cov, dtype=float)
+    ppv = np.asarray(ppv, dtype=float)
+    fitness = np.asarray(fitness, dtype=float)
+
+    key = _array_key(cov, ppv, fitness)
+    if key not in _INTERPOLATOR_CACHE:
+        import matplotlib.tri as tri
+        triangles = tri.Triangulation(cov, ppv)
+        _cache_put(_INTERPOLATOR_CACHE, key, tri.LinearTriInterpolator(triangles, fitness))
+
+    return _INTERPOLATOR_CACHE[key]
+
+
+
+def contour_levels(fitness, n_levels=10):
+    '''
+    Evenly spaced fitness contour levels between the lowest and highest fitness.
+    '''
+
+    return np.linspace(min(fitness), max(fitness), n_levels)
+
+
+
+@cache.memoize
+def fitness_contours(n_grid, dnfs, ccs, dtype=np.float32, adaptive=False, coarse_step=8):
     '''
     Interpolate fitness values within plot domain using linear triangular interpolator.
     
-        n_grid      number of grid points
-        dnfs        TEVA dnf output excel file
-        ccs         TEVA cc output excel file
+        n_grid          number of grid points
+        dnfs            TEVA dnf output excel file
+        ccs             TEVA cc output excel file
+        dtype           dtype of the interpolated grid (float32 by default)
+        adaptive        if True, interpolate on a coarse grid first and only refine the coarse
+                        cells that cross a contour level or the edge of the data
+        coarse_step     fine grid points per coarse cell (adaptive mode)
 
     Returns:
         x           x coordinates of mesh
         y           y coordinates of mesh
         z           interpolated fitness masked array
+        fitness     fitness of all dnfs and ccs
 
     Can be passed into the Bokeh contour renderer. Example:
                 # x, y, z = fitness_contours(1000, dnfs, ccs)
+
+    The triangulation and the interpolated grid are cached on the input points, so calling
+    this again with the same data returns the same (shared, do not modify) arrays.
     '''
 
+    cov = pd.concat([dnfs['cov'], ccs['cov']]).to_numpy(dtype=float)
+    ppv = pd.concat([dnfs['ppv'], ccs['ppv']]).to_numpy(dtype=float)
+    fitness = pd.concat([dnfs['fitness'], ccs['fitness']])
+
+    key = _array_key(cov, ppv, fitness.to_numpy(dtype=float), np.array([n_grid, adaptive, coarse_step]),
+                     np.array(np.dtype(dtype).str))
+    if key in _SURFACE_CACHE:
+        x, y, z = _SURFACE_CACHE[key]
+        return (x, y, z, fitness)
+
+    interpolator = fitness_interpolator(cov, ppv, fitness)
     x = np.linspace(0, 1, n_grid)
     y = np.linspace(0, 1, n_grid)
-    xplot, yplot = np.meshgrid(x, y)
-    triangles = tri.Triangulation(pd.concat([dnfs['cov'],ccs['cov']]),
-                                  pd.concat([dnfs['ppv'], ccs['ppv']]))
-    fitness = pd.concat([dnfs['fitness'], ccs['fitness']])
-    interpolator = tri.LinearTriInterpolator(triangles, fitness)
-    z = interpolator(xplot, yplot)
+    if adaptive and n_grid > 2 * coarse_step:
+        z = _adaptive_surface(interpolator, x, y, contour_levels(fitness), coarse_step)
+    else:
+        xplot, yplot = np.meshgrid(x, y)
+        z = interpolator(xplot, yplot)
+    z = np.ma.masked_invalid(z.astype(dtype))
+
+    _cache_put(_SURFACE_CACHE, key, (x, y, z))
 
     return (x, y, z, fitness)
 
 
 
-def CC_feature_heatmap(unique_features, cc_features):
+def _adaptive_surface(interpolator, x, y, levels, step):
+    '''
+    Coarse-to-fine interpolation of the fitness grid.
+
+    The interpolator is evaluated on every step-th grid line. Coarse cells whose corners are
+    all valid and do not straddle a contour level are filled by bilinear upsampling; all other
+    cells are evaluated at full resolution.
+    '''
+
+    n_x = len(x)
+    n_y = len(y)
+    ix = np.unique(np.append(np.arange(0, n_x, step), n_x - 1))
+    iy = np.unique(np.append(np.arange(0, n_y, step), n_y - 1))
+
+    coarse = np.ma.filled(interpolator(*np.meshgrid(x[ix], y[iy])), np.nan)
+
+    # coarse cell of every fine grid line, and the bilinear weights within that cell
+    cell_x = np.clip(np.searchsorted(ix, np.arange(n_x), side='right') - 1, 0, len(ix) - 2)
+    cell_y = np.clip(np.searchsorted(iy, np.arange(n_y), side='right') - 1, 0, len(iy) - 2)
+    wx = (x - x[ix[cell_x]]) / (x[ix[cell_x + 1]] - x[ix[cell_x]])
+    wy = ((y - y[iy[cell_y]]) / (y[iy[cell_y + 1]] - y[iy[cell_y]]))[:, None]
+
+    # bilinear upsampling of the coarse grid
+    z = ((1 - wy) * ((1 - wx) * coarse[cell_y][:, cell_x] + wx * coarse[cell_y][:, cell_x + 1])
+         + wy * ((1 - wx) * coarse[cell_y + 1][:, cell_x] + wx * coarse[cell_y + 1][:, cell_x + 1]))
+
+    # coarse cells to refine: invalid corners or a contour level between the corner values
+    corners = np.stack([coarse[:-1, :-1], coarse[:-1, 1:], coarse[1:, :-1], coarse[1:, 1:]])
+    invalid = np.isnan(corners).any(axis=0)
+    corners = np.where(invalid, 0, corners)
+    crossing = (np.searchsorted(levels, corners.min(axis=0), side='right')
+                != np.searchsorted(levels, corners.max(axis=0), side='right'))
+    refine = invalid | crossing
+
+    # fine points on a coarse grid line belong to the cells on both sides of it
+    below_x = np.clip(np.searchsorted(ix, np.arange(n_x), side='left') - 1, 0, len(ix) - 2)
+    below_y = np.clip(np.searchsorted(iy, np.arange(n_y), side='left') - 1, 0, len(iy) - 2)
+    refine_fine = (refine[cell_y][:, cell_x] | refine[below_y][:, cell_x]
+                   | refine[cell_y][:, below_x] | refine[below_y][:, below_x])
+
+    # evaluate all refined points in one call
+    fine_y, fine_x = np.nonzero(refine_fine)
+    if len(fine_y):
+        z[fine_y, fine_x] = np.ma.filled(interpolator(x[fine_x], y[fine_y]), np.nan)
+
+    return np.ma.masked_invalid(z)
+
+
+
+def contour_geometry(x, y, z, levels):
+    '''
+    Precomputes the filled contour polygons and contour lines of the fitness grid.
+
+        x, y, z     fitness grid (as returned by fitness_contours)
+        levels      increasing contour levels (e.g. contour_levels(fitness))
+
+    Returns:
+        dict with
+            levels              contour levels
+            fill_xs, fill_ys    per level band, a list of polygons (outer boundary then holes)
+            line_xs, line_ys    per level, nan separated line coordinates
+
+    The layout matches bokeh.plotting.contour.ContourData, so the plot only ships this line
+    geometry instead of recontouring the grid. Results are cached on the grid and levels.
+    '''
+
+    from contourpy import contour_generator, FillType, LineType
+
+    levels = np.asarray(levels, dtype=float)
+    key = _array_key(x, y, z, levels)
+    if key in _GEOMETRY_CACHE:
+        return _GEOMETRY_CACHE[key]
+
+    generator = contour_generator(x, y, z, line_type=LineType.ChunkCombinedNan, fill_type=FillType.OuterOffset)
+
+    fill_xs = []
+    fill_ys = []
+    for lower, upper in zip(levels[:-1], levels[1:]):
+        polygons_x = []
+        polygons_y = []
+        for points, offsets in zip(*generator.filled(lower, upper)):
+            polygons_x.append([points[offsets[k]:offsets[k + 1], 0] for k in range(len(offsets) - 1)])
+            polygons_y.append([points[offsets[k]:offsets[k + 1], 1] for k in range(len(offsets) - 1)])
+        fill_xs.append(polygons_x)
+        fill_ys.append(polygons_y)
+
+    line_xs = []
+    line_ys = []
+    for level in levels:
+        points = generator.lines(level)[0][0]
+        if points is None:
+            points = np.empty((0, 2))
+        line_xs.append(points[:, 0])
+        line_ys.append(points[:, 1])
+
+    geometry = {'levels': levels, 'fill_xs': fill_xs, 'fill_ys': fill_ys, 'line_xs': line_xs, 'line_ys': line_ys}
+
+    return _cache_put(_GEOMETRY_CACHE, key, geometry)
+
+
+
+def binned_density(x, y, x_range, y_range, bins=256):
+    '''
+    Bins scatter points into a 2D count grid over a plot range (server-side aggregation of
+    large CC/DNF sets for the main figure).
+
+            x, y                point coordinates
+            x_range, y_range    (start, end) of the binned area
+            bins                number of bins along each axis
+
+        Returns:
+            2d float array (y bins x x bins, image orientation), nan where there are no points
+    '''
+
+    counts, y_edges, x_edges = np.histogram2d(y, x, bins=bins, range=[sorted(y_range), sorted(x_range)])
+    counts = counts.astype(np.float32)
+    counts[counts == 0] = np.nan
+
+    return counts
+
+
+
+def cc_incidence_matrix(unique_features, cc_features):
+    '''
+    Builds a sparse CC x feature incidence matrix (1 if the feature is used in the CC).
+
+            unique_features     list of unique features (matrix columns)
+            cc_features         list of lists (ccs and their features, matrix rows)
+
+        Returns:
+            scipy.sparse csr matrix, shape (len(cc_features), len(unique_features))
+
+    Features that are not in unique_features are ignored.
+    '''
+
+    from scipy import sparse
+
+    n_rows = len(cc_features)
+    n_cols = len(unique_features)
+    lengths = np.fromiter((len(item) for item in cc_features), dtype=np.int64, count=n_rows)
+    flat = flatten(cc_features)
+
+    # integer-encode the flattened features, -1 for features outside unique_features
+    cols = pd.Index(unique_features).get_indexer(flat) if len(flat) else np.zeros(0, dtype=np.int64)
+    rows = np.repeat(np.arange(n_rows), lengths)
+    keep = cols >= 0
+
+    X = sparse.csr_matrix((np.ones(np.count_nonzero(keep), dtype=np.int32), (rows[keep], cols[keep])),
+                          shape=(n_rows, n_cols))
+    # a feature listed twice in one CC still only counts once
+    X.sum_duplicates()
+    X.data[:] = 1
+
+    return X
+
+
+
+def CC_feature_heatmap(unique_features, cc_features, row_mask=None, incidence=None):
     '''
     This function goes through the CC features and builds a "correlation" - style matrix
     that shows how many times each feature appears in a CC with each other feature.
         
             unique_features     list of unique features
             cc_features         list of lists (ccs and their features)
+            row_mask            optional boolean array (one per cc), only the selected ccs are counted
+            incidence           optional prebuilt cc_incidence_matrix(unique_features, cc_features)
 
         Returns:
             2d matrix
+
+    The counts are computed as a single sparse product X^T X of the CC x feature incidence
+    matrix, with order 1 CCs removed. Pass a prebuilt incidence matrix and a row mask to get a
+    sensitivity-filtered heatmap without rebuilding the incidence matrix.
     '''
-    
-    matrix = np.zeros((len(unique_features), len(unique_features)))
-
-    # select the first feature
-    for i in range(0, len(unique_features)):
-        # select the second feature
-        for j in range(0, len(unique_features)):
-            # pass if same feature is selected
-            if unique_features[i] == unique_features[j]:
-                pass
-            else:
-                # loop through cc_features
-                for k in range(0, len(cc_features)):
-                    # pass for all order 1 CCs
-                    if len(cc_features[k]) == 1:
-                        pass
-                    else:
-                        # check if first feature is in the cc
-                        if unique_features[i] in cc_features[k]:
-                            # check if second feature is in the cc
-                            if unique_features[j] in cc_features[k]:
-                                matrix[i,j] += 1
-    
+
+    if incidence is None:
+        incidence = cc_incidence_matrix(unique_features, cc_features)
+
+    # pass for all order 1 CCs
+    lengths = np.fromiter((len(item) for item in cc_features), dtype=np.int64, count=len(cc_features))
+    rows = lengths != 1
+    if row_mask is not None:
+        rows &= np.asarray(row_mask, dtype=bool)
+
+    X = incidence[rows]
+    matrix = (X.T @ X).toarray().astype(float)
+
     # set the upper triangle to be nan. k=0 sets the main diagonal to nan as well
     matrix[np.triu_indices_from(matrix, k=0)] = np.nan
     
@@ -117,71 +529,738 @@ def CC_feature_heatmap(unique_features, cc_features):
 
 
 
-def stacked_features(ccs, unique_features, cc_features, all_features_flat):
-    cc_len = np.arange(1, max(ccs['order']) + 1 , 1)
-    cc_col_names = ['Feature']
+class TevaArchive:
+    '''
+    Compact, integer-encoded model of one TEVA output class (a CC sheet and its DNF sheet).
+
+    Features are stored as integer ids with a shared name dictionary, CC -> feature and
+    DNF -> CC membership as CSR arrays, and the feature ranges as float lo/hi arrays aligned
+    with the CC -> feature entries. Ranges that are not a [lo, hi] pair of numbers (categorical
+    value sets) are kept in a small side table and have nan bounds.
+
+            feature_names       numpy array of feature names, indexed by feature id
+            feature_index       dict feature name -> feature id (may be shared between archives)
+            cc_numbers          cc number of every cc row ('Unnamed: 0')
+            cc_indptr           CSR row pointer of cc -> feature
+            cc_feature          feature id of every cc -> feature entry
+            range_lo, range_hi  range bounds of every cc -> feature entry
+            categorical         dict entry position -> parsed range, for non [lo, hi] ranges
+            dnf_numbers         dnf number of every dnf row ('Unnamed: 0')
+            dnf_indptr          CSR row pointer of dnf -> cc
+            dnf_cc              cc row of every dnf -> cc entry (-1 if the cc is not in the cc sheet)
+            dnf_cc_number       cc number of every dnf -> cc entry
+            cc_meta, dnf_meta   dicts of the numeric metadata columns (cov, ppv, fitness, order, ...)
+            label               output class (e.g. 'High')
+
+    The list-of-lists structures used by the dashboard (cc_features, all_ccs, ...) are
+    available as views.
+    '''
+
+    __slots__ = ('feature_names', 'feature_index', 'cc_numbers', 'cc_indptr', 'cc_feature',
+                 'range_lo', 'range_hi', 'categorical', 'dnf_numbers', 'dnf_indptr', 'dnf_cc',
+                 'dnf_cc_number', 'cc_meta', 'dnf_meta', 'label')
+
+    # numeric metadata columns kept in cc_meta / dnf_meta
+    META_ARRAYS = ['fitness', 'order', 'age', 'cov', 'ppv', 'min_feat_sensitivity', 'max_feat_sensitivity',
+                   'tp', 'tn', 'fp', 'fn']
+
+
+    @classmethod
+    def from_frames(cls, ccs, dnfs, feature_index=None):
+        '''
+        Builds the archive from the CC and DNF sheets (as returned by pd.read_excel).
+
+                feature_index   optional dict feature name -> id shared with other archives,
+                                new features are added to it
+        '''
+
+        archive = cls()
+        archive.feature_index = {} if feature_index is None else feature_index
+
+        # cc -> feature membership and ranges, in one columnar pass
+        indptr, indices, columns, values, lo, hi = cc_ranges(ccs)
+        for name in columns:
+            archive.feature_index.setdefault(name, len(archive.feature_index))
+        column_ids = np.array([archive.feature_index[name] for name in columns], dtype=np.int32)
+        archive.feature_names = np.array(list(archive.feature_index), dtype=object)
+        archive.cc_indptr = indptr
+        archive.cc_feature = column_ids[indices]
+        archive.range_lo = lo
+        archive.range_hi = hi
+        archive.categorical = {int(i): values[i] for i in np.flatnonzero(np.isnan(lo) | np.isnan(hi))}
+
+        archive.cc_meta = {col: ccs[col].to_numpy() for col in cls.META_ARRAYS if col in ccs}
+        archive.dnf_meta = {col: dnfs[col].to_numpy() for col in cls.META_ARRAYS if col in dnfs}
+        archive.cc_numbers = ccs['Unnamed: 0'].to_numpy(dtype=np.int64)
+        archive.dnf_numbers = dnfs['Unnamed: 0'].to_numpy(dtype=np.int64)
+        archive.label = ccs['class'].iloc[0] if len(ccs) and 'class' in ccs else None
+
+        # dnf -> cc membership, as cc rows
+        dnf_indptr, dnf_indices, cc_names = dnf_membership(dnfs)
+        cc_name_numbers = np.array([int(name) for name in cc_names], dtype=np.int64)
+        archive.dnf_indptr = dnf_indptr
+        archive.dnf_cc_number = cc_name_numbers[dnf_indices]
+        archive.dnf_cc = pd.Index(archive.cc_numbers).get_indexer(archive.dnf_cc_number).astype(np.int32)
+
+        return archive
+
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+
+    @property
+    def n_ccs(self):
+        return len(self.cc_indptr) - 1
+
+
+    @property
+    def n_dnfs(self):
+        return len(self.dnf_indptr) - 1
+
+
+    def cc_orders(self):
+        '''
+        Number of features of every cc.
+        '''
+
+        return np.diff(self.cc_indptr)
+
+
+    def dnf_orders(self):
+        '''
+        Number of ccs of every dnf.
+        '''
+
+        return np.diff(self.dnf_indptr)
+
+
+    def nbytes(self):
+        '''
+        Approximate memory used by the archive arrays.
+        '''
+
+        arrays = [self.cc_numbers, self.cc_indptr, self.cc_feature, self.range_lo, self.range_hi,
+                  self.dnf_numbers, self.dnf_indptr, self.dnf_cc, self.dnf_cc_number]
+        arrays += list(self.cc_meta.values()) + list(self.dnf_meta.values())
+
+        return sum(a.nbytes for a in arrays)
+
+
+    # Backward compatible views
+    def cc_features(self):
+        '''
+        List of the features composing each cc (same as parse_cc).
+        '''
+
+        return csr_to_lists(self.cc_indptr, self.cc_feature, self.feature_names)
+
+
+    def all_ccs(self):
+        '''
+        List of the ccs composing each dnf, as cc number strings (same as parse_dnf).
+        '''
+
+        numbers = self.dnf_cc_number.astype(str).astype(object)
+        return csr_to_lists(self.dnf_indptr, np.arange(len(numbers)), numbers)
+
+
+    def unique_features(self):
+        '''
+        Names of the features used by the ccs, in order of first use.
+        '''
+
+        return self.feature_names[pd.unique(self.cc_feature)]
+
+
+    def unique_ccs(self):
+        '''
+        Sorted cc number strings of the ccs used by the dnfs.
+        '''
+
+        return np.unique(flatten(self.all_ccs()))
+
+
+    def feature_values_by_cc(self):
+        '''
+        Feature ranges of each cc (same layout as feature_ranges_by_cc).
+        '''
+
+        ranges = [self.categorical[i] if i in self.categorical else [lo, hi]
+                  for i, (lo, hi) in enumerate(zip(self.range_lo.tolist(), self.range_hi.tolist()))]
+        return [ranges[self.cc_indptr[i]:self.cc_indptr[i + 1]] for i in range(self.n_ccs)]
+
+
+    def cc_keys(self, ranges=True):
+        '''
+        Hashable key of every cc, equal for ccs (of any archive) that constrain the same
+        features to the same ranges. With ranges=False only the features are compared.
+        '''
+
+        names = self.feature_names[self.cc_feature].tolist()
+        bounds = [repr(self.categorical[i]) if i in self.categorical else (lo, hi)
+                  for i, (lo, hi) in enumerate(zip(self.range_lo.tolist(), self.range_hi.tolist()))]
+        keys = np.empty(self.n_ccs, dtype=object)
+        for i in range(self.n_ccs):
+            start, stop = self.cc_indptr[i], self.cc_indptr[i + 1]
+            if ranges:
+                keys[i] = tuple(sorted(zip(names[start:stop], bounds[start:stop]), key=lambda item: item[0]))
+            else:
+                keys[i] = tuple(sorted(names[start:stop]))
+
+        return keys
+
+
+    # Inputs for the downstream functions
+    def incidence(self):
+        '''
+        Sparse cc x feature incidence matrix over all feature ids (see cc_incidence_matrix).
+        '''
+
+        from scipy import sparse
+
+        X = sparse.csr_matrix((np.ones(len(self.cc_feature), dtype=np.int32), self.cc_feature, self.cc_indptr),
+                              shape=(self.n_ccs, len(self.feature_names)))
+        X.sum_duplicates()
+        X.data[:] = 1
+
+        return X
+
+
+    def interval_index(self):
+        '''
+        FeatureIntervalIndex over the feature ranges of the ccs.
+        '''
+
+        return FeatureIntervalIndex.from_archive(self)
 
-    feature_counts = []
-    for i in range(len(unique_features)):
-        feature_counts.append(np.count_nonzero(all_features_flat==unique_features[i]))
 
-    for j in range(len(cc_len)):
-        cc_col_names.append('Order ' + str(j+1))
+    def sensitivity_index(self):
+        '''
+        SensitivityIndex over the ccs and dnfs of the archive.
+        '''
 
-    cc_col_names.append('Total')
-    feature_order = pd.DataFrame(columns=cc_col_names)
-    feature_order['Feature'] = unique_features
-    feature_order['Total'] = feature_counts
+        return SensitivityIndex(self.cc_meta['min_feat_sensitivity'], self.cc_meta['max_feat_sensitivity'],
+                                self.cc_numbers, self.dnf_indptr, self.dnf_cc_number)
 
-    # List subset by length
-    for k in range(len(cc_len)):
-        # subset cc_features by order
-        subset = [sublist for sublist in cc_features if len(sublist) == cc_len[k]]
-        subset = np.array(flatten(subset))
 
-        for i in range(len(unique_features)):
-            feature_order.loc[i, 'Order ' + str(k+1)] = np.count_nonzero(subset==unique_features[i])
+    def feature_counts(self):
+        '''
+        StackedCounts of feature usage by cc order.
+        '''
 
-    feature_order.sort_values(by=['Total'], ascending=False, inplace=True)
-    # feature_order.drop(columns=['Total'], inplace=True)
-    stack_plot_feature = dict(feature_order)
-    stack_names_feature = cc_col_names[1:-1]
+        orders = np.repeat(self.cc_orders(), self.cc_orders())
+        return StackedCounts.from_codes(self.cc_feature, orders, self.feature_names, max(self.cc_meta['order']), 'Feature')
 
-    return stack_plot_feature, stack_names_feature
+
+    def cc_counts(self):
+        '''
+        StackedCounts of cc usage by dnf order (cc names as cc number strings).
+        '''
+
+        orders = np.repeat(self.dnf_orders(), self.dnf_orders())
+        codes, numbers = pd.factorize(self.dnf_cc_number)
+        return StackedCounts.from_codes(codes, orders, numbers.astype(str).astype(object), max(self.dnf_meta['order']), 'CC')
+
+
+
+class RunStore:
+    '''
+    Several TEVA runs of one output class (e.g. sensitivity on / off, different seeds) with
+    shared dictionaries, so the runs can be compared on integer ids.
+
+            feature_index   dict feature name -> feature id, shared by the archives of all runs
+            cc_index        dict cc key (TevaArchive.cc_keys) -> shared cc id, ccs that constrain
+                            the same features to the same ranges get the same id in every run
+            archives        dict run name -> TevaArchive
+            cc_ids          dict run name -> shared cc id of every cc row of the run
+
+    The CC and DNF sheets of every run are kept as well (frames), so a dashboard can switch
+    between runs without loading anything again.
+    '''
+
+    def __init__(self):
+        self.feature_index = {}
+        self.cc_index = {}
+        self.archives = {}
+        self.cc_ids = {}
+        self._frames = {}
+
+
+    def add(self, name, ccs, dnfs):
+        '''
+        Adds a run (CC and DNF sheets as returned by pd.read_excel).
+
+            Returns:
+                the TevaArchive of the run
+        '''
+
+        archive = TevaArchive.from_frames(ccs, dnfs, self.feature_index)
+        ids = np.empty(archive.n_ccs, dtype=np.int64)
+        for i, key in enumerate(archive.cc_keys()):
+            ids[i] = self.cc_index.setdefault(key, len(self.cc_index))
+
+        self.archives[name] = archive
+        self.cc_ids[name] = ids
+        self._frames[name] = (ccs, dnfs)
+
+        return archive
+
+
+    @property
+    def names(self):
+        return list(self.archives)
+
+
+    @property
+    def feature_names(self):
+        return np.array(list(self.feature_index), dtype=object)
+
+
+    def archive(self, name):
+        return self.archives[name]
+
+
+    def frames(self, name):
+        '''
+        CC and DNF sheets of a run.
+        '''
+
+        return self._frames[name]
+
+
+    def incidence(self, name):
+        '''
+        Sparse cc x feature incidence matrix of a run over all features of the store.
+        '''
+
+        from scipy import sparse
+
+        X = self.archives[name].incidence()
+        return sparse.csr_matrix((X.data, X.indices, X.indptr), shape=(X.shape[0], len(self.feature_index)))
+
+
+    def membership(self, ranges=True):
+        '''
+        Sparse run x shared cc matrix, 1 where the run has the cc. With ranges=False ccs are
+        matched on their features only.
+        '''
+
+        from scipy import sparse
+
+        if ranges:
+            ids, n_ids = list(self.cc_ids.values()), len(self.cc_index)
+        else:
+            keys = [archive.cc_keys(ranges=False) for archive in self.archives.values()]
+            codes, uniques = pd.factorize(np.concatenate(keys) if keys else np.zeros(0, dtype=object))
+            ids, n_ids = np.split(codes, np.cumsum([len(item) for item in keys])[:-1]), len(uniques)
+        rows = np.repeat(np.arange(len(ids)), [len(item) for item in ids])
+        cols = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        M = sparse.csr_matrix((np.ones(len(cols), dtype=np.int32), (rows, cols)), shape=(len(ids), n_ids))
+        M.sum_duplicates()
+        M.data[:] = 1
+
+        return M
+
+
+    # Cross-run statistics
+    def summary(self):
+        '''
+        Number of ccs, dnfs and used features of every run, and how many of its (distinct)
+        ccs are found in at least one other run.
+        '''
+
+        M = self.membership()
+        in_runs = np.asarray(M.sum(axis=0)).ravel()
+        rows = []
+        for i, (name, archive) in enumerate(self.archives.items()):
+            ccs = M[i].indices
+            rows.append({'ccs': archive.n_ccs, 'dnfs': archive.n_dnfs,
+                         'features': len(np.unique(archive.cc_feature)),
+                         'shared_ccs': int(np.count_nonzero(in_runs[ccs] > 1))})
+
+        return pd.DataFrame(rows, index=pd.Index(self.names, name='Run'))
+
+
+    def feature_usage(self, share=False):
+        '''
+        Number of ccs using each feature, features x runs. share=True divides by the number
+        of ccs of the run. Features no run uses are left out.
+        '''
+
+        usage = {}
+        for name in self.archives:
+            counts = np.asarray(self.incidence(name).sum(axis=0)).ravel().astype(float)
+            usage[name] = counts / max(self.archives[name].n_ccs, 1) if share else counts
+        usage = pd.DataFrame(usage, index=pd.Index(self.feature_names, name='Feature'))
+
+        return usage[(usage != 0).any(axis=1)]
+
+
+    def usage_delta(self, a, b, share=True):
+        '''
+        Feature usage of run b minus run a, sorted by the size of the change.
+        '''
+
+        usage = self.feature_usage(share)
+        delta = pd.DataFrame({a: usage[a], b: usage[b], 'delta': usage[b] - usage[a]})
+
+        return delta.loc[delta['delta'].abs().sort_values(ascending=False, kind='stable').index]
+
+
+    def cc_overlap(self, jaccard=False, ranges=True):
+        '''
+        Number of distinct ccs shared by every pair of runs (runs x runs), or their Jaccard
+        index |A & B| / |A | B| with jaccard=True. With ranges=False ccs are matched on their
+        features only.
+        '''
+
+        M = self.membership(ranges)
+        shared = (M @ M.T).toarray().astype(float)
+        if jaccard:
+            sizes = np.diag(shared)
+            union = sizes[:, None] + sizes[None, :] - shared
+            with np.errstate(divide='ignore', invalid='ignore'):
+                shared = np.where(union > 0, shared / union, np.nan)
+
+        return pd.DataFrame(shared, index=pd.Index(self.names, name='Run'), columns=self.names)
+
+
+    def shared_ccs(self, a, b):
+        '''
+        CCs found in both runs: shared cc id and the cc number in each run.
+        '''
+
+        common, ia, ib = np.intersect1d(self.cc_ids[a], self.cc_ids[b], return_indices=True)
+        return pd.DataFrame({'cc_id': common, a: self.archives[a].cc_numbers[ia], b: self.archives[b].cc_numbers[ib]})
+
+
+    def cooccurrence(self, name):
+        '''
+        Symmetric feature x feature co-occurrence counts of a run over all features of the
+        store (the counts of CC_feature_heatmap, order 1 ccs left out).
+        '''
+
+        X = self.incidence(name)[self.archives[name].cc_orders() != 1]
+        return (X.T @ X).toarray()
+
+
+    def cooccurrence_delta(self, a, b):
+        '''
+        Co-occurrence counts of run b minus run a (diagonal: feature usage in ccs of order > 1),
+        over the features used in either run.
+        '''
+
+        delta = self.cooccurrence(b) - self.cooccurrence(a)
+        used = np.flatnonzero(np.asarray(self.incidence(a).sum(axis=0)).ravel() + np.asarray(self.incidence(b).sum(axis=0)).ravel())
+        names = self.feature_names[used]
+
+        return pd.DataFrame(delta[np.ix_(used, used)], index=pd.Index(names, name='Feature'), columns=names)
+
+
+
+class SensitivityIndex:
+    '''
+    Precomputed index that answers the (min sensitivity, max sensitivity) slider queries
+    for both CCs and DNFs.
+
+    A CC is kept when min_sens >= slider min and max_sens <= slider max. The CCs are ranked
+    once by min sensitivity (descending) and by max sensitivity (ascending), so a query is a
+    binary search for the number of CCs passing each slider and a rank comparison. A DNF is
+    kept when all of its CCs are kept, i.e. when the largest rank among its CCs passes, so
+    each DNF only stores the maximum rank of its CCs.
+
+            min_sens        min feature sensitivity per cc
+            max_sens        max feature sensitivity per cc
+            cc_ids          cc number per cc (e.g. the 'Unnamed: 0' column)
+            dnf_indptr      CSR row pointer of the dnf -> cc membership
+            dnf_cc_ids      cc numbers of the dnf -> cc membership, aligned with dnf_indptr
+
+    DNFs referring to a cc number that is not in cc_ids are never kept.
+    '''
+
+    def __init__(self, min_sens, max_sens, cc_ids, dnf_indptr=None, dnf_cc_ids=None):
+        min_sens = np.asarray(min_sens, dtype=float)
+        max_sens = np.asarray(max_sens, dtype=float)
+        n_ccs = len(min_sens)
+
+        # min slider: sort by -min_sens ascending (nan sorts last and never passes)
+        order = np.argsort(-min_sens, kind='stable')
+        self._min_sorted = -min_sens[order]
+        self._min_rank = np.empty(n_ccs, dtype=np.int64)
+        self._min_rank[order] = np.arange(n_ccs)
+
+        # max slider: sort by max_sens ascending
+        order = np.argsort(max_sens, kind='stable')
+        self._max_sorted = max_sens[order]
+        self._max_rank = np.empty(n_ccs, dtype=np.int64)
+        self._max_rank[order] = np.arange(n_ccs)
+
+        if dnf_indptr is None:
+            dnf_indptr = np.zeros(1, dtype=np.int64)
+            dnf_cc_ids = np.zeros(0, dtype=np.int64)
+        dnf_indptr = np.asarray(dnf_indptr, dtype=np.int64)
+        n_dnfs = len(dnf_indptr) - 1
+
+        # position of each referenced cc, unknown ccs get a rank that never passes
+        positions = pd.Index(np.asarray(cc_ids)).get_indexer(np.asarray(dnf_cc_ids))
+        known = positions >= 0
+        entry_min_rank = np.where(known, self._min_rank[positions], n_ccs)
+        entry_max_rank = np.where(known, self._max_rank[positions], n_ccs)
+        entry_dnf = np.repeat(np.arange(n_dnfs), np.diff(dnf_indptr))
+
+        # a dnf without ccs is always kept
+        self._dnf_min_rank = np.full(n_dnfs, -1, dtype=np.int64)
+        self._dnf_max_rank = np.full(n_dnfs, -1, dtype=np.int64)
+        np.maximum.at(self._dnf_min_rank, entry_dnf, entry_min_rank)
+        np.maximum.at(self._dnf_max_rank, entry_dnf, entry_max_rank)
+
+
+    @classmethod
+    def from_plot_data(cls, cc_plot_data, dnf_plot_data=None):
+        '''
+        Builds the index from the cc_plot_data / dnf_plot_data frames used by the dashboard.
+        '''
+
+        if dnf_plot_data is None:
+            return cls(cc_plot_data['min_sens'], cc_plot_data['max_sens'], cc_plot_data['CC'])
+
+        dnf_ccs = list(dnf_plot_data['CCs'])
+        lengths = np.fromiter((len(item) for item in dnf_ccs), dtype=np.int64, count=len(dnf_ccs))
+        dnf_indptr = np.concatenate([[0], np.cumsum(lengths)])
+        dnf_cc_ids = flatten(dnf_ccs).astype(np.int64)
+
+        return cls(cc_plot_data['min_sens'], cc_plot_data['max_sens'], cc_plot_data['CC'], dnf_indptr, dnf_cc_ids)
+
+
+    def masks(self, min_sens, max_sens):
+        '''
+        Boolean masks (cc_mask, dnf_mask) of the CCs and DNFs kept by the sensitivity range.
+        '''
+
+        n_min = np.searchsorted(self._min_sorted, -min_sens, side='right')
+        n_max = np.searchsorted(self._max_sorted, max_sens, side='right')
+
+        cc_mask = (self._min_rank < n_min) & (self._max_rank < n_max)
+        dnf_mask = (self._dnf_min_rank < n_min) & (self._dnf_max_rank < n_max)
+
+        return cc_mask, dnf_mask
+
+
+    def query(self, min_sens, max_sens):
+        '''
+        Row positions (cc_idx, dnf_idx) of the CCs and DNFs kept by the sensitivity range.
+        '''
+
+        cc_mask, dnf_mask = self.masks(min_sens, max_sens)
+
+        return np.flatnonzero(cc_mask), np.flatnonzero(dnf_mask)
+
+
+
+class StackedCounts:
+    '''
+    Item x order count table, e.g. how many times each feature is used in CCs of each order
+    (or each CC in DNFs of each order). Used for the stacked usage bar charts.
+
+            item_lists      list of lists (cc_features, or all_ccs)
+            n_orders        highest order (e.g. max(ccs['order']))
+            label           name of the item column ('Feature' or 'CC')
+
+    The table is built once with a single bincount over integer-encoded items. Views for a
+    subset of items only select rows of the table, and can be memoized by a key such as
+    the slider state, so going back to a previous slider range costs nothing. The memo is
+    keyed on the key and a hash of the items, and keeps the MEMO_SIZE most recently used
+    results. top() returns one page of the ranked items instead of all of them, for archives
+    with thousands of CCs.
+    '''
+
+    # memoized selections and views kept per table
+    MEMO_SIZE = 32
+
+    def __init__(self, item_lists, n_orders, label):
+        lengths = np.fromiter((len(item) for item in item_lists), dtype=np.int64, count=len(item_lists))
+        codes, names = pd.factorize(flatten(item_lists))
+        self._build(codes, np.repeat(lengths, lengths), names, n_orders, label)
+
+
+    @classmethod
+    def from_codes(cls, codes, orders, names, n_orders, label):
+        '''
+        Builds the table from already integer-encoded items (e.g. the CSR arrays of a TevaArchive).
+
+                codes       item id of every entry (index into names)
+                orders      order of the list each entry belongs to
+                names       item names
+        '''
+
+        counts = cls.__new__(cls)
+        counts._build(np.asarray(codes, dtype=np.int64), np.asarray(orders, dtype=np.int64), names, n_orders, label)
+
+        return counts
+
+
+    def _build(self, codes, orders, names, n_orders, label):
+        self.label = label
+        self.n_orders = int(n_orders)
+        self.names = np.asarray(names)
+        self._index = pd.Index(self.names)
+
+        # items in lists longer than n_orders only count towards the total
+        in_range = (orders >= 1) & (orders <= self.n_orders)
+        n_items = len(self.names)
+        self.counts = np.bincount(codes[in_range] * self.n_orders + orders[in_range] - 1,
+                                  minlength=n_items * self.n_orders).reshape(n_items, self.n_orders)
+        self.totals = np.bincount(codes, minlength=n_items)
+        self.order_names = ['Order ' + str(j + 1) for j in range(self.n_orders)]
+        self._views = {}
+        self._selections = {}
+
+
+    def _memo_key(self, names, key):
+        # the items are part of the key, so the same key with other items is not served a stale result
+        return None if key is None else (key, _array_key(np.asarray(names).astype(str)))
+
+
+    def _selection(self, names, key=None):
+        # names, count rows and totals of a subset of items, and their sums (memoized by key and names)
+        key = self._memo_key(names, key)
+        if key is not None:
+            result = _cache_get(self._selections, key)
+            if result is not None:
+                return result
+
+        rows = self._index.get_indexer(names) if len(self.names) else np.full(len(names), -1)
+        known = rows >= 0
+        counts = np.zeros((len(rows), self.n_orders), dtype=np.int64)
+        counts[known] = self.counts[rows[known]]
+        totals = np.zeros(len(rows), dtype=np.int64)
+        totals[known] = self.totals[rows[known]]
+
+        result = (np.asarray(names), counts, totals, counts.sum(axis=0), totals.sum())
+        if key is not None:
+            _cache_put(self._selections, key, result, self.MEMO_SIZE)
+
+        return result
+
+
+    def view(self, names, key=None):
+        '''
+        Stacked bar data for the given items, sorted by total count.
+
+                names       items to include (e.g. the sensitivity-filtered unique features)
+                key         optional hashable memo key (e.g. (min_sens, max_sens)), combined
+                            with a hash of names
+
+            Returns:
+                stack_plot      dict of columns (label, 'Order 1' ... 'Order n', 'Total')
+                stack_names     list of the order column names
+        '''
+
+        memo_key = self._memo_key(names, key)
+        if memo_key is not None:
+            result = _cache_get(self._views, memo_key)
+            if result is not None:
+                return result
+
+        _, counts, totals, _, _ = self._selection(names)
+
+        order = pd.DataFrame({self.label: names})
+        for j, name in enumerate(self.order_names):
+            order[name] = counts[:, j]
+        order['Total'] = totals
+        order.sort_values(by=['Total'], ascending=False, inplace=True, kind='stable')
+
+        result = (dict(order), list(self.order_names))
+        if memo_key is not None:
+            _cache_put(self._views, memo_key, result, self.MEMO_SIZE)
+
+        return result
+
+
+    def top(self, names, k, page=0, key=None, other=True):
+        '''
+        Stacked bar data for one page of the given items ranked by total count: page 0 holds
+        the top k items, page 1 the next k and so on. Only the ranks up to the end of the page
+        are sorted, and the items off the page are summed into one 'Other (n)' bar, so the
+        bars sent to the plot stay at k + 1 however many items there are.
+
+                names       items to include (e.g. the sensitivity-filtered unique CCs)
+                k           bars per page (None for all items, in the order of view)
+                page        page number from 0, clipped to the last page
+                key         optional hashable memo key (e.g. (min_sens, max_sens)), combined
+                            with a hash of names
+                other       add the 'Other' bar
+
+            Returns:
+                stack_plot      dict of columns (label, 'Order 1' ... 'Order n', 'Total')
+                stack_names     list of the order column names
+                page            page shown
+                n_pages         number of pages
+        '''
+
+        names, counts, totals, count_sum, total_sum = self._selection(names, key)
+        n = len(names)
+        k = max(n if k is None else int(k), 1)
+        n_pages = max(-(-n // k), 1)
+        page = min(max(int(page), 0), n_pages - 1)
+        start, stop = page * k, min(page * k + k, n)
+
+        # candidates for the first `stop` ranks: all totals above the stop-th largest and the
+        # first of the ties, so the ranking matches the stable sort of view
+        if stop < n:
+            threshold = np.partition(totals, n - stop)[n - stop]
+            above = np.flatnonzero(totals > threshold)
+            ties = np.flatnonzero(totals == threshold)[:stop - len(above)]
+            candidates = np.concatenate([above, ties])
+        else:
+            candidates = np.arange(n)
+        ranked = candidates[np.lexsort((candidates, -totals[candidates]))]
+        shown = ranked[start:stop]
+
+        labels = names[shown].tolist()
+        page_counts = counts[shown]
+        page_totals = totals[shown]
+        if other and len(shown) < n:
+            labels.append('Other ({})'.format(n - len(shown)))
+            page_counts = np.vstack([page_counts, count_sum - page_counts.sum(axis=0)])
+            page_totals = np.append(page_totals, total_sum - page_totals.sum())
+
+        stack_plot = {self.label: labels}
+        for j, name in enumerate(self.order_names):
+            stack_plot[name] = page_counts[:, j]
+        stack_plot['Total'] = page_totals
+
+        return stack_plot, list(self.order_names), page, n_pages
+
+
+
+def stacked_features(ccs, unique_features, cc_features, all_features_flat):
+    '''
+    Counts how many times each feature is used in CCs of each order.
+    all_features_flat is no longer needed and only kept for backward compatibility.
+
+        Returns:
+            stack_plot_feature      dict of columns ('Feature', 'Order 1' ... 'Order n', 'Total')
+            stack_names_feature     list of the order column names
+    '''
+
+    return StackedCounts(cc_features, max(ccs['order']), 'Feature').view(unique_features)
 
 
 
 def stacked_ccs(dnfs, unique_ccs, all_ccs, all_ccs_flat):
-    dnf_len = np.arange(1, max(dnfs['order']) + 1 , 1)
-    dnf_col_names = ['CC']
-
-    cc_counts = []
-    for i in range(len(unique_ccs)):
-        cc_counts.append(np.count_nonzero(all_ccs_flat==unique_ccs[i]))
-
-    for j in range(len(dnf_len)):
-        dnf_col_names.append('Order ' + str(j+1))
-
-    dnf_col_names.append('Total')
-    cc_order = pd.DataFrame(columns=dnf_col_names)
-    cc_order['CC'] = unique_ccs
-    cc_order['Total'] = cc_counts
-
-    # List subset by length
-    for k in range(len(dnf_len)):
-        # subset by order
-        subset = [sublist for sublist in all_ccs if len(sublist) == dnf_len[k]]
-        subset = np.array(flatten(subset))
-
-        for i in range(len(unique_ccs)):
-            cc_order.loc[i, 'Order ' + str(k+1)] = np.count_nonzero(subset==unique_ccs[i])
-
-    cc_order.sort_values(by=['Total'], ascending=False, inplace=True)
-    # cc_order.drop(columns=['Total'], inplace=True)
-    stack_plot_cc = dict(cc_order)
-    stack_names_cc = dnf_col_names[1:-1]
+    '''
+    Counts how many times each CC is used in DNFs of each order.
+    all_ccs_flat is no longer needed and only kept for backward compatibility.
+
+        Returns:
+            stack_plot_cc           dict of columns ('CC', 'Order 1' ... 'Order n', 'Total')
+            stack_names_cc          list of the order column names
+    '''
     
-    return stack_plot_cc, stack_names_cc
+    return StackedCounts(all_ccs, max(dnfs['order']), 'CC').view(unique_ccs)
 
 
 def feature_ranges_by_cc(ccs):
@@ -189,20 +1268,9 @@ def feature_ranges_by_cc(ccs):
     Parse the feature value ranges and write them to a list of lists.
     '''
 
-    a = ccs.drop(columns=['Unnamed: 0', 'class', 'mask', 'fitness', 'order', 'age', 'cov', 'ppv',
-       'min_feat_sensitivity', 'max_feat_sensitivity', 'tp', 'tn', 'fp', 'fn'])
+    indptr, indices, feature_names, values, lo, hi = cc_ranges(ccs)
     
-    main_list = []
-    for i in range(0, len(a)):
-        b = a.iloc[i].dropna().to_list()
-
-        value_list = []
-        for j in range(0, len(b)):
-                value_list.append(ast.literal_eval(b[j]))
-        
-        main_list.append(value_list)
-    
-    return main_list
+    return [values[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)]
 
 
 
@@ -211,22 +1279,334 @@ def feature_ranges_by_feature(ccs):
     Parse feature ranges by feature.
     '''
 
-    a = ccs.drop(columns=['Unnamed: 0', 'class', 'mask', 'fitness', 'order', 'age', 'cov', 'ppv',
-        'min_feat_sensitivity', 'max_feat_sensitivity', 'tp', 'tn', 'fp', 'fn'])
-    a.dropna(axis=1, how='all', inplace=True)
+    indptr, indices, feature_names, values, lo, hi = cc_ranges(ccs, by_feature=True)
 
-    cols = a.columns.to_list()
+    # features that are not used by any cc are dropped
+    return [values[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1) if indptr[i + 1] > indptr[i]]
 
-    main_list = []
-    for i in range(0, len(cols)):
-        b = a[cols[i]].dropna().to_list()
-        value_list = []
-        for j in range(0, len(b)):
-            value_list.append(ast.literal_eval(b[j]))
-        
-        main_list.append(value_list)
 
-    return main_list
+
+class FeatureIntervalIndex:
+    '''
+    Per-feature index of the CC feature ranges, answering "which CCs constrain feature X to
+    a range that overlaps / lies within / contains [a, b]" for many query ranges at once.
+
+    The [lo, hi] ranges of every feature are sorted once by lo and once by hi. A query finds
+    its window of candidate ranges in one of the sorted arrays by binary search (for overlap
+    and contains queries the smaller of the two windows) and only tests the ranges in that
+    window. Overlap counts need no candidates: #(lo <= b) - #(hi < a). Ranges that are not a
+    [lo, hi] pair of numbers (categorical value sets) are not indexed.
+
+            feature_names   feature name of every feature id
+            cc_numbers      cc number of every cc row
+            indptr          the ranges of feature f are at indptr[f]:indptr[f+1] of the sorted arrays
+    '''
+
+    HOW = ('overlap', 'within', 'contains')
+
+
+    def __init__(self, entry_feature, entry_cc, lo, hi, feature_names, cc_numbers):
+        self.feature_names = np.asarray(feature_names, dtype=object)
+        self.cc_numbers = np.asarray(cc_numbers)
+        self._feature_ids = {name: i for i, name in enumerate(self.feature_names.tolist())}
+
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        keep = ~(np.isnan(lo) | np.isnan(hi))
+        entry_feature = np.asarray(entry_feature, dtype=np.int64)[keep]
+        entry_cc = np.asarray(entry_cc, dtype=np.int64)[keep]
+        lo, hi = lo[keep], hi[keep]
+
+        self.indptr = np.zeros(len(self.feature_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entry_feature, minlength=len(self.feature_names)), out=self.indptr[1:])
+        by_lo = np.lexsort((lo, entry_feature))
+        by_hi = np.lexsort((hi, entry_feature))
+        self.lo_sorted, self.hi_by_lo, self.cc_by_lo = lo[by_lo], hi[by_lo], entry_cc[by_lo]
+        self.hi_sorted, self.lo_by_hi, self.cc_by_hi = hi[by_hi], lo[by_hi], entry_cc[by_hi]
+
+
+    @classmethod
+    def from_archive(cls, archive):
+        '''
+        Index of the feature ranges of a TevaArchive.
+        '''
+
+        entry_cc = np.repeat(np.arange(archive.n_ccs), archive.cc_orders())
+        return cls(archive.cc_feature, entry_cc, archive.range_lo, archive.range_hi, archive.feature_names, archive.cc_numbers)
+
+
+    @property
+    def n_ccs(self):
+        return len(self.cc_numbers)
+
+
+    def features(self):
+        '''
+        Names of the features with indexed ranges.
+        '''
+
+        return self.feature_names[np.diff(self.indptr) > 0]
+
+
+    def bounds(self, feature):
+        '''
+        Smallest lo and largest hi of the ranges of a feature.
+        '''
+
+        start, stop = self._segment(feature)
+        if start == stop:
+            return np.nan, np.nan
+
+        return self.lo_sorted[start], self.hi_sorted[stop - 1]
+
+
+    def counts(self, feature, a, b, how='overlap'):
+        '''
+        Number of ccs matching each query range (see query).
+        '''
+
+        a, b = np.broadcast_arrays(np.atleast_1d(np.asarray(a, dtype=float)), np.atleast_1d(np.asarray(b, dtype=float)))
+        if how == 'overlap':
+            # a cc using the feature twice would be counted twice here
+            start, stop = self._segment(feature)
+            counts = np.searchsorted(self.lo_sorted[start:stop], b, 'right') - np.searchsorted(self.hi_sorted[start:stop], a, 'left')
+            return np.maximum(counts, 0)
+
+        query, rows = self._matches(feature, a, b, how)
+        return np.bincount(query, minlength=len(a))
+
+
+    def query(self, feature, a, b, how='overlap', rows=False):
+        '''
+        CCs constraining `feature` to a range that overlaps [a, b] (how='overlap'), lies within
+        [a, b] ('within') or contains [a, b] ('contains'). All bounds are inclusive.
+
+                a, b        query bounds, scalars or arrays (one query range per item)
+                rows        return cc rows instead of cc numbers
+
+            Returns:
+                sorted array of cc numbers, or a list of them for array bounds
+        '''
+
+        scalar = np.ndim(a) == 0 and np.ndim(b) == 0
+        a, b = np.broadcast_arrays(np.atleast_1d(np.asarray(a, dtype=float)), np.atleast_1d(np.asarray(b, dtype=float)))
+        query, hits = self._matches(feature, a, b, how)
+        if not rows:
+            hits = self.cc_numbers[hits]
+        result = np.split(hits, np.cumsum(np.bincount(query, minlength=len(a)))[:-1])
+
+        return result[0] if scalar else result
+
+
+    def query_many(self, features, a, b, how='overlap'):
+        '''
+        Batched query over several features: query i asks for the ccs constraining features[i]
+        to a range matching [a[i], b[i]].
+
+            Returns:
+                DataFrame with one row per (query, matching cc): query, Feature, CC (cc number)
+        '''
+
+        features = np.asarray(features, dtype=object)
+        a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+        queries, hits = [], []
+        for feature in pd.unique(features):
+            positions = np.flatnonzero(features == feature)
+            query, rows = self._matches(feature, a[positions], b[positions], how)
+            queries.append(positions[query])
+            hits.append(rows)
+        queries = np.concatenate(queries) if queries else np.zeros(0, dtype=np.int64)
+        hits = np.concatenate(hits) if hits else np.zeros(0, dtype=np.int64)
+        order = np.lexsort((hits, queries))
+
+        return pd.DataFrame({'query': queries[order], 'Feature': features[queries[order]], 'CC': self.cc_numbers[hits[order]]})
+
+
+    def mask(self, feature, a, b, how='overlap'):
+        '''
+        Boolean array over the cc rows, True for the ccs matching one query range.
+        '''
+
+        mask = np.zeros(self.n_ccs, dtype=bool)
+        mask[self.query(feature, a, b, how, rows=True)] = True
+
+        return mask
+
+
+    def _segment(self, feature):
+        f = self._feature_ids.get(feature)
+        if f is None:
+            return 0, 0
+
+        return self.indptr[f], self.indptr[f + 1]
+
+
+    def _matches(self, feature, a, b, how):
+        # (query, cc row) pairs of the matching ranges, sorted and without duplicates
+        if how not in self.HOW:
+            raise ValueError('how must be one of {}'.format(', '.join(self.HOW)))
+        start, stop = self._segment(feature)
+        lo_sorted = self.lo_sorted[start:stop]
+        hi_sorted = self.hi_sorted[start:stop]
+        n = stop - start
+
+        # candidate windows: a prefix of the lo-sorted or a suffix of the hi-sorted ranges
+        if how == 'overlap':
+            lo_stop, hi_start = np.searchsorted(lo_sorted, b, 'right'), np.searchsorted(hi_sorted, a, 'left')
+        elif how == 'contains':
+            lo_stop, hi_start = np.searchsorted(lo_sorted, a, 'right'), np.searchsorted(hi_sorted, b, 'left')
+        if how == 'within':
+            use_lo = np.ones(len(a), dtype=bool)
+            w_start, w_stop = np.searchsorted(lo_sorted, a, 'left'), np.searchsorted(lo_sorted, b, 'right')
+        else:
+            use_lo = lo_stop <= n - hi_start
+            w_start, w_stop = np.where(use_lo, 0, hi_start), np.where(use_lo, lo_stop, n)
+
+        lengths = np.maximum(w_stop - w_start, 0)
+        query = np.repeat(np.arange(len(a)), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        position = start + np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(w_start, lengths)
+        from_lo = use_lo[query]
+        lo = np.where(from_lo, self.lo_sorted[position], self.lo_by_hi[position])
+        hi = np.where(from_lo, self.hi_by_lo[position], self.hi_sorted[position])
+        rows = np.where(from_lo, self.cc_by_lo[position], self.cc_by_hi[position])
+
+        qa, qb = a[query], b[query]
+        if how == 'overlap':
+            keep = (lo <= qb) & (hi >= qa)
+        elif how == 'within':
+            keep = (lo >= qa) & (hi <= qb)
+        else:
+            keep = (lo <= qa) & (hi >= qb)
+        pairs = np.unique(query[keep] * max(self.n_ccs, 1) + rows[keep])
+
+        return pairs // max(self.n_ccs, 1), pairs % max(self.n_ccs, 1)
+
+
+
+def kde_curves(values, n_samples=100, cut=3, chunk_size=1 << 22):
+    '''
+    Gaussian kernel density estimates (Scott's rule) of several columns at once.
+
+            values          2d array (observations x columns), nan values are ignored
+            n_samples       number of evaluation points per column
+            cut             the curve extends cut bandwidths past the extreme values
+            chunk_size      max number of (observation, column, point) terms evaluated at once
+
+        Returns:
+            xs, ys          2d arrays (columns x n_samples) of evaluation points and densities
+
+    All columns share one normalized evaluation grid, matching hvplot's .kde() output.
+    Constant or single value columns get a zero curve.
+    '''
+
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    valid = np.isfinite(values)
+    n_valid = valid.sum(axis=0)
+    n_cols = values.shape[1]
+
+    # bandwidth and support per column
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.nanstd(np.where(valid, values, np.nan), axis=0, ddof=1)
+        bw = np.where(n_valid > 1, n_valid.astype(float) ** -0.2 * std, 0)
+    lo = np.nanmin(np.where(valid, values, np.inf), axis=0)
+    hi = np.nanmax(np.where(valid, values, -np.inf), axis=0)
+    empty = n_valid == 0
+    lo[empty] = 0
+    hi[empty] = 1
+    same = lo == hi
+    lo[same] -= 0.5
+    hi[same] += 0.5
+    usable = np.isfinite(bw) & (bw > 0)
+    lo = np.where(usable, lo - cut * bw, lo)
+    hi = np.where(usable, hi + cut * bw, hi)
+
+    grid = np.linspace(0, 1, n_samples)
+    xs = lo[:, None] + grid[None, :] * (hi - lo)[:, None]
+    ys = np.zeros((n_cols, n_samples))
+
+    cols = np.flatnonzero(usable)
+    if len(cols):
+        rows_per_chunk = max(1, chunk_size // (len(cols) * n_samples))
+        safe_bw = bw[cols][None, :, None]
+        for start in range(0, values.shape[0], rows_per_chunk):
+            chunk = values[start:start + rows_per_chunk, cols]
+            d = (xs[cols][None, :, :] - chunk[:, :, None]) / safe_bw
+            ys[cols] += np.nansum(np.exp(-0.5 * d * d), axis=0)
+        ys[cols] /= (n_valid[cols] * bw[cols] * np.sqrt(2 * np.pi))[:, None]
+
+    return xs, ys
+
+
+
+class FeatureSummaries:
+    '''
+    Cached plotting summaries of the observation data, used by feature_plotter: a KDE curve
+    for each continuous (float) feature and sorted value counts for each categorical one.
+
+            data            observation DataFrame
+            n_samples       KDE evaluation points per feature
+
+    Summaries are computed lazily the first time a feature is requested; precompute() fills
+    in every feature up front, with the KDEs of all continuous features in one vectorized pass.
+    '''
+
+    def __init__(self, data, n_samples=100):
+        self.data = data
+        self.n_samples = n_samples
+        self._density = {}
+        self._counts = {}
+
+
+    def is_continuous(self, name):
+        '''
+        Float columns are treated as continuous, everything else as categorical.
+        '''
+
+        return self.data[name].dtype == 'float64'
+
+
+    def density(self, name):
+        '''
+        KDE curve (xs, ys) of a continuous feature.
+        '''
+
+        if name not in self._density:
+            xs, ys = kde_curves(self.data[name].to_numpy(dtype=float), self.n_samples)
+            self._density[name] = (xs[0], ys[0])
+
+        return self._density[name]
+
+
+    def value_counts(self, name):
+        '''
+        Value counts of a categorical feature, sorted by value.
+        '''
+
+        if name not in self._counts:
+            self._counts[name] = self.data[name].value_counts().sort_index()
+
+        return self._counts[name]
+
+
+    def precompute(self, names=None):
+        '''
+        Computes the summaries of the given features (default: all columns) up front.
+        '''
+
+        names = list(self.data.columns if names is None else names)
+        continuous = [name for name in names if self.is_continuous(name) and name not in self._density]
+        if continuous:
+            xs, ys = kde_curves(self.data[continuous].to_numpy(dtype=float), self.n_samples)
+            for i, name in enumerate(continuous):
+                self._density[name] = (xs[i], ys[i])
+        for name in names:
+            if not self.is_continuous(name):
+                self.value_counts(name)
+
+        return self
 
 
 
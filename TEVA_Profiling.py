@@ -0,0 +1,272 @@
+# Opt-in timing instrumentation for the post-processing and plotting functions.
+#
+# enable() replaces every public function (and the public methods of the public classes) of
+# TEVA_Post_Processing and TEVA_Dynamic_Plotting with a wrapper that records wall time, input
+# and output sizes and, optionally, the memory allocated per call. Bokeh document
+# serialization (full documents and the patches sent on widget changes) is timed as well.
+# disable() puts the original functions back, so nothing is wrapped and there is no overhead
+# unless profiling was switched on. Only calls made through the module attributes (e.g.
+# post.stacked_ccs) are seen, so enable() should run before the dashboard is built.
+#
+# Example:
+#           profiling.enable(memory=True)
+#           ...  build and use the dashboard
+#           print(profiling.summary())
+#           profiling.dump('TEVA_profile.csv')
+
+# Import libraries
+import json
+import time
+import inspect
+import functools
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# Columns of the per call records
+RECORD_COLUMNS = ['name', 'start_s', 'wall_ms', 'depth', 'in_size', 'out_size', 'allocated_kB', 'peak_kB']
+
+_records = deque(maxlen=100000)
+_patched = []
+_state = threading.local()
+_options = {'memory': False, 'started_tracing': False}
+_origin = time.perf_counter()
+
+
+
+# Switching on and off
+def enable(modules=None, memory=False, bokeh=True, max_records=100000):
+    '''
+    Wraps the public functions of the given modules with timing.
+
+            modules         modules to instrument (default: TEVA_Post_Processing and TEVA_Dynamic_Plotting)
+            memory          also record the memory allocated per call (tracemalloc, slows calls down)
+            bokeh           also time Bokeh document serialization and patch messages
+            max_records     only the most recent calls are kept
+
+        Returns:
+            list of the instrumented names
+    '''
+
+    global _records
+    if _patched:
+        disable()
+    if modules is None:
+        import TEVA_Post_Processing as post
+        import TEVA_Dynamic_Plotting as teva_plot
+        modules = [post, teva_plot]
+
+    _records = deque(_records, maxlen=max_records)
+    _options['memory'] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _options['started_tracing'] = True
+
+    for module in modules:
+        prefix = module.__name__.replace('TEVA_', '')
+        for name, value in list(vars(module).items()):
+            if name.startswith('_') or getattr(value, '__module__', None) != module.__name__:
+                continue
+            if inspect.isfunction(value):
+                _patch(module, name, '{}.{}'.format(prefix, name))
+            elif inspect.isclass(value):
+                for attr in list(vars(value)):
+                    if not attr.startswith('_') or attr == '__init__':
+                        _patch(value, attr, '{}.{}.{}'.format(prefix, name, attr))
+
+    if bokeh:
+        from bokeh.document import Document
+        from bokeh.protocol.messages.patch_doc import patch_doc
+        _patch(Document, 'to_json', 'bokeh.Document.to_json')
+        _patch(patch_doc, 'create', 'bokeh.patch_doc.create')
+
+    return [label for owner, name, original, label in _patched]
+
+
+
+def disable():
+    '''
+    Restores the original functions. The records are kept (see reset).
+    '''
+
+    while _patched:
+        owner, name, original, label = _patched.pop()
+        setattr(owner, name, original)
+    if _options['started_tracing']:
+        tracemalloc.stop()
+        _options['started_tracing'] = False
+    _options['memory'] = False
+
+
+
+def enabled():
+    return bool(_patched)
+
+
+
+def reset():
+    '''
+    Clears the records.
+    '''
+
+    _records.clear()
+
+
+
+def _patch(owner, name, label):
+    # wraps one function, classmethod or staticmethod attribute (others are left alone)
+    original = vars(owner)[name]
+    if isinstance(original, (classmethod, staticmethod)):
+        wrapped = type(original)(_timed(original.__func__, label))
+    elif inspect.isfunction(original):
+        wrapped = _timed(original, label)
+    else:
+        return
+    setattr(owner, name, wrapped)
+    _patched.append((owner, name, original, label))
+
+
+
+def _timed(function, label):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_state, 'depth', 0)
+        memory = _options['memory'] and tracemalloc.is_tracing()
+        if memory:
+            before = tracemalloc.get_traced_memory()[0]
+            if depth == 0:
+                tracemalloc.reset_peak()
+        _state.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            wall = time.perf_counter() - start
+            _state.depth = depth
+        record = {'name': label, 'start_s': start - _origin, 'wall_ms': wall * 1000, 'depth': depth,
+                  'in_size': max([_size(arg) for arg in list(args) + list(kwargs.values())], default=0),
+                  'out_size': _size(result), 'allocated_kB': np.nan, 'peak_kB': np.nan}
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record['allocated_kB'] = (current - before) / 1024
+            if depth == 0:
+                # nested calls share the peak of their outermost call
+                record['peak_kB'] = (peak - before) / 1024
+        _records.append(record)
+
+        return result
+
+    return wrapper
+
+
+
+def _size(value):
+    # rows of a table / length of a sequence, the largest item of a tuple
+    if isinstance(value, tuple):
+        return max([_size(item) for item in value], default=0)
+    if isinstance(value, (str, bytes)) or not hasattr(value, '__len__'):
+        return 0
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+
+@contextmanager
+def timed(label):
+    '''
+    Times a block of code as one record, e.g. a notebook callback:
+
+            with profiling.timed('update_tab'):
+                ...
+
+    Does nothing while profiling is disabled.
+    '''
+
+    if not _patched:
+        yield
+        return
+    depth = getattr(_state, 'depth', 0)
+    _state.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _state.depth = depth
+        _records.append({'name': label, 'start_s': start - _origin, 'wall_ms': (time.perf_counter() - start) * 1000,
+                         'depth': depth, 'in_size': 0, 'out_size': 0, 'allocated_kB': np.nan, 'peak_kB': np.nan})
+
+
+
+# Results
+def records():
+    '''
+    One row per recorded call, in call order.
+    '''
+
+    return pd.DataFrame(list(_records), columns=RECORD_COLUMNS)
+
+
+
+def summary():
+    '''
+    Per function call counts, total / mean / max wall time, mean input size and memory,
+    sorted by total time.
+    '''
+
+    calls = records()
+    if calls.empty:
+        return pd.DataFrame(columns=['calls', 'total_ms', 'mean_ms', 'max_ms', 'mean_in_size',
+                                     'mean_allocated_kB', 'max_peak_kB'])
+    grouped = calls.groupby('name')
+    table = pd.DataFrame({'calls': grouped.size(),
+                          'total_ms': grouped['wall_ms'].sum(),
+                          'mean_ms': grouped['wall_ms'].mean(),
+                          'max_ms': grouped['wall_ms'].max(),
+                          'mean_in_size': grouped['in_size'].mean(),
+                          'mean_allocated_kB': grouped['allocated_kB'].mean(),
+                          'max_peak_kB': grouped['peak_kB'].max()})
+
+    return table.sort_values('total_ms', ascending=False)
+
+
+
+def dump(path):
+    '''
+    Writes the summary and the per call records to .json, or the records to .csv.
+    '''
+
+    if str(path).endswith('.csv'):
+        records().to_csv(path, index=False)
+        return
+    content = {'summary': json.loads(summary().reset_index().to_json(orient='records')),
+               'records': json.loads(records().to_json(orient='records'))}
+    with open(path, 'w') as f:
+        json.dump(content, f, indent=1)
+
+
+
+def panel(title='Profiling'):
+    '''
+    Collapsible dashboard panel with the per function summary and a refresh button.
+    '''
+
+    import panel as pn
+
+    table = pn.widgets.Tabulator(summary().round(2), disabled=True, height=300, sizing_mode='stretch_width')
+    refresh = pn.widgets.Button(name='Refresh', button_type='default')
+    clear = pn.widgets.Button(name='Clear', button_type='default')
+
+    def update(event):
+        if event.obj is clear:
+            reset()
+        table.value = summary().round(2)
+
+    refresh.on_click(update)
+    clear.on_click(update)
+
+    return pn.Card(pn.Row(refresh, clear), table, title=title, collapsed=True, sizing_mode='stretch_width')
@@ -0,0 +1,280 @@
+# Headless static reports of a TEVA run.
+#
+# Renders the dashboard plots of one output class of a CC/DNF workbook pair to static HTML
+# pages, without a notebook or a Panel server: an index page with the PPV vs. COV plot and the
+# three tabbed plots, and numbered pages with the feature subplots and the confusion matrix of
+# every CC (per_page CCs per page). The post-processing runs once, then the pages are rendered
+# in a process pool, so reports with hundreds of CC panels use all cores. The pages link to each
+# other and load BokehJS from the CDN (with --inline it is embedded in every page instead, for
+# viewing offline).
+#
+# Example:
+#           python TEVA_Report.py Sample_Data/ccs_<run>.xlsx Sample_Data/dnfs_<run>.xlsx Sample_Data/test_observations.csv -o TEVA_report -j 4
+
+# Import libraries
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import TEVA_Loader as loader
+import TEVA_Observations as observations
+import TEVA_Post_Processing as post
+
+# Set in every worker process by _init_worker
+_context = None
+
+
+
+# Report data
+def report_colors():
+    '''
+    The color maps of the dashboard (CCs, DNFs, fitness contours, CC feature heatmap, categories).
+    '''
+
+    from matplotlib.pyplot import get_cmap
+    from matplotlib.colors import rgb2hex
+    from bokeh.palettes import varying_alpha_palette
+    import colorcet as cc
+
+    return {'cc_colors': [rgb2hex(get_cmap('Blues_r')(i)) for i in range(20, 220)],
+            'dnf_colors': [rgb2hex(get_cmap('Oranges_r')(i)) for i in range(20, 220)],
+            'contour_colors': varying_alpha_palette(color='black', start_alpha=150, end_alpha=10),
+            'cc_heatmap_colormap': [rgb2hex(get_cmap('Blues')(i)) for i in range(0, 256)],
+            'cat_map': cc.palette['glasbey_bw']}
+
+
+
+def prepare(ccs, dnfs, observation_file, n_grid=1000, title='TEVA report'):
+    '''
+    Runs the post-processing of one output class (as the notebook does) and summarizes the
+    observation file in one pass.
+
+        Returns:
+            dict handed to the page renderers
+    '''
+
+    archive = post.TevaArchive.from_frames(ccs, dnfs)
+    cc_features = archive.cc_features()
+    all_ccs = archive.all_ccs()
+    x_fit, y_fit, z_fit, fitness = post.fitness_contours(n_grid, dnfs, ccs)
+    feature_summaries = observations.ObservationSummaries.from_file(observation_file, columns=archive.unique_features()).precompute()
+
+    cc_plot_data = pd.DataFrame({'x_values': ccs['cov'],
+                                 'y_values': ccs['ppv'],
+                                 'min_sens': ccs['min_feat_sensitivity'],
+                                 'max_sens': ccs['max_feat_sensitivity'],
+                                 'CC': ccs['Unnamed: 0'],
+                                 'Order': ccs['order'],
+                                 'Features': cc_features})
+    dnf_plot_data = pd.DataFrame({'x_values': dnfs['cov'],
+                                  'y_values': dnfs['ppv'],
+                                  'Order': dnfs['order'],
+                                  'DNF': dnfs['Unnamed: 0'],
+                                  'CCs': all_ccs})
+
+    context = {'title': title,
+               'ccs': ccs,
+               'dnfs': dnfs,
+               'cc_features': cc_features,
+               'all_ccs': all_ccs,
+               'all_ccs_flat': post.flatten(all_ccs),
+               'all_features_flat': post.flatten(cc_features),
+               'unique_features': archive.unique_features(),
+               'incidence': post.cc_incidence_matrix(archive.unique_features(), cc_features),
+               'feature_values_by_cc': archive.feature_values_by_cc(),
+               'feature_counts': archive.feature_counts(),
+               'cc_counts': archive.cc_counts(),
+               'sens_index': archive.sensitivity_index(),
+               'fitness': fitness, 'x_fit': x_fit, 'y_fit': y_fit, 'z_fit': z_fit,
+               'cc_len': np.arange(1, max(ccs['order']) + 1, 1),
+               'dnf_len': np.arange(1, max(dnfs['order']) + 1, 1),
+               'cc_plot_data': cc_plot_data,
+               'dnf_plot_data': dnf_plot_data,
+               'feature_summaries': feature_summaries}
+    context.update(report_colors())
+
+    return context
+
+
+
+def paginate(n_ccs, per_page):
+    '''
+    Splits the CC rows into pages.
+
+        Returns:
+            list of arrays of CC rows, one per page
+    '''
+
+    return [np.arange(start, min(start + per_page, n_ccs)) for start in range(0, n_ccs, per_page)]
+
+
+
+def page_name(page):
+    return 'ccs_{:03d}.html'.format(page + 1)
+
+
+
+# Page rendering (in the worker processes)
+def _init_worker(context):
+    global _context
+    _context = context
+    import holoviews as hv
+    import hvplot.pandas
+    hv.extension('bokeh', logo=False)
+
+
+
+def _navigation(page, n_pages):
+    # markdown links between the pages, page None is the overview page
+    links = []
+    if page is not None:
+        links.append('[Overview](index.html)')
+        if page > 0:
+            links.append('[Previous]({})'.format(page_name(page - 1)))
+        if page < n_pages - 1:
+            links.append('[Next]({})'.format(page_name(page + 1)))
+    links.append('CC pages: ' + ' '.join('[{}]({})'.format(i + 1, page_name(i)) if i != page else '**{}**'.format(i + 1)
+                                         for i in range(n_pages)))
+
+    return ' | '.join(links)
+
+
+
+def _save(layout, path, title, inline):
+    from bokeh.resources import CDN, INLINE
+    layout.save(path, title=title, resources=INLINE if inline else CDN)
+
+
+
+def render_index(path, n_pages, min_sens, max_sens, inline=False, top_k=None):
+    '''
+    Overview page: the PPV vs. COV plot and the three tabbed plots at the given sensitivity range.
+    With top_k the usage bar charts show the top_k features / CCs and an 'Other' bar.
+    '''
+
+    import panel as pn
+    from bokeh.models import ColumnDataSource
+    import TEVA_Dynamic_Plotting as teva_plot
+
+    c = _context
+    start = time.perf_counter()
+    main_plot = teva_plot.CCPlot(c['fitness'], c['x_fit'], c['y_fit'], c['z_fit'], c['contour_colors'], c['cc_plot_data'], c['cc_len'],
+                                 ColumnDataSource(data=dict(c['cc_plot_data'])), c['cc_colors'], c['ccs'], c['dnf_len'], c['dnf_plot_data'],
+                                 ColumnDataSource(data=dict(c['dnf_plot_data'])), c['dnf_colors'], c['dnfs'], c['sens_index'],
+                                 lod_threshold=None)
+    main_plot.update(min_sens, max_sens)
+    tabs = pn.Tabs(
+        ('Feature Pairing', teva_plot.cc_heatmap_plotter(c['cc_heatmap_colormap'], c['unique_features'], c['cc_features'], c['cc_plot_data'],
+                                                         min_sens, max_sens, c['sens_index'], c['incidence'])),
+        ('CC: Feature Usage', teva_plot.cc_feature_usage_plot(c['ccs'], c['cc_plot_data'], c['cc_features'], c['all_features_flat'], c['cat_map'],
+                                                              c['cc_len'], min_sens, max_sens, c['sens_index'], c['feature_counts'], top_k)),
+        ('DNF: CC Usage', teva_plot.dnf_usage_plot(c['dnfs'], c['dnf_plot_data'], c['cc_plot_data'], c['all_ccs'], c['all_ccs_flat'], c['cat_map'],
+                                                   c['dnf_len'], min_sens, max_sens, c['sens_index'], c['cc_counts'], top_k)))
+    header = '# {}\n{} CCs, {} DNFs. Feature sensitivity between 10^{} and 10^{}.\n\n{}'.format(
+             c['title'], len(c['ccs']), len(c['dnfs']), min_sens, max_sens, _navigation(None, n_pages))
+    _save(pn.Column(pn.pane.Markdown(header), pn.Row(pn.pane.Bokeh(main_plot.figure), tabs)), path, c['title'], inline)
+
+    return path, time.perf_counter() - start
+
+
+
+def render_cc_page(path, page, rows, n_pages, inline=False):
+    '''
+    One page of CC panels: the feature subplots and the confusion matrix of every CC in rows.
+    '''
+
+    import panel as pn
+    import TEVA_Dynamic_Plotting as teva_plot
+
+    c = _context
+    start = time.perf_counter()
+    navigation = pn.pane.Markdown(_navigation(page, n_pages))
+    panels = [pn.pane.Markdown('# {}: CCs {} to {}'.format(c['title'], c['ccs']['Unnamed: 0'].iloc[rows[0]], c['ccs']['Unnamed: 0'].iloc[rows[-1]])),
+              navigation]
+    for row in rows:
+        meta = c['ccs'].iloc[row]
+        panels.append(pn.pane.Markdown('### CC {}\nOrder {}, PPV {:.3f}, COV {:.3f}, fitness {:.3f}. Features: {}'.format(
+                      meta['Unnamed: 0'], meta['order'], meta['ppv'], meta['cov'], meta['fitness'], ', '.join(map(str, c['cc_features'][row])))))
+        panels.append(pn.Row(teva_plot.feature_plotter(row, None, c['cc_features'], c['feature_values_by_cc'], c['feature_summaries']),
+                             teva_plot.confusion_matrix_plotter(row, c['ccs'])))
+    panels.append(pn.pane.Markdown(navigation.object))
+    _save(pn.Column(*panels), path, '{} (page {})'.format(c['title'], page + 1), inline)
+
+    return path, time.perf_counter() - start
+
+
+
+# Report
+def render_report(cc_path, dnf_path, observation_file, out_dir, output_class='High', per_page=25, jobs=None,
+                  n_grid=1000, min_sens=-np.inf, max_sens=0, inline=False, top_k=100):
+    '''
+    Renders the static report of one output class of a workbook pair.
+
+            cc_path, dnf_path   CC and DNF workbooks
+            observation_file    observation table (.csv, or .parquet with pyarrow)
+            out_dir             folder for index.html and the ccs_<page>.html pages
+            output_class        class of the CCEA_<class> / DNFEA_<class> sheets
+            per_page            CC panels per page
+            jobs                worker processes (default: all cores)
+            n_grid              fitness contour grid size
+            min_sens, max_sens  sensitivity range of the overview plots (exponents, as the sliders)
+            inline              embed BokehJS in every page instead of loading it from the CDN
+            top_k               bars of the usage bar charts, the rest are summed into an 'Other' bar (None: all)
+
+        Returns:
+            DataFrame with the rendered pages and their render times
+    '''
+
+    start = time.perf_counter()
+    ccs = loader.load_sheet(cc_path, 'CCEA_' + output_class)
+    dnfs = loader.load_sheet(dnf_path, 'DNFEA_' + output_class)
+    run = os.path.basename(cc_path)[len('ccs_'):].rsplit('.', 1)[0] if os.path.basename(cc_path).startswith('ccs_') else os.path.basename(cc_path)
+    context = prepare(ccs, dnfs, observation_file, n_grid, title='{} ({})'.format(run, output_class))
+    pages = paginate(len(ccs), per_page)
+    print('post-processing done in {:.2f} s, rendering {} CCs on {} pages'.format(time.perf_counter() - start, len(ccs), len(pages)))
+
+    os.makedirs(out_dir, exist_ok=True)
+    rendered = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(context,)) as pool:
+        futures = [pool.submit(render_index, os.path.join(out_dir, 'index.html'), len(pages), min_sens, max_sens, inline, top_k)]
+        futures += [pool.submit(render_cc_page, os.path.join(out_dir, page_name(page)), page, rows, len(pages), inline)
+                    for page, rows in enumerate(pages)]
+        for future in as_completed(futures):
+            path, seconds = future.result()
+            rendered.append({'page': os.path.basename(path), 'seconds': seconds})
+            print('{}: {:.2f} s'.format(os.path.basename(path), seconds))
+
+    print('report written to {} in {:.2f} s'.format(os.path.join(out_dir, 'index.html'), time.perf_counter() - start))
+
+    return pd.DataFrame(rendered).sort_values('page', ignore_index=True)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a static HTML report of a TEVA CC/DNF workbook pair.')
+    parser.add_argument('ccs', help='CC workbook (ccs_<run>.xlsx)')
+    parser.add_argument('dnfs', help='DNF workbook (dnfs_<run>.xlsx)')
+    parser.add_argument('observations', help='observation table (.csv or .parquet)')
+    parser.add_argument('-o', '--output', default='TEVA_report', help='output folder (default: %(default)s)')
+    parser.add_argument('-c', '--output-class', default='High', help='output class (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--per-page', type=int, default=25, help='CC panels per page (default: %(default)s)')
+    parser.add_argument('--n-grid', type=int, default=1000, help='fitness contour grid size (default: %(default)s)')
+    parser.add_argument('--min-sens', type=float, default=-np.inf, help='min. feature sensitivity exponent (default: %(default)s)')
+    parser.add_argument('--max-sens', type=float, default=0, help='max. feature sensitivity exponent (default: %(default)s)')
+    parser.add_argument('--top-k', type=int, default=100, help='bars of the usage bar charts, 0 for all (default: %(default)s)')
+    parser.add_argument('--inline', action='store_true', help='embed BokehJS in the pages (larger, works offline)')
+    args = parser.parse_args(argv)
+
+    render_report(args.ccs, args.dnfs, args.observations, args.output, args.output_class, args.per_page, args.jobs,
+                  args.n_grid, args.min_sens, args.max_sens, args.inline, args.top_k or None)
+
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
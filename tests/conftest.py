@@ -0,0 +1,87 @@
+# Shared setup of the tests: the modules are imported from the repository root, like the notebooks do,
+# the sample TEVA runs, a larger synthetic archive and observations for it are built once per session.
+
+# Import libraries
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DATA = os.path.join(ROOT, 'Sample_Data')
+SAMPLE_RUNS = ['2DOC_CAMELS_1_S_True_60_60_TEVA007', '2DOC_CAMELS_1_S_False_60_60_TEVA007']
+
+sys.path.insert(0, ROOT)
+
+import TEVA_Benchmark as bench
+import TEVA_Post_Processing as post
+
+
+
+@pytest.fixture(scope='session', params=SAMPLE_RUNS)
+def sample_sheets(request):
+    '''
+    CCEA_High and DNFEA_High sheets of one sample run.
+    '''
+
+    ccs = pd.read_excel(os.path.join(SAMPLE_DATA, 'ccs_' + request.param + '.xlsx'), sheet_name='CCEA_High')
+    dnfs = pd.read_excel(os.path.join(SAMPLE_DATA, 'dnfs_' + request.param + '.xlsx'), sheet_name='DNFEA_High')
+
+    return ccs, dnfs
+
+
+
+@pytest.fixture(scope='session')
+def sheets():
+    '''
+    CC and DNF sheets of a synthetic archive (see TEVA_Benchmark.synthetic_archive).
+    '''
+
+    return bench.synthetic_archive(n_features=25, n_ccs=400, n_dnfs=120, seed=7)
+
+
+
+@pytest.fixture(scope='session')
+def archive(sheets):
+    ccs, dnfs = sheets
+    return post.TevaArchive.from_frames(ccs, dnfs)
+
+
+
+@pytest.fixture(scope='session')
+def observations(archive):
+    '''
+    Observations for the rules of the archive: uniform values over the synthetic ranges, with
+    missing values, and a 'class' column.
+    '''
+
+    rng = np.random.default_rng(11)
+    n_obs = 1000
+    frame = pd.DataFrame({name: rng.uniform(0, 100, n_obs) for name in archive.unique_features()})
+    frame = frame.mask(rng.random(frame.shape) < 0.02)
+    frame['class'] = np.where(rng.random(n_obs) < 0.4, archive.label, 'Other')
+
+    return frame
+
+
+
+def main_plot_args(ccs, dnfs, n_grid=100):
+    '''
+    Positional inputs of TEVA_Dynamic_Plotting.CCPlot, built from CC and DNF sheets the way the
+    notebook builds them.
+    '''
+
+    from bokeh.models import ColumnDataSource
+    from bokeh.palettes import Blues256, Oranges256, varying_alpha_palette
+
+    cc_plot_data = pd.DataFrame({'x_values': ccs['cov'], 'y_values': ccs['ppv'],
+                                 'min_sens': ccs['min_feat_sensitivity'], 'max_sens': ccs['max_feat_sensitivity'],
+                                 'CC': ccs['Unnamed: 0'], 'Order': ccs['order'], 'Features': post.parse_cc(ccs)})
+    dnf_plot_data = pd.DataFrame({'x_values': dnfs['cov'], 'y_values': dnfs['ppv'], 'Order': dnfs['order'],
+                                  'DNF': dnfs['Unnamed: 0'], 'CCs': post.parse_dnf(dnfs)})
+    x_fit, y_fit, z_fit, fitness = post.fitness_contours(n_grid, dnfs, ccs)
+
+    return [fitness, x_fit, y_fit, z_fit, varying_alpha_palette(color='black', start_alpha=150, end_alpha=10),
+            cc_plot_data, np.arange(1, max(ccs['order']) + 1), ColumnDataSource(cc_plot_data), Blues256[20:220], ccs,
+            np.arange(1, max(dnfs['order']) + 1), dnf_plot_data, ColumnDataSource(dnf_plot_data), Oranges256[20:220], dnfs]
@@ -0,0 +1,86 @@
+# TevaArchive (integer-encoded CSR model) against row-by-row parsing of the sheets.
+
+# Import libraries
+import ast
+import numpy as np
+import pandas as pd
+import TEVA_Post_Processing as post
+
+
+
+def brute_cc_features(ccs):
+    # every non-empty, non-zero feature column of a row, from column 14 on
+    features = []
+    for i in range(len(ccs)):
+        values = ccs.iloc[i].iloc[14:]
+        features.append([name for name, value in values.items() if not pd.isna(value) and value != 0])
+
+    return features
+
+
+
+def brute_all_ccs(dnfs):
+    # the cc_<number> columns set to 1, without the 'cc_' prefix
+    return [[name[3:] for name, value in dnfs.iloc[i].iloc[14:].items() if value == 1] for i in range(len(dnfs))]
+
+
+
+def brute_ranges(ccs):
+    return [[ast.literal_eval(value) for value in ccs.iloc[i].iloc[14:].dropna()] for i in range(len(ccs))]
+
+
+
+def test_archive_matches_rows(sheets, archive):
+    ccs, dnfs = sheets
+    cc_features = brute_cc_features(ccs)
+    all_ccs = brute_all_ccs(dnfs)
+
+    assert archive.cc_features() == cc_features
+    assert archive.all_ccs() == all_ccs
+    assert archive.feature_values_by_cc() == brute_ranges(ccs)
+    assert list(archive.unique_features()) == list(pd.unique(post.flatten(cc_features)))
+    assert list(archive.unique_ccs()) == list(np.unique(post.flatten(all_ccs)))
+    np.testing.assert_array_equal(archive.cc_orders(), ccs['order'])
+    np.testing.assert_array_equal(archive.incidence().toarray(), post.cc_incidence_matrix(archive.feature_names, cc_features).toarray())
+
+
+
+def test_sample_archives(sample_sheets):
+    ccs, dnfs = sample_sheets
+    archive = post.TevaArchive.from_frames(ccs, dnfs)
+
+    assert archive.cc_features() == post.parse_cc(ccs)
+    assert archive.all_ccs() == post.parse_dnf(dnfs)
+    assert archive.feature_values_by_cc() == post.feature_ranges_by_cc(ccs)
+    assert archive.nbytes() > 0
+
+
+
+def test_derived_tables(sheets, archive):
+    ccs, dnfs = sheets
+    cc_plot_data = pd.DataFrame({'min_sens': ccs['min_feat_sensitivity'], 'max_sens': ccs['max_feat_sensitivity'], 'CC': ccs['Unnamed: 0']})
+    expected_index = post.SensitivityIndex.from_plot_data(cc_plot_data, pd.DataFrame({'CCs': brute_all_ccs(dnfs)}))
+    for lo, hi in [(-np.inf, 0), (-5, -1), (-2, -4)]:
+        for mask, expected in zip(archive.sensitivity_index().masks(lo, hi), expected_index.masks(lo, hi)):
+            np.testing.assert_array_equal(mask, expected)
+
+    cc_features = brute_cc_features(ccs)
+    all_ccs = brute_all_ccs(dnfs)
+    for counts, expected in [(archive.feature_counts(), post.StackedCounts(cc_features, max(ccs['order']), 'Feature')),
+                             (archive.cc_counts(), post.StackedCounts(all_ccs, max(dnfs['order']), 'CC'))]:
+        names = list(expected.names[::2]) + ['unknown']
+        got, want = counts.view(names), expected.view(names)
+        assert got[1] == want[1]
+        for column in want[0]:
+            assert list(got[0][column]) == list(want[0][column])
+
+
+
+def test_shared_feature_index(sheets, archive):
+    ccs, dnfs = sheets
+    half = post.TevaArchive.from_frames(ccs.iloc[::2].reset_index(drop=True), dnfs, feature_index=archive.feature_index)
+
+    # the second archive reuses the feature ids of the first one
+    assert half.cc_features() == brute_cc_features(ccs.iloc[::2])
+    for name, feature_id in half.feature_index.items():
+        assert archive.feature_index[name] == feature_id
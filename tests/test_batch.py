@@ -0,0 +1,122 @@
+# Batch command line: outputs of every class of every workbook pair, and restarts that skip finished runs.
+
+# Import libraries
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Batch as batch
+import TEVA_Post_Processing as post
+from conftest import SAMPLE_DATA, SAMPLE_RUNS
+
+
+
+@pytest.fixture
+def folders(tmp_path):
+    # the sample workbook pairs, plus a workbook without a pair that is ignored
+    directory = tmp_path / 'runs'
+    directory.mkdir()
+    for run in SAMPLE_RUNS:
+        for prefix in ('ccs_', 'dnfs_'):
+            shutil.copy(os.path.join(SAMPLE_DATA, prefix + run + '.xlsx'), directory)
+    shutil.copy(os.path.join(SAMPLE_DATA, 'ccs_' + SAMPLE_RUNS[0] + '.xlsx'), directory / 'ccs_unpaired.xlsx')
+
+    return str(directory), str(tmp_path / 'output')
+
+
+
+def run(folders, *options):
+    directory, output = folders
+    return batch.main([directory, '-o', output, '-j', '1', '--n-grid', '40'] + list(options))
+
+
+
+def manifest(output, run_name):
+    with open(os.path.join(output, run_name, 'manifest.json')) as f:
+        return json.load(f)
+
+
+
+def test_outputs_match_post_processing(folders, capsys):
+    directory, output = folders
+    assert run(folders) == 0
+    assert '2 workbook pairs found, 0 up to date, 2 to process' in capsys.readouterr().out
+
+    assert sorted(os.listdir(output)) == sorted(SAMPLE_RUNS)
+    for run_name in SAMPLE_RUNS:
+        info = manifest(output, run_name)
+        assert [item['class'] for item in info['classes']] == ['High', 'Low']
+        assert set(info['timings']) == set(batch.STAGES)
+        ccs = pd.read_excel(os.path.join(directory, 'ccs_' + run_name + '.xlsx'), sheet_name='CCEA_Low')
+        dnfs = pd.read_excel(os.path.join(directory, 'dnfs_' + run_name + '.xlsx'), sheet_name='DNFEA_Low')
+        cc_features = post.parse_cc(ccs)
+        with np.load(os.path.join(output, run_name, 'Low.npz')) as arrays:
+            assert post.csr_to_lists(arrays['cc_indptr'], arrays['cc_indices'], arrays['feature_names']) == cc_features
+            assert post.csr_to_lists(arrays['dnf_indptr'], arrays['dnf_indices'], arrays['cc_names']) == post.parse_dnf(dnfs)
+            np.testing.assert_array_equal(arrays['cooccurrence'], post.CC_feature_heatmap(pd.unique(post.flatten(cc_features)), cc_features))
+            np.testing.assert_array_equal(arrays['cc_meta_fitness'], ccs['fitness'])
+            assert arrays['z_fit'].shape == (40, 40)
+
+
+
+def test_restart_skips_finished_runs(folders, capsys):
+    directory, output = folders
+    run(folders)
+    first = {run_name: manifest(output, run_name) for run_name in SAMPLE_RUNS}
+    capsys.readouterr()
+
+    assert run(folders) == 0
+    assert '2 up to date, 0 to process' in capsys.readouterr().out
+    # a touched workbook reprocesses its run only, --force reprocesses every run
+    path = os.path.join(directory, 'dnfs_' + SAMPLE_RUNS[1] + '.xlsx')
+    os.utime(path, (os.stat(path).st_atime, os.stat(path).st_mtime + 60))
+    run(folders)
+    assert '1 up to date, 1 to process' in capsys.readouterr().out
+    assert manifest(output, SAMPLE_RUNS[0]) == first[SAMPLE_RUNS[0]]
+    assert manifest(output, SAMPLE_RUNS[1])['inputs'] != first[SAMPLE_RUNS[1]]['inputs']
+    run(folders, '--force')
+    assert '0 up to date, 2 to process' in capsys.readouterr().out
+
+
+
+def test_failed_run_sets_exit_status(folders, capsys):
+    directory, output = folders
+    # a damaged DNF workbook pairs the unpaired CC workbook
+    with open(os.path.join(directory, 'dnfs_unpaired.xlsx'), 'wb') as f:
+        f.write(b'not a workbook')
+
+    assert run(folders) == 1
+    printed = capsys.readouterr().out
+    assert 'unpaired: failed' in printed
+    assert '1 of 3 runs failed: unpaired' in printed
+    # the other runs are complete, the failed one has no manifest and is retried next time
+    assert all(os.path.exists(os.path.join(output, run_name, 'manifest.json')) for run_name in SAMPLE_RUNS)
+    assert not os.path.exists(os.path.join(output, 'unpaired', 'manifest.json'))
+
+
+
+def test_old_layout_is_a_failed_run(folders, capsys):
+    directory, output = folders
+    # the 12-column layout of older TEVA exports has no sensitivity columns
+    for prefix in ('ccs_', 'dnfs_'):
+        shutil.copy(os.path.join(SAMPLE_DATA, prefix + '2DOC_CAMELS.xlsx'), directory)
+
+    assert run(folders) == 1
+    printed = capsys.readouterr().out
+    assert 'min_feat_sensitivity, max_feat_sensitivity are missing (older TEVA export layout)' in printed
+    assert '1 of 3 runs failed: 2DOC_CAMELS' in printed
+    assert not os.path.exists(os.path.join(output, '2DOC_CAMELS', 'manifest.json'))
+
+
+
+def test_sidecar_options(folders, tmp_path):
+    directory, output = folders
+    assert run(folders, '--no-sidecar') == 0
+    assert not [name for name in os.listdir(directory) if name.endswith('.teva')]
+
+    cache_dir = str(tmp_path / 'sidecars')
+    assert run(folders, '--force', '--cache-dir', cache_dir) == 0
+    assert not [name for name in os.listdir(directory) if name.endswith('.teva')]
+    assert [name for name in os.listdir(cache_dir) if name.endswith('.teva')]
@@ -0,0 +1,52 @@
+# Synthetic archives follow the layout of the sample exports, and the benchmark command line flags regressions.
+
+# Import libraries
+import json
+import numpy as np
+import TEVA_Benchmark as bench
+import TEVA_Post_Processing as post
+
+
+
+def test_synthetic_layout(sheets, sample_sheets):
+    ccs, dnfs = sheets
+    sample_ccs, sample_dnfs = sample_sheets
+
+    assert list(ccs.columns[:14]) == list(sample_ccs.columns[:14]) == post.META_COLUMNS
+    assert list(dnfs.columns[:14]) == list(sample_dnfs.columns[:14])
+    assert list(dnfs.columns[14:]) == ['cc_{}'.format(i) for i in ccs['Unnamed: 0']]
+    # orders agree with the features and ccs used, and every range is [lo, hi] with lo <= hi
+    assert [len(item) for item in post.parse_cc(ccs)] == list(ccs['order'])
+    assert [len(item) for item in post.parse_dnf(dnfs)] == list(dnfs['order'])
+    indptr, indices, names, values, lo, hi = post.cc_ranges(ccs)
+    assert (lo <= hi).all()
+    assert (ccs['min_feat_sensitivity'] <= ccs['max_feat_sensitivity']).all()
+    assert (ccs[['tp', 'tn', 'fp', 'fn']].sum(axis=1) == 100).all()
+
+
+
+def test_seeded():
+    first = bench.synthetic_archive(n_features=5, n_ccs=30, seed=3)
+    second = bench.synthetic_archive(n_features=5, n_ccs=30, seed=3)
+
+    for a, b in zip(first, second):
+        assert a.equals(b)
+    assert not first[0].equals(bench.synthetic_archive(n_features=5, n_ccs=30, seed=4)[0])
+
+
+
+def test_command_line(tmp_path, capsys):
+    output = str(tmp_path / 'bench.json')
+    options = ['--features', '8', '--ccs', '50', '--repeat', '1', '--only', 'parse_cc', 'CC_feature_heatmap']
+
+    assert bench.main(options + ['-o', output]) == 0
+    with open(output) as f:
+        report = json.load(f)
+    assert [result['case'] for result in report['results']] == ['parse_cc', 'CC_feature_heatmap']
+    # a baseline that was much faster is reported as a regression
+    for result in report['results']:
+        result['seconds'] = result['seconds'] / 1000
+    with open(output, 'w') as f:
+        json.dump(report, f)
+    assert bench.main(options + ['-o', str(tmp_path / 'again.json'), '--compare', output]) == 1
+    assert np.all(bench.compare_results(output, report['results'])['ratio'] == 1)
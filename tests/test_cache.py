@@ -0,0 +1,137 @@
+# TEVA_Cache: content keys of the arguments, stored / reloaded results and eviction.
+
+# Import libraries
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Cache as cache
+import TEVA_Post_Processing as post
+
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    cache.enable(str(tmp_path))
+    cache.reset_stats()
+    yield tmp_path
+    cache.disable()
+    cache.reset_stats()
+
+
+
+def test_keys_follow_content():
+    frame = pd.DataFrame({'a': [1.0, 2.0, np.nan], 'b': ['x', 'y', None], 'c': [1, 2, 3]})
+    key = cache.argument_key(frame, [1, 'two'], {'n': 3})
+
+    assert cache.argument_key(frame.copy(), [1, 'two'], {'n': 3}) == key
+    changed = frame.copy()
+    changed.loc[1, 'b'] = 'z'
+    assert cache.argument_key(changed, [1, 'two'], {'n': 3}) != key
+    assert cache.argument_key(frame[['c', 'b', 'a']], [1, 'two'], {'n': 3}) != key
+    assert cache.argument_key(frame.astype({'c': float}), [1, 'two'], {'n': 3}) != key
+    assert cache.argument_key(frame, (1, 'two'), {'n': 3}) != key
+    assert cache.argument_key(np.arange(3)) != cache.argument_key(np.arange(3.0))
+    masked = np.ma.masked_array([1, 2, 3], mask=[0, 1, 0])
+    assert cache.argument_key(masked) != cache.argument_key(np.ma.masked_array([1, 2, 3], mask=[0, 0, 1]))
+    with pytest.raises(TypeError):
+        cache.argument_key(object())
+
+
+
+def test_results_round_trip(cache_dir):
+    calls = []
+
+    @cache.memoize
+    def compute(values, scale=2):
+        calls.append(scale)
+        masked = np.ma.masked_invalid(values * scale)
+        return masked, {'total': float(np.nansum(values)), 'items': [np.isnan(values).tolist()]}, pd.Series(values)
+
+    values = np.array([1.0, np.nan, 3.0])
+    first = compute(values)
+    second = compute(values.copy(), scale=2)
+
+    assert calls == [2]
+    np.testing.assert_array_equal(np.ma.getmaskarray(second[0]), np.ma.getmaskarray(first[0]))
+    np.testing.assert_array_equal(second[0].filled(0), first[0].filled(0))
+    assert not np.ma.getdata(second[0]).flags.writeable
+    assert second[1] == first[1]
+    pd.testing.assert_series_equal(second[2], first[2])
+    compute(values, scale=3)
+    assert calls == [2, 3]
+    stats = cache.stats().iloc[0]
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+
+def plain(values):
+    # values of an array, masked array or series, masked values as nan
+    if np.ma.isMaskedArray(values):
+        return np.ma.filled(values.astype(float), np.nan)
+    return np.asarray(values)
+
+
+
+def test_memoized_stages_match_uncached(cache_dir, sheets):
+    ccs, dnfs = sheets
+    for function, args in [(post.cc_membership, (ccs,)), (post.dnf_membership, (dnfs,)), (post.cc_ranges, (ccs,)),
+                           (post.fitness_contours, (50, dnfs, ccs))]:
+        expected = function.uncached(*args)
+        function(*args)
+        reloaded = function(*args)
+        for got, want in zip(reloaded, expected):
+            np.testing.assert_array_equal(plain(got), plain(want))
+
+    assert (cache.stats()['hits'] == 1).all()
+
+
+
+def test_eviction_keeps_the_limit(cache_dir):
+    cache.enable(str(cache_dir), max_bytes=100_000)
+
+    @cache.memoize
+    def block(i):
+        return np.full(2000, i, dtype=np.float64)
+
+    for i in range(20):
+        block(i)
+    sizes = cache.entries()['bytes']
+
+    assert sizes.sum() <= 100_000
+    assert len(sizes) < 20
+    # the most recently stored results are kept
+    block(19)
+    assert cache.stats().loc['test_cache.test_eviction_keeps_the_limit.<locals>.block', 'hits'] == 1
+    assert not any('.tmp' in name for name in os.listdir(os.path.join(cache_dir, os.listdir(cache_dir)[0])))
+
+
+
+def test_tab_statistics_not_memoized(cache_dir, sheets):
+    ccs, dnfs = sheets
+    cc_features = post.parse_cc(ccs)
+    unique_features = pd.unique(post.flatten(cc_features))
+    for function in (post.CC_feature_heatmap, post.stacked_features, post.stacked_ccs):
+        assert not hasattr(function, 'uncached')
+    post.CC_feature_heatmap(unique_features, cc_features)
+
+    assert not any('CC_feature_heatmap' in name for name in cache.stats().index)
+    assert not any('CC_feature_heatmap' in name for name in cache.entries()['function'])
+
+
+
+def test_eviction_on_a_running_total(cache_dir, monkeypatch):
+    cache.enable(str(cache_dir), max_bytes=100_000)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: scans.append(1) or entries())
+
+    @cache.memoize
+    def block(i):
+        return np.full(2000, i, dtype=np.float64)
+
+    # the folder is scanned on the first store and when the limit is passed, not on every store
+    for i in range(20):
+        block(i)
+    assert len(scans) < 10
+    assert cache.entries()['bytes'].sum() <= 100_000
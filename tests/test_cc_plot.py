@@ -0,0 +1,54 @@
+# Persistent main figure: CCPlot.update only swaps the sensitivity filter indices of one figure.
+
+# Import libraries
+import numpy as np
+import pytest
+from conftest import main_plot_args
+
+pytest.importorskip('panel')
+from bokeh.models import IndexFilter
+import TEVA_Dynamic_Plotting as teva_plot
+
+
+
+@pytest.fixture(scope='module')
+def plot_args(sample_sheets):
+    return main_plot_args(*sample_sheets)
+
+
+
+def index_filters(figure):
+    return sorted(model.indices for model in figure.references() if isinstance(model, IndexFilter))
+
+
+
+def test_update_swaps_filter_indices(plot_args):
+    main_plot = teva_plot.CCPlot(*plot_args)
+    cc_plot_data, dnf_plot_data = plot_args[5], plot_args[11]
+    models = {model.id for model in main_plot.figure.references()}
+    changes = []
+    main_plot.sens_filtered_CCs.on_change('indices', lambda attr, old, new: changes.append(new))
+
+    for min_sens, max_sens in [(-np.inf, 0), (-5, -1), (-10, 0), (-5, -1), (0, -20)]:
+        assert main_plot.update(min_sens, max_sens) is main_plot.figure
+        cc_mask = (cc_plot_data['min_sens'] >= min_sens) & (cc_plot_data['max_sens'] <= max_sens)
+        kept = set(cc_plot_data.loc[cc_mask, 'CC'])
+        dnf_mask = [set(map(int, item)) <= kept for item in dnf_plot_data['CCs']]
+        assert main_plot.sens_filtered_CCs.indices == np.flatnonzero(cc_mask).tolist()
+        assert main_plot.sens_filtered_DNFs.indices == np.flatnonzero(dnf_mask).tolist()
+    # no model was added, and an unchanged selection is not sent again
+    assert {model.id for model in main_plot.figure.references()} == models
+    n_changes = len(changes)
+    assert n_changes > 0
+    main_plot.update(0, -20)
+    assert len(changes) == n_changes
+
+
+
+def test_cc_plotter_applies_range(plot_args):
+    p = teva_plot.cc_plotter(-5, -1, *plot_args)
+    expected = teva_plot.CCPlot(*plot_args)
+    expected.update(-5, -1)
+
+    assert index_filters(p) == index_filters(expected.figure)
+    assert len(p.renderers) == len(expected.figure.renderers)
@@ -0,0 +1,68 @@
+# Cached fitness surface and contour geometry against a fresh interpolation and bokeh's contour_data.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import matplotlib.tri as tri
+import pytest
+import TEVA_Post_Processing as post
+
+
+
+def brute_surface(n_grid, dnfs, ccs):
+    # the original interpolation on the full grid
+    xplot, yplot = np.meshgrid(np.linspace(0, 1, n_grid), np.linspace(0, 1, n_grid))
+    triangles = tri.Triangulation(pd.concat([dnfs['cov'], ccs['cov']]), pd.concat([dnfs['ppv'], ccs['ppv']]))
+
+    return tri.LinearTriInterpolator(triangles, pd.concat([dnfs['fitness'], ccs['fitness']]))(xplot, yplot)
+
+
+
+def test_surface_matches_interpolation(sample_sheets):
+    ccs, dnfs = sample_sheets
+    expected = brute_surface(200, dnfs, ccs)
+    x, y, z, fitness = post.fitness_contours(200, dnfs, ccs, dtype=np.float64)
+
+    np.testing.assert_array_equal(x, np.linspace(0, 1, 200))
+    np.testing.assert_array_equal(np.ma.getmaskarray(z), np.ma.getmaskarray(expected))
+    np.testing.assert_array_equal(z.compressed(), expected.compressed())
+    # the default float32 grid and the cached grid
+    z32 = post.fitness_contours(200, dnfs, ccs)[2]
+    assert z32.dtype == np.float32 and post.fitness_contours(200, dnfs, ccs)[2] is z32
+    np.testing.assert_allclose(z32.compressed(), expected.compressed(), rtol=1e-6, atol=1e-5)
+
+
+
+def test_adaptive_surface_keeps_bands(sample_sheets):
+    ccs, dnfs = sample_sheets
+    expected = brute_surface(300, dnfs, ccs)
+    z = post.fitness_contours(300, dnfs, ccs, dtype=np.float64, adaptive=True)[2]
+    levels = post.contour_levels(pd.concat([dnfs['fitness'], ccs['fitness']]))
+
+    # the refined cells hold every contour crossing and data edge, the rest is bilinear
+    np.testing.assert_array_equal(np.ma.getmaskarray(z), np.ma.getmaskarray(expected))
+    np.testing.assert_array_equal(np.searchsorted(levels, z.compressed(), side='right'),
+                                  np.searchsorted(levels, expected.compressed(), side='right'))
+    assert np.abs(z - expected).max() < 0.01 * np.ptp(levels)
+
+
+
+def test_geometry_matches_contour_data(sample_sheets):
+    contour = pytest.importorskip('bokeh.plotting.contour')
+    ccs, dnfs = sample_sheets
+    x, y, z, fitness = post.fitness_contours(150, dnfs, ccs)
+    levels = post.contour_levels(fitness)
+    geometry = post.contour_geometry(x, y, z, levels)
+    expected = contour.contour_data(x, y, z, levels)
+
+    for got, want in [(geometry['fill_xs'], expected.fill_data.xs), (geometry['fill_ys'], expected.fill_data.ys)]:
+        assert len(got) == len(want)
+        for band, band_expected in zip(got, want):
+            assert [len(polygon) for polygon in band] == [len(polygon) for polygon in band_expected]
+            for polygon, polygon_expected in zip(band, band_expected):
+                for ring, ring_expected in zip(polygon, polygon_expected):
+                    np.testing.assert_array_equal(ring, ring_expected)
+    for got, want in [(geometry['line_xs'], expected.line_data.xs), (geometry['line_ys'], expected.line_data.ys)]:
+        for line, line_expected in zip(got, want):
+            np.testing.assert_array_equal(line, line_expected)
+    assert post.contour_geometry(x, y, z, levels) is geometry
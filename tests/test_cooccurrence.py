@@ -0,0 +1,87 @@
+# CC_feature_heatmap (sparse X^T X product) against the original triple loop.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Post_Processing as post
+
+
+
+def brute_heatmap(unique_features, cc_features):
+    # the original implementation: count every pair of distinct features per CC of order > 1
+    matrix = np.zeros((len(unique_features), len(unique_features)))
+    for i, first in enumerate(unique_features):
+        for j, second in enumerate(unique_features):
+            if first == second:
+                continue
+            for features in cc_features:
+                if len(features) != 1 and first in features and second in features:
+                    matrix[i, j] += 1
+    matrix[np.triu_indices_from(matrix, k=0)] = np.nan
+
+    return matrix
+
+
+
+@pytest.fixture(scope='module')
+def cc_features():
+    # ccs of order 1 to 4 over 30 features
+    rng = np.random.default_rng(1)
+    names = np.array(['feature_{}'.format(i) for i in range(30)])
+
+    return [list(rng.choice(names, rng.integers(1, 5), replace=False)) for _ in range(500)]
+
+
+
+def test_heatmap_matches_loop(cc_features):
+    unique_features = pd.unique(post.flatten(cc_features))
+
+    np.testing.assert_array_equal(post.CC_feature_heatmap(unique_features, cc_features),
+                                  brute_heatmap(unique_features, cc_features))
+
+
+
+def test_masked_heatmap_matches_filtered_loop(cc_features):
+    unique_features = pd.unique(post.flatten(cc_features))
+    mask = np.random.default_rng(0).random(len(cc_features)) < 0.3
+    filtered = [cc_features[i] for i in np.flatnonzero(mask)]
+    filtered_features = pd.unique(post.flatten(filtered))
+    expected = brute_heatmap(filtered_features, filtered)
+
+    np.testing.assert_array_equal(post.CC_feature_heatmap(filtered_features, cc_features, row_mask=mask), expected)
+
+    # one incidence matrix per run, sliced to the filtered features
+    incidence = post.cc_incidence_matrix(unique_features, cc_features)
+    columns = pd.Index(unique_features).get_indexer(filtered_features)
+    np.testing.assert_array_equal(post.CC_feature_heatmap(filtered_features, cc_features, row_mask=mask,
+                                                          incidence=incidence[:, columns]), expected)
+
+
+
+def test_duplicate_and_unknown_features():
+    cc_features = [['a', 'b', 'a'], ['b', 'c'], ['c'], ['a', 'x']]
+    unique_features = ['a', 'b', 'c']
+
+    np.testing.assert_array_equal(post.CC_feature_heatmap(unique_features, cc_features),
+                                  brute_heatmap(unique_features, cc_features))
+
+
+
+def test_heatmap_plotter_with_prebuilt_incidence(sample_sheets):
+    pytest.importorskip('bokeh')
+    import TEVA_Dynamic_Plotting as teva_plot
+
+    ccs, dnfs = sample_sheets
+    cc_features = post.parse_cc(ccs)
+    unique_features = pd.unique(post.flatten(cc_features))
+    cc_plot_data = pd.DataFrame({'min_sens': ccs['min_feat_sensitivity'], 'max_sens': ccs['max_feat_sensitivity'], 'CC': ccs['Unnamed: 0']})
+    incidence = post.cc_incidence_matrix(unique_features, cc_features)
+
+    for min_sens, max_sens in [(-np.inf, 0), (-5, -1), (-3, -2)]:
+        mask = (cc_plot_data['min_sens'] >= min_sens) & (cc_plot_data['max_sens'] <= max_sens)
+        filtered = [cc_features[i] for i in np.flatnonzero(mask)]
+        p = teva_plot.cc_heatmap_plotter(['#ffffff'], unique_features, cc_features, cc_plot_data, min_sens, max_sens, incidence=incidence)
+        image = p.renderers[0].data_source.data['image'][0]
+        np.testing.assert_array_equal(image, brute_heatmap(pd.unique(post.flatten(filtered)), filtered))
+        assert list(p.x_range.factors) == list(pd.unique(post.flatten(filtered)))
@@ -0,0 +1,135 @@
+# Coverage set metrics (bitwise ops on packed words) against boolean matrix / set computations.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Evaluation as evaluation
+
+
+
+@pytest.fixture(scope='module')
+def coverage(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    cc_words, n_obs = evaluation.cc_masks(rules, observations, chunk_size=128)
+    # duplicated and nested coverage, so every metric has cases to find
+    cc_words[5] = cc_words[3]
+    cc_words[9] = cc_words[3]
+    cc_words[7] = cc_words[3] | cc_words[11]
+    positives = evaluation.pack_bits((observations['class'] == archive.label).to_numpy()[None, :])[0]
+
+    return evaluation.Coverage(rules, cc_words, n_obs, positives)
+
+
+
+@pytest.fixture(scope='module')
+def hits(coverage):
+    return evaluation.unpack_bits(coverage.cc_words, coverage.n_obs), evaluation.unpack_bits(coverage.positives[None, :], coverage.n_obs)[0]
+
+
+
+def test_scores_match_evaluate(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    cc_scores, dnf_scores = evaluation.Coverage.from_observations(rules, observations, 'class', chunk_size=64).scores()
+    expected = evaluation.evaluate(rules, observations, 'class')
+
+    pd.testing.assert_frame_equal(cc_scores, expected[0])
+    pd.testing.assert_frame_equal(dnf_scores, expected[1])
+
+
+
+def test_overlap_and_jaccard(coverage, hits):
+    H = hits[0].astype(np.int64)
+    intersections = H @ H.T
+    sizes = H.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - intersections
+
+    np.testing.assert_array_equal(coverage.overlap(), intersections)
+    np.testing.assert_array_equal(coverage.overlap(max_cells=5), intersections)
+    jaccard = coverage.jaccard()
+    np.testing.assert_allclose(jaccard[union > 0], intersections[union > 0] / union[union > 0])
+    assert np.isnan(jaccard[union == 0]).all()
+
+
+
+@pytest.mark.parametrize('threshold', [1.0, 0.5])
+def test_redundant_pairs(coverage, hits, threshold):
+    H = hits[0]
+    numbers = list(coverage.rules.cc_numbers)
+    intersections = H.astype(np.int64) @ H.T.astype(np.int64)
+    sizes = H.sum(axis=1)
+    a, b = np.nonzero((intersections >= threshold * sizes[:, None]) & (sizes[:, None] > 0))
+    expected = {(numbers[i], numbers[j]) for i, j in zip(a, b) if i != j}
+    pairs = coverage.redundant_pairs(threshold)
+
+    assert set(zip(pairs['CC'], pairs['covered_by'])) == expected
+    assert (numbers[3], numbers[7]) in expected
+    for row in pairs.itertuples():
+        i, j = numbers.index(row.CC), numbers.index(row.covered_by)
+        assert row.identical == (H[i] == H[j]).all()
+
+
+
+def test_marginal_contributions(coverage, hits):
+    H, positive = hits
+    rules = coverage.rules
+    rows = []
+    for k in range(rules.n_dnfs):
+        entries = rules.dnf_cc[rules.dnf_indptr[k]:rules.dnf_indptr[k + 1]]
+        sets = [H[e] if e >= 0 else np.zeros(coverage.n_obs, dtype=bool) for e in entries]
+        for m, covered in enumerate(sets):
+            others = np.zeros(coverage.n_obs, dtype=bool)
+            for q, other in enumerate(sets):
+                if q != m:
+                    others |= other
+            unique = covered & ~others
+            rows.append((covered.sum(), unique.sum(), (unique & positive).sum()))
+    expected = np.array(rows).reshape(-1, 3)
+    contributions = coverage.marginal_contributions()
+
+    np.testing.assert_array_equal(contributions[['covered', 'unique', 'unique_tp']].to_numpy(), expected)
+    np.testing.assert_array_equal(contributions['unique_fp'], expected[:, 1] - expected[:, 2])
+
+
+
+def test_minimal_archive(coverage, hits):
+    H, positive = hits
+    numbers = list(coverage.rules.cc_numbers)
+    orders = np.diff(coverage.rules.cc_indptr)
+    tp, fp = H & positive, H & ~positive
+
+    def dominates(j, i):
+        return (tp[i] <= tp[j]).all() and (fp[j] <= fp[i]).all()
+
+    archive = coverage.minimal_archive()
+    kept = np.flatnonzero(archive['keep'])
+    for i, row in enumerate(archive.itertuples()):
+        j = numbers.index(row.representative)
+        assert archive['keep'].iloc[j]
+        if row.keep:
+            assert j == i
+        elif row.reason == 'dominated':
+            assert dominates(j, i)
+    for i in kept:
+        for j in kept:
+            assert i == j or not dominates(j, i)
+
+    # duplicates only: one cc per distinct coverage, the lowest order (then first) one
+    archive = coverage.minimal_archive(dominated=False)
+    groups = {}
+    for j in range(len(H)):
+        groups.setdefault(H[j].tobytes(), []).append(j)
+    assert archive['keep'].sum() == len(groups)
+    for i, row in enumerate(archive.itertuples()):
+        assert numbers.index(row.representative) == min(groups[H[i].tobytes()], key=lambda j: (orders[j], j))
+    assert not archive['keep'].iloc[5] and archive['reason'].iloc[5] == 'duplicate'
+
+
+
+def test_metrics_without_target(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    coverage = evaluation.Coverage.from_observations(rules, observations)
+
+    with pytest.raises(ValueError):
+        coverage.minimal_archive()
+    assert 'unique_tp' not in coverage.marginal_contributions()
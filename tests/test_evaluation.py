@@ -0,0 +1,82 @@
+# Bit-packed CC/DNF evaluation against a direct evaluation of the feature ranges.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Evaluation as evaluation
+
+
+
+def brute_hits(archive, observations):
+    # a cc covers an observation when every feature value lies in its [lo, hi] range
+    cc_hits = np.ones((archive.n_ccs, len(observations)), dtype=bool)
+    for i, (features, ranges) in enumerate(zip(archive.cc_features(), archive.feature_values_by_cc())):
+        for feature, (lo, hi) in zip(features, ranges):
+            x = observations[feature].to_numpy()
+            cc_hits[i] &= (x >= lo) & (x <= hi)
+    # a dnf covers an observation when one of its ccs does
+    rows = {str(number): i for i, number in enumerate(archive.cc_numbers)}
+    dnf_hits = np.zeros((len(archive.all_ccs()), len(observations)), dtype=bool)
+    for k, ccs in enumerate(archive.all_ccs()):
+        for cc in ccs:
+            if cc in rows:
+                dnf_hits[k] |= cc_hits[rows[cc]]
+
+    return cc_hits, dnf_hits
+
+
+
+def brute_scores(hits, positive):
+    tp = (hits & positive).sum(axis=1)
+    fp = (hits & ~positive).sum(axis=1)
+    fn = positive.sum() - tp
+    tn = (~positive).sum() - fp
+
+    return tp, fn, fp, tn
+
+
+
+def test_evaluate_matches_ranges(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    cc_scores, dnf_scores = evaluation.evaluate(rules, observations, 'class', chunk_size=128)
+    positive = (observations['class'] == archive.label).to_numpy()
+
+    for table, hits in zip((cc_scores, dnf_scores), brute_hits(archive, observations)):
+        tp, fn, fp, tn = brute_scores(hits, positive)
+        np.testing.assert_array_equal(table['tp'], tp)
+        np.testing.assert_array_equal(table['fn'], fn)
+        np.testing.assert_array_equal(table['fp'], fp)
+        np.testing.assert_array_equal(table['tn'], tn)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.testing.assert_allclose(table['ppv'], tp / (tp + fp))
+
+
+
+def test_chunked_input_matches_frame(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    expected = evaluation.evaluate(rules, observations, 'class')
+    chunks = (observations.iloc[start:start + 77] for start in range(0, len(observations), 77))
+    streamed = evaluation.evaluate(rules, chunks, 'class', chunk_size=64)
+
+    pd.testing.assert_frame_equal(streamed[0], expected[0])
+    pd.testing.assert_frame_equal(streamed[1], expected[1])
+
+
+
+def test_packed_masks(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    words, n_obs = evaluation.cc_masks(rules, observations, chunk_size=64)
+    cc_hits, dnf_hits = brute_hits(archive, observations)
+
+    assert n_obs == len(observations)
+    np.testing.assert_array_equal(evaluation.unpack_bits(words, n_obs), cc_hits)
+    np.testing.assert_array_equal(evaluation.popcount(words), cc_hits.sum(axis=1))
+    np.testing.assert_array_equal(evaluation.unpack_bits(evaluation.dnf_bits(rules, words), n_obs), dnf_hits)
+
+
+
+def test_missing_feature_columns(archive, observations):
+    rules = evaluation.RuleSet.from_archive(archive)
+    with pytest.raises(ValueError):
+        evaluation.evaluate(rules, observations.drop(columns=archive.unique_features()[0]), 'class')
@@ -0,0 +1,118 @@
+# Compact HTML export: smaller than the full document, with the same plotted data, and the live dashboard unchanged.
+
+# Import libraries
+import os
+import json
+import numpy as np
+import pytest
+from conftest import main_plot_args
+
+pn = pytest.importorskip('panel')
+from bokeh.models import ColumnDataSource, HoverTool
+from bokeh.plotting import figure
+import TEVA_Dynamic_Plotting as teva_plot
+import TEVA_Export as export
+
+
+
+@pytest.fixture(scope='module')
+def plot_args(sheets):
+    return main_plot_args(*sheets)
+
+
+
+def source_data(doc):
+    return {model.id: dict(model.data) for model in export.document_models(doc) if isinstance(model, ColumnDataSource)}
+
+
+
+def assert_compacted(compacted, original):
+    # float32 / int32 columns hold the original values to float32 precision
+    if isinstance(original, (list, tuple)) and len(original) and isinstance(original[0], (list, tuple, np.ndarray)):
+        assert len(compacted) == len(original)
+        for a, b in zip(compacted, original):
+            assert_compacted(a, b)
+    elif isinstance(original, np.ndarray) and original.dtype.kind in 'fiu':
+        assert compacted.dtype in (np.float32, np.int32)
+        np.testing.assert_allclose(compacted, original, rtol=1e-6)
+    else:
+        assert list(compacted) == list(original)
+
+
+
+def test_compact_values():
+    values = np.random.default_rng(3).normal(size=100)
+    assert export.compact_values(values).dtype == np.float32
+    assert export.compact_values(np.arange(10)).dtype == np.int32
+    assert export.compact_values(np.array([0, 2**40])).dtype == np.int64
+    assert export.compact_values(['a', 'b']) == ['a', 'b']
+    nested = export.compact_values([[values[:3], values[3:5]], [values[5:9]]])
+    assert_compacted(nested, [[values[:3], values[3:5]], [values[5:9]]])
+
+
+
+def test_unused_columns_dropped_and_identical_sources_shared():
+    x = np.linspace(0, 1, 50)
+    data = {'x': x, 'y': x ** 2, 'unused': np.ones(50), 'name': ['cc'] * 50}
+    p = figure()
+    p.scatter('x', 'y', source=ColumnDataSource(data))
+    p.scatter('x', 'y', source=ColumnDataSource(data), size=12)
+    p.add_tools(HoverTool(tooltips=[('CC', '@name')]))
+    doc = export.document_copy(pn.pane.Bokeh(p))
+
+    assert export.compact_sources(doc) == (2, 1)
+    sources = {renderer.data_source.id for renderer in export.document_models(doc) if hasattr(renderer, 'data_source')}
+    assert len(sources) == 1
+    # the live figure keeps both sources and all their columns
+    renderers = p.renderers
+    assert renderers[0].data_source is not renderers[1].data_source
+    assert set(renderers[0].data_source.data) == {'x', 'y', 'unused', 'name'}
+
+
+
+def test_export_smaller_with_the_same_data(plot_args, tmp_path):
+    main_plot = teva_plot.CCPlot(*plot_args)
+    main_plot.update(-8, 0)
+    app = pn.Column(pn.pane.Bokeh(main_plot.figure))
+    live = source_data(export.document_copy(app))
+
+    report = export.export_dashboard(app, str(tmp_path / 'dashboard.html'), contour_grid=plot_args[1:4], contour_size=50)
+    assert os.path.exists(tmp_path / 'dashboard.html')
+    assert report['component'].iloc[-1] == 'total'
+    assert report['kB'].iloc[-1] < report.attrs['uncompacted_document_kB']
+
+    # the compacted document plots the same values: every used column is kept to float32 precision
+    doc = export.document_copy(app)
+    original = source_data(doc)
+    used = export.used_columns(doc)
+    export.compact_sources(doc)
+    for source_id, data in source_data(doc).items():
+        keep = used.get(source_id)
+        assert set(data) == (set(original[source_id]) if keep is None else set(original[source_id]) & keep)
+        for name, values in data.items():
+            assert_compacted(values, original[source_id][name])
+
+    # the live dashboard is not modified by the export
+    assert main_plot.sens_filtered_CCs.indices == np.flatnonzero(main_plot.sens_index.masks(-8, 0)[0]).tolist()
+    assert {key: set(values) for key, values in source_data(export.document_copy(app)).items()} == \
+           {key: set(values) for key, values in live.items()}
+    assert plot_args[7].data['x_values'].dtype == np.float64
+
+
+
+def test_sidecars_hold_the_source_data(plot_args, tmp_path):
+    app = pn.Column(pn.pane.Bokeh(teva_plot.CCPlot(*plot_args).figure))
+    report = export.export_dashboard(app, str(tmp_path / 'dashboard.html'), sidecars=True, sidecar_min_kb=1)
+    folder = tmp_path / 'dashboard_data'
+    assert (report['location'] == 'sidecar').any()
+    assert report['kB'].iloc[-1] * 1024 == pytest.approx(os.path.getsize(tmp_path / 'dashboard.html')
+                                                         + sum(os.path.getsize(folder / name) for name in os.listdir(folder)))
+
+    # the CC x values are stored as a float32 typed array file
+    values = plot_args[5]['x_values'].to_numpy()
+    stored = [np.fromfile(folder / name, dtype=np.float32) for name in os.listdir(folder) if name.endswith('.bin')]
+    assert any(len(array) == len(values) and np.allclose(array, values, rtol=1e-6) for array in stored)
+    for name in os.listdir(folder):
+        if name.endswith('.json'):
+            with open(folder / name) as f:
+                json.load(f)
@@ -0,0 +1,68 @@
+# Cached KDE curves and value counts of the observation data against scipy's gaussian_kde and pandas.
+
+# Import libraries
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Post_Processing as post
+from conftest import SAMPLE_DATA
+
+
+
+@pytest.fixture(scope='module')
+def data():
+    return pd.read_csv(os.path.join(SAMPLE_DATA, 'test_observations.csv'))
+
+
+
+def brute_kde(values, n_samples=100, cut=3):
+    # hvplot's .kde(): Scott's rule, evaluated from cut bandwidths below the minimum to cut above the maximum
+    stats = pytest.importorskip('scipy.stats')
+    values = values[np.isfinite(values)]
+    kde = stats.gaussian_kde(values)
+    bw = kde.factor * values.std(ddof=1)
+    xs = np.linspace(values.min() - cut * bw, values.max() + cut * bw, n_samples)
+
+    return xs, kde(xs)
+
+
+
+def test_curves_match_gaussian_kde(data):
+    continuous = data.select_dtypes('float').columns
+    xs, ys = post.kde_curves(data[continuous].to_numpy(), chunk_size=5000)
+
+    for i, name in enumerate(continuous):
+        x_ref, y_ref = brute_kde(data[name].to_numpy())
+        np.testing.assert_allclose(xs[i], x_ref)
+        np.testing.assert_allclose(ys[i], y_ref, rtol=1e-9, atol=1e-12)
+
+
+
+@pytest.mark.filterwarnings('ignore:Degrees of freedom')
+def test_degenerate_columns():
+    values = np.array([[2.0, np.nan, 1.0], [2.0, np.nan, np.nan], [2.0, np.nan, np.nan]])
+    xs, ys = post.kde_curves(values, n_samples=5)
+
+    # constant, empty and single value columns get a zero curve around the value
+    np.testing.assert_array_equal(ys, 0)
+    np.testing.assert_allclose(xs[0], np.linspace(1.5, 2.5, 5))
+    np.testing.assert_allclose(xs[1], np.linspace(0, 1, 5))
+    np.testing.assert_allclose(xs[2], np.linspace(0.5, 1.5, 5))
+
+
+
+def test_summaries_are_cached(data):
+    lazy = post.FeatureSummaries(data)
+    eager = post.FeatureSummaries(data).precompute()
+
+    for name in data.columns:
+        assert lazy.is_continuous(name) == (data[name].dtype == 'float64')
+        if lazy.is_continuous(name):
+            xs, ys = lazy.density(name)
+            np.testing.assert_allclose(eager.density(name)[1], ys, rtol=1e-9, atol=1e-12)
+            assert lazy.density(name)[0] is xs
+        else:
+            counts = lazy.value_counts(name)
+            pd.testing.assert_series_equal(counts, data[name].value_counts().sort_index())
+            assert eager.value_counts(name) is eager.value_counts(name)
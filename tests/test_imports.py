@@ -0,0 +1,48 @@
+# Deferred imports: the TEVA modules import without the plotting and scipy packages, which load on first use.
+
+# Import libraries
+import json
+import subprocess
+import sys
+import TEVA_Benchmark as bench
+from conftest import ROOT
+
+
+
+def loaded_after(code):
+    # top-level packages loaded after running code in a fresh interpreter
+    script = code + '\nimport sys, json\nprint(json.dumps(sorted(set(name.split(".")[0] for name in sys.modules))))'
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+    return set(json.loads(output.splitlines()[-1]))
+
+
+
+def test_modules_do_not_load_deferred_packages():
+    for module in bench.IMPORT_MODULES:
+        assert bench.measure_import(module, repeat=1)['deferred_loaded'] == [], module
+
+
+
+def test_packages_load_on_first_use():
+    loaded = loaded_after('import TEVA_Benchmark as bench, TEVA_Post_Processing as post\n'
+                          'ccs, dnfs = bench.synthetic_archive(n_features=5, n_ccs=20, n_dnfs=5, seed=1)\n'
+                          'post.fitness_contours(20, dnfs, ccs)\n'
+                          'post.TevaArchive.from_frames(ccs, dnfs).incidence()')
+    assert {'matplotlib', 'scipy'} <= loaded
+    assert not {'bokeh', 'panel', 'holoviews'} & loaded
+
+    loaded = loaded_after('import TEVA_Dynamic_Plotting as teva_plot\n'
+                          'teva_plot.TabUpdater')
+    assert not {'bokeh', 'panel', 'holoviews'} & loaded
+
+
+
+def test_import_benchmark_command_line(tmp_path, capsys):
+    output = str(tmp_path / 'imports.json')
+
+    assert bench.main(['--imports', '--only', 'TEVA_Loader', 'TEVA_Batch', '--repeat', '1', '-o', output]) == 0
+    with open(output) as f:
+        report = json.load(f)
+    assert [result['case'] for result in report['results']] == ['import TEVA_Loader', 'import TEVA_Batch']
+    assert all(result['seconds'] > 0 and result['deferred_loaded'] == [] for result in report['results'])
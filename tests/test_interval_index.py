@@ -0,0 +1,50 @@
+# FeatureIntervalIndex (sorted ranges, binary search) against scanning every cc range.
+
+# Import libraries
+import numpy as np
+import pytest
+import TEVA_Post_Processing as post
+
+
+
+def brute_query(archive, feature, a, b, how):
+    # cc numbers with a range of `feature` matching [a, b], all bounds inclusive
+    rows = np.repeat(np.arange(archive.n_ccs), archive.cc_orders())
+    lo, hi = archive.range_lo, archive.range_hi
+    match = {'overlap': (lo <= b) & (hi >= a), 'within': (lo >= a) & (hi <= b), 'contains': (lo <= a) & (hi >= b)}[how]
+    used = archive.feature_names[archive.cc_feature] == feature
+
+    return np.unique(archive.cc_numbers[rows[used & match & ~np.isnan(lo)]])
+
+
+
+@pytest.mark.parametrize('how', post.FeatureIntervalIndex.HOW)
+def test_queries_match_scan(archive, how):
+    index = archive.interval_index()
+    rng = np.random.default_rng(4)
+    for feature in index.features():
+        lo, hi = index.bounds(feature)
+        a = np.r_[rng.uniform(lo - 1, hi + 1, 20), lo, hi]
+        b = np.r_[a[:20] + rng.exponential((hi - lo) / 3 + 1e-9, 20), lo, hi]
+        results = index.query(feature, a, b, how)
+        counts = index.counts(feature, a, b, how)
+        for i in range(len(a)):
+            expected = brute_query(archive, feature, a[i], b[i], how)
+            np.testing.assert_array_equal(results[i], expected)
+            assert counts[i] == len(expected)
+        np.testing.assert_array_equal(index.query(feature, a[0], b[0], how), results[0])
+        np.testing.assert_array_equal(archive.cc_numbers[index.mask(feature, a[0], b[0], how)], results[0])
+
+
+
+def test_query_many_matches_scan(archive):
+    index = archive.interval_index()
+    rng = np.random.default_rng(8)
+    features = rng.choice(index.features(), 200)
+    a = rng.uniform(0, 90, 200)
+    b = a + rng.uniform(0, 20, 200)
+    table = index.query_many(features, a, b)
+
+    for i in range(200):
+        np.testing.assert_array_equal(table.loc[table['query'] == i, 'CC'].to_numpy(), brute_query(archive, features[i], a[i], b[i], 'overlap'))
+    assert (table['Feature'].to_numpy() == features[table['query'].to_numpy()]).all()
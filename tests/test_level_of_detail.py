@@ -0,0 +1,80 @@
+# Level-of-detail main figure: binned densities of the points in view, and the points themselves once few enough.
+
+# Import libraries
+import numpy as np
+import pytest
+import TEVA_Post_Processing as post
+from conftest import main_plot_args
+
+pytest.importorskip('panel')
+from bokeh.events import RangesUpdate
+from bokeh.models import ColumnDataSource
+import TEVA_Dynamic_Plotting as teva_plot
+
+
+
+@pytest.fixture(scope='module')
+def plot_args(sheets):
+    return main_plot_args(*sheets, n_grid=50)
+
+
+
+@pytest.fixture
+def main_plot(plot_args):
+    return teva_plot.CCPlot(*plot_args, lod_threshold=100, max_points=40, lod_bins=16)
+
+
+
+def in_view(data, mask, x0, x1, y0, y1):
+    x = data['x_values'].to_numpy()
+    y = data['y_values'].to_numpy()
+    return mask & (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+
+
+
+def test_binned_density_matches_counting():
+    rng = np.random.default_rng(6)
+    x = rng.uniform(-0.2, 1.2, 5000)
+    y = rng.beta(2, 5, 5000)
+    image = post.binned_density(x, y, (1, 0), (0, 1), bins=10)
+    expected = np.zeros((10, 10))
+    inside = (x >= 0) & (x <= 1)
+    np.add.at(expected, (np.minimum((y[inside] * 10).astype(int), 9), np.minimum((x[inside] * 10).astype(int), 9)), 1)
+
+    np.testing.assert_array_equal(np.nan_to_num(image), expected)
+    assert np.isnan(image[expected == 0]).all()
+
+
+
+def test_densities_then_points_in_view(main_plot, plot_args):
+    cc_plot_data, dnf_plot_data = plot_args[5], plot_args[11]
+    assert main_plot.lod
+
+    # the whole archive is too many points: only the binned densities of the sensitivity range are sent
+    main_plot.update(-8, 0)
+    cc_mask, dnf_mask = main_plot.sens_index.masks(-8, 0)
+    assert main_plot.cc_density.visible and main_plot.cc_view_source.data['CC'] == []
+    assert np.nansum(main_plot.cc_density.data_source.data['image'][0]) == cc_mask.sum()
+    assert np.nansum(main_plot.dnf_density.data_source.data['image'][0]) == dnf_mask.sum()
+
+    # zoomed in far enough, the points in view are sent with their tooltip columns
+    main_plot.figure._trigger_event(RangesUpdate(main_plot.figure, x0=0.1, x1=0.2, y0=0.2, y1=0.4))
+    cc_rows = in_view(cc_plot_data, cc_mask, 0.1, 0.2, 0.2, 0.4)
+    dnf_rows = in_view(dnf_plot_data, dnf_mask, 0.1, 0.2, 0.2, 0.4)
+    assert 0 < cc_rows.sum() + dnf_rows.sum() <= 40
+    assert not main_plot.cc_density.visible
+    assert list(main_plot.cc_view_source.data['CC']) == cc_plot_data.loc[cc_rows, 'CC'].tolist()
+    assert main_plot.cc_view_source.data['Features'] == cc_plot_data.loc[cc_rows, 'Features'].tolist()
+    assert list(main_plot.dnf_view_source.data['DNF']) == dnf_plot_data.loc[dnf_rows, 'DNF'].tolist()
+
+
+
+def test_small_archives_keep_full_sources(plot_args):
+    cc_plot_source = ColumnDataSource(plot_args[5])
+    main_plot = teva_plot.CCPlot(*plot_args[:7], cc_plot_source, *plot_args[8:])
+    main_plot.update(-8, 0)
+
+    # below the threshold the full sources are plotted and filtered as before
+    assert not main_plot.lod
+    assert all(renderer.data_source is cc_plot_source for renderer in main_plot.cc_renderers)
+    assert main_plot.sens_filtered_CCs.indices == np.flatnonzero(main_plot.sens_index.masks(-8, 0)[0]).tolist()
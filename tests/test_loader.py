@@ -0,0 +1,115 @@
+# Sidecar cache of the workbooks: round trip against pd.read_excel, and when a sidecar is reused or rebuilt.
+
+# Import libraries
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Loader as loader
+import TEVA_Post_Processing as post
+from conftest import SAMPLE_DATA, SAMPLE_RUNS
+
+SHEETS = {'ccs': 'CCEA_High', 'dnfs': 'DNFEA_High'}
+
+
+
+@pytest.fixture(params=sorted(SHEETS))
+def workbook(request, tmp_path):
+    # a copy of a sample workbook, so the sidecars are written next to it in tmp_path
+    path = str(tmp_path / '{}_{}.xlsx'.format(request.param, SAMPLE_RUNS[0]))
+    shutil.copy(os.path.join(SAMPLE_DATA, os.path.basename(path)), path)
+
+    return path, SHEETS[request.param]
+
+
+
+def no_excel(*args, **kwargs):
+    raise AssertionError('the workbook was read instead of its sidecar')
+
+
+
+def test_round_trip(workbook, monkeypatch):
+    path, sheet_name = workbook
+    expected = pd.read_excel(path, sheet_name=sheet_name)
+
+    pd.testing.assert_frame_equal(loader.load_sheet(path, sheet_name), expected)
+    assert os.path.isfile(os.path.join(loader.sidecar_dir(path, sheet_name), 'manifest.json'))
+    monkeypatch.setattr(pd, 'read_excel', no_excel)
+    pd.testing.assert_frame_equal(loader.load_sheet(path, sheet_name), expected)
+
+
+
+def test_parsed_arrays(workbook):
+    path, sheet_name = workbook
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    parsed = loader.load_parsed(path, sheet_name)
+
+    if sheet_name == 'DNFEA_High':
+        expected = post.dnf_membership(df)
+    else:
+        indptr, indices, names, values, lo, hi = post.cc_ranges(df)
+        expected = indptr, indices, names
+        assert [post.parse_range(item) for item in parsed['ranges']] == values
+        np.testing.assert_array_equal(parsed['lo'], lo)
+        np.testing.assert_array_equal(parsed['hi'], hi)
+    np.testing.assert_array_equal(parsed['indptr'], expected[0])
+    np.testing.assert_array_equal(parsed['indices'], expected[1])
+    assert list(parsed['names']) == list(expected[2])
+    np.testing.assert_array_equal(parsed['meta']['fitness'], df['fitness'])
+
+
+
+def test_touched_workbook_is_reused(workbook, monkeypatch):
+    path, sheet_name = workbook
+    loader.load_sheet(path, sheet_name)
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 60))
+
+    monkeypatch.setattr(pd, 'read_excel', no_excel)
+    manifest, arrays = loader.read_sidecar(path, sheet_name)
+    assert manifest['mtime'] == os.stat(path).st_mtime
+
+
+
+def test_changed_workbook_is_rebuilt(workbook):
+    path, sheet_name = workbook
+    original = loader.load_sheet(path, sheet_name)
+    changed = original.copy()
+    changed.loc[0, 'fitness'] = -1.0
+    changed.to_excel(path, sheet_name=sheet_name, index=False)
+
+    assert loader.read_sidecar(path, sheet_name) is None
+    assert loader.load_sheet(path, sheet_name).loc[0, 'fitness'] == -1.0
+    assert loader.read_sidecar(path, sheet_name) is not None
+
+
+
+def test_version_and_cache_dir(workbook, tmp_path, monkeypatch):
+    path, sheet_name = workbook
+    cache_dir = str(tmp_path / 'cache')
+    os.makedirs(cache_dir)
+    loader.load_sheet(path, sheet_name, cache_dir=cache_dir)
+
+    # the sidecar goes to cache_dir only, and a layout change makes it stale
+    assert os.listdir(cache_dir) == [os.path.basename(loader.sidecar_dir(path, sheet_name))]
+    assert not any(name.endswith('.teva') for name in os.listdir(os.path.dirname(path)))
+    assert loader.read_sidecar(path, sheet_name, cache_dir) is not None
+    monkeypatch.setattr(loader, 'SIDECAR_VERSION', loader.SIDECAR_VERSION + 1)
+    assert loader.read_sidecar(path, sheet_name, cache_dir) is None
+
+
+
+def test_invalid_dnf_indicators(tmp_path):
+    dnfs = pd.read_excel(os.path.join(SAMPLE_DATA, 'dnfs_' + SAMPLE_RUNS[0] + '.xlsx'), sheet_name='DNFEA_High')
+    column = dnfs.columns[20]
+    dnfs[column] = dnfs[column].astype(float)
+    dnfs.loc[3, column] = 0.5
+    path = str(tmp_path / 'dnfs_invalid.xlsx')
+    dnfs.to_excel(path, sheet_name='DNFEA_High', index=False)
+
+    # the sheet is reported instead of being parsed as a CC sheet, and no sidecar is left behind
+    with pytest.raises(ValueError, match=r"0/1 indicators, found 0\.5 in row 3, column {}".format(column)):
+        loader.load_sheet(path, 'DNFEA_High')
+    assert os.listdir(tmp_path) == ['dnfs_invalid.xlsx']
+    pd.testing.assert_frame_equal(loader.load_sheet(path, 'DNFEA_High', use_cache=False), pd.read_excel(path, sheet_name='DNFEA_High'))
@@ -0,0 +1,99 @@
+# One-pass ObservationSummaries against the in-memory post.FeatureSummaries and pandas.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Observations as observations
+import TEVA_Post_Processing as post
+
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(5)
+    n = 3000
+    frame = pd.DataFrame({'area': rng.lognormal(3, 1, n),
+                          'slope': rng.normal(-2, 5, n),
+                          'soil': rng.integers(1, 8, n),
+                          'cover': rng.choice(['forest', 'crops', 'urban', 'water'], n)})
+    frame.loc[rng.random(n) < 0.05, 'slope'] = np.nan
+
+    return frame
+
+
+
+@pytest.mark.parametrize('chunksize', [10000, 333, 7])
+def test_summaries_match_in_memory(data, tmp_path, chunksize):
+    path = tmp_path / 'observations.csv'
+    data.to_csv(path, index=False)
+    summaries = observations.ObservationSummaries.from_file(path, chunksize=chunksize)
+    expected = post.FeatureSummaries(pd.read_csv(path))
+
+    for name in data.columns:
+        assert summaries.is_continuous(name) == expected.is_continuous(name)
+        if expected.is_continuous(name):
+            xs, ys = summaries.density(name)
+            x_ref, y_ref = expected.density(name)
+            np.testing.assert_allclose(xs, x_ref)
+            np.testing.assert_allclose(ys, y_ref, atol=1e-2 * y_ref.max())
+            values = data[name].dropna()
+            stats = summaries.stats(name)
+            assert stats['count'] == len(values)
+            np.testing.assert_allclose([stats['mean'], stats['std'], stats['min'], stats['max']],
+                                       [values.mean(), values.std(), values.min(), values.max()])
+            assert summaries.histogram(name)[1].sum() == len(values)
+        else:
+            pd.testing.assert_series_equal(summaries.value_counts(name), expected.value_counts(name))
+
+
+
+def test_merge_matches_one_pass(data):
+    whole = observations.ObservationSummaries().update(data)
+    merged = observations.ObservationSummaries().update(data.iloc[:1100]).merge(observations.ObservationSummaries().update(data.iloc[1100:]))
+
+    for name in data.columns:
+        assert merged.is_continuous(name) == whole.is_continuous(name)
+        if whole.is_continuous(name):
+            np.testing.assert_allclose(list(merged.stats(name).values()), list(whole.stats(name).values()))
+        else:
+            pd.testing.assert_series_equal(merged.value_counts(name), whole.value_counts(name))
+
+
+
+def test_many_integer_codes():
+    rng = np.random.default_rng(2)
+    frame = pd.DataFrame({'code': rng.integers(0, 300, 5000), 'soil': rng.integers(0, 5, 5000)})
+    summaries = observations.ObservationSummaries(max_categories=50)
+    for chunk in (frame.iloc[start:start + 700] for start in range(0, len(frame), 700)):
+        summaries.update(chunk)
+
+    # integer codes with more values than max_categories fall back to the histogram
+    assert summaries.is_continuous('code')
+    assert summaries.histogram('code')[1].sum() == len(frame)
+    assert not summaries.is_continuous('soil')
+    pd.testing.assert_series_equal(summaries.value_counts('soil'), post.FeatureSummaries(frame).value_counts('soil'))
+
+
+
+def test_string_categories_beyond_max():
+    rng = np.random.default_rng(2)
+    values = np.array(['v{:03d}'.format(i) for i in range(300)])
+    frame = pd.DataFrame({'name': values[rng.integers(0, 300, 5000)]})
+    summaries = observations.ObservationSummaries(max_categories=50)
+    for chunk in (frame.iloc[start:start + 700] for start in range(0, len(frame), 700)):
+        summaries.update(chunk)
+
+    # strings keep the top values and count the rest in the Other bucket
+    assert not summaries.is_continuous('name')
+    counts = summaries.value_counts('name')
+    assert len(counts) == 51
+    assert counts.index[-1] == summaries.OTHER
+    assert counts.sum() == len(frame)
+
+    # a merged part carries its Other bucket
+    merged = observations.ObservationSummaries(max_categories=50).update(frame.iloc[:2500])
+    merged.merge(observations.ObservationSummaries(max_categories=50).update(frame.iloc[2500:]))
+    counts = merged.value_counts('name')
+    assert counts.index[-1] == merged.OTHER
+    assert counts.sum() == len(frame)
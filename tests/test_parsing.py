@@ -0,0 +1,99 @@
+# Column-wise sheet parsers against the original row-by-row parsers.
+
+# Import libraries
+import os
+import ast
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Post_Processing as post
+from conftest import SAMPLE_DATA
+
+
+
+def brute_cc_features(ccs):
+    # every non-empty, non-zero feature column of a row, from column 14 on
+    features = []
+    for i in range(len(ccs)):
+        values = ccs.iloc[i].iloc[14:]
+        features.append([name for name, value in values.items() if not pd.isna(value) and value != 0])
+
+    return features
+
+
+
+def brute_all_ccs(dnfs):
+    # the cc_<number> columns set to 1, without the 'cc_' prefix
+    return [[name[3:] for name, value in dnfs.iloc[i].iloc[14:].items() if value == 1] for i in range(len(dnfs))]
+
+
+
+def brute_ranges(ccs, by_feature=False):
+    block = ccs.drop(columns=post.META_COLUMNS)
+    if by_feature:
+        block = block.dropna(axis=1, how='all').T
+
+    return [[ast.literal_eval(value) for value in block.iloc[i].dropna()] for i in range(len(block))]
+
+
+
+def test_parsers_match_rows(sample_sheets):
+    ccs, dnfs = sample_sheets
+
+    assert post.parse_cc(ccs) == brute_cc_features(ccs)
+    assert post.parse_dnf(dnfs) == brute_all_ccs(dnfs)
+    assert post.feature_ranges_by_cc(ccs) == brute_ranges(ccs)
+    assert post.feature_ranges_by_feature(ccs) == brute_ranges(ccs, by_feature=True)
+
+
+
+def test_range_cells():
+    cells = ['[0.8, 2.7]', ' (1, 2) ', '[-3, 1e-3]', "['forest', 'crops']", '[[1, 2], [3, 4]]', '[5]']
+
+    for cell in cells:
+        parsed = post.parse_range(cell)
+        assert parsed == ast.literal_eval(cell) and type(parsed) is type(ast.literal_eval(cell))
+    lo, hi = post.range_bounds(cells)
+    np.testing.assert_array_equal(lo, [0.8, 1, -3, np.nan, np.nan, np.nan])
+    np.testing.assert_array_equal(hi, [2.7, 2, 1e-3, np.nan, np.nan, np.nan])
+
+
+
+def test_empty_rows_and_columns(sample_sheets):
+    ccs, dnfs = sample_sheets
+    ccs = ccs.copy()
+    ccs.iloc[3, 14:] = np.nan
+    ccs[ccs.columns[20]] = np.nan
+    dnfs = dnfs.copy()
+    dnfs.iloc[0, 14:] = 0
+
+    assert post.parse_cc(ccs) == brute_cc_features(ccs)
+    assert post.parse_cc(ccs)[3] == []
+    assert post.parse_dnf(dnfs)[0] == []
+    assert post.feature_ranges_by_cc(ccs) == brute_ranges(ccs)
+    assert post.feature_ranges_by_feature(ccs) == brute_ranges(ccs, by_feature=True)
+
+
+
+def test_layout_without_sensitivity_columns():
+    # older exports have 12 metadata columns: the same sheets with the two sensitivity columns added parse the same
+    ccs = pd.read_excel(os.path.join(SAMPLE_DATA, 'ccs_2DOC_CAMELS.xlsx'), sheet_name='CCEA_High')
+    dnfs = pd.read_excel(os.path.join(SAMPLE_DATA, 'dnfs_2DOC_CAMELS.xlsx'), sheet_name='DNFEA_High')
+    full_ccs = ccs.assign(min_feat_sensitivity=0.0, max_feat_sensitivity=0.0)[post.META_COLUMNS + list(ccs.columns[12:])]
+    full_dnfs = dnfs.assign(min_feat_sensitivity=0.0, max_feat_sensitivity=0.0)[post.META_COLUMNS + list(dnfs.columns[12:])]
+
+    meta, block = post.split_sheet(ccs)
+    assert list(meta) == [col for col in post.META_COLUMNS if 'sensitivity' not in col]
+    assert list(block.columns) == list(ccs.columns[12:]) and block.columns[0] == 'elev_mean'
+    assert post.parse_cc(ccs) == brute_cc_features(full_ccs)
+    assert post.feature_ranges_by_cc(ccs) == brute_ranges(full_ccs)
+    assert post.parse_dnf(dnfs) == brute_all_ccs(full_dnfs)
+    assert any('0' in item for item in post.parse_dnf(dnfs))
+
+
+
+def test_unknown_layouts():
+    with pytest.raises(ValueError, match='does not start with the metadata columns'):
+        post.split_sheet(pd.DataFrame({'elev_mean': ['[0, 1]'], 'order': [1]}))
+    with pytest.raises(ValueError, match=r"\['fitness'\] come after"):
+        post.split_sheet(pd.DataFrame({'Unnamed: 0': [0], 'order': [1], 'elev_mean': ['[0, 1]'], 'fitness': [0.5]}))
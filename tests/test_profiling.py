@@ -0,0 +1,98 @@
+# Opt-in profiling: enable() times the module functions, disable() restores them, results are the same either way.
+
+# Import libraries
+import json
+import tracemalloc
+import pandas as pd
+import pytest
+import TEVA_Post_Processing as post
+
+pytest.importorskip('panel')
+import TEVA_Profiling as profiling
+
+
+
+@pytest.fixture
+def profiler():
+    profiling.reset()
+    yield profiling
+    profiling.disable()
+    profiling.reset()
+
+
+
+def test_enable_and_disable(profiler, sheets):
+    ccs, dnfs = sheets
+    originals = {name: getattr(post, name) for name in ['parse_cc', 'parse_dnf', 'split_sheet']}
+    expected = post.parse_dnf(dnfs)
+
+    names = profiler.enable(modules=[post], bokeh=False)
+    assert profiler.enabled()
+    assert 'Post_Processing.parse_cc' in names
+    assert all(getattr(post, name) is not function for name, function in originals.items())
+    assert post.parse_dnf(dnfs) == expected
+    post.parse_cc(ccs)
+
+    calls = profiler.records()
+    assert list(calls.columns) == profiling.RECORD_COLUMNS
+    assert calls.loc[calls['depth'] == 0, 'name'].tolist() == ['Post_Processing.parse_dnf', 'Post_Processing.parse_cc']
+    assert (calls['wall_ms'] >= 0).all()
+    assert calls.loc[calls['name'] == 'Post_Processing.parse_cc', 'in_size'].iloc[0] == len(ccs)
+    assert profiler.summary().loc['Post_Processing.parse_cc', 'calls'] == 1
+
+    # disabled: the original functions are back and nothing more is recorded
+    profiler.disable()
+    assert not profiler.enabled()
+    assert all(getattr(post, name) is function for name, function in originals.items())
+    post.parse_cc(ccs)
+    with profiler.timed('callback'):
+        pass
+    assert len(profiler.records()) == len(calls)
+
+
+
+def test_timed_blocks_and_memory(profiler, sheets):
+    ccs, dnfs = sheets
+    tracing = tracemalloc.is_tracing()
+    profiler.enable(modules=[post], memory=True, bokeh=False)
+    with profiler.timed('callback'):
+        post.parse_cc(ccs)
+
+    calls = profiler.records()
+    # the block is recorded once its calls have finished, one level above them
+    assert calls['name'].iloc[-1] == 'callback' and calls['depth'].iloc[-1] == 0
+    assert (calls['depth'].iloc[:-1] >= 1).all()
+    assert calls['allocated_kB'].iloc[:-1].notna().all()
+    profiler.disable()
+    assert tracemalloc.is_tracing() == tracing
+
+
+
+def test_dump(profiler, sheets, tmp_path):
+    ccs, dnfs = sheets
+    profiler.enable(modules=[post], bokeh=False)
+    post.parse_cc(ccs)
+    post.parse_dnf(dnfs)
+
+    profiler.dump(tmp_path / 'profile.csv')
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'profile.csv'), profiler.records(), check_dtype=False)
+    profiler.dump(tmp_path / 'profile.json')
+    with open(tmp_path / 'profile.json') as f:
+        content = json.load(f)
+    assert [row['name'] for row in content['summary']] == profiler.summary().index.tolist()
+    assert len(content['records']) == len(profiler.records())
+
+
+
+def test_bokeh_serialization_timed(profiler):
+    from bokeh.document import Document
+    from bokeh.plotting import figure
+    to_json = Document.to_json
+    doc = Document()
+    doc.add_root(figure())
+
+    profiler.enable(modules=[])
+    doc.to_json()
+    assert profiler.records()['name'].tolist() == ['bokeh.Document.to_json']
+    profiler.disable()
+    assert Document.to_json is to_json
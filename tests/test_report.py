@@ -0,0 +1,72 @@
+# Static report: every CC of a sample run gets a panel on one of the linked pages.
+
+# Import libraries
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import TEVA_Report as report
+from conftest import SAMPLE_DATA, SAMPLE_RUNS
+
+pytest.importorskip('panel')
+
+
+
+@pytest.fixture(scope='module')
+def rendered(tmp_path_factory):
+    # the report of the first sample run, rendered from copies of its workbooks
+    folder = tmp_path_factory.mktemp('report')
+    for prefix in ['ccs_', 'dnfs_']:
+        shutil.copy(os.path.join(SAMPLE_DATA, prefix + SAMPLE_RUNS[0] + '.xlsx'), folder)
+    out_dir = str(folder / 'html')
+    assert report.main([str(folder / ('ccs_' + SAMPLE_RUNS[0] + '.xlsx')), str(folder / ('dnfs_' + SAMPLE_RUNS[0] + '.xlsx')),
+                        os.path.join(SAMPLE_DATA, 'test_observations.csv'), '-o', out_dir, '-j', '1',
+                        '--per-page', '40', '--n-grid', '50']) == 0
+    ccs = pd.read_excel(os.path.join(SAMPLE_DATA, 'ccs_' + SAMPLE_RUNS[0] + '.xlsx'), sheet_name='CCEA_High')
+
+    return out_dir, ccs
+
+
+
+def read(out_dir, name):
+    with open(os.path.join(out_dir, name)) as f:
+        return f.read()
+
+
+
+def test_paginate_and_navigation():
+    pages = report.paginate(95, 40)
+    assert [len(rows) for rows in pages] == [40, 40, 15]
+    np.testing.assert_array_equal(np.concatenate(pages), np.arange(95))
+    assert report.paginate(0, 40) == []
+
+    links = report._navigation(1, 3)
+    assert '[Overview](index.html)' in links and '[Previous](ccs_001.html)' in links and '[Next](ccs_003.html)' in links
+    assert '**2**' in links
+    assert 'Previous' not in report._navigation(0, 3) and 'Next' not in report._navigation(2, 3)
+
+
+
+def test_every_cc_has_a_panel(rendered):
+    out_dir, ccs = rendered
+    n_pages = len(report.paginate(len(ccs), 40))
+    assert sorted(os.listdir(out_dir)) == sorted(['index.html'] + [report.page_name(page) for page in range(n_pages)])
+
+    # the '### CC <number>' headers of the panels are stored as escaped HTML in the pages
+    found = []
+    for page in range(n_pages):
+        found += [int(number) for number in re.findall(r'h3&amp;gt;CC (\d+)&amp;lt;', read(out_dir, report.page_name(page)))]
+    assert found == ccs['Unnamed: 0'].tolist()
+
+
+
+def test_index_page(rendered):
+    out_dir, ccs = rendered
+    index = read(out_dir, 'index.html')
+    assert '{} CCs'.format(len(ccs)) in index
+    for name in ['Feature Pairing', 'CC: Feature Usage', 'DNF: CC Usage', report.page_name(0)]:
+        assert name in index
+    # BokehJS is loaded from the CDN unless --inline is given
+    assert 'cdn.bokeh.org' in index
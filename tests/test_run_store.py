@@ -0,0 +1,140 @@
+# Multi-run store: shared feature and CC ids, and cross-run statistics against set operations on the sheets.
+
+# Import libraries
+import os
+import ast
+import itertools
+import pandas as pd
+import pytest
+import TEVA_Loader as loader
+import TEVA_Post_Processing as post
+from conftest import SAMPLE_DATA, SAMPLE_RUNS
+
+
+
+@pytest.fixture(scope='module')
+def runs():
+    # CC and DNF sheets of both sample runs
+    frames = {}
+    for run in SAMPLE_RUNS:
+        frames[run] = (pd.read_excel(os.path.join(SAMPLE_DATA, 'ccs_' + run + '.xlsx'), sheet_name='CCEA_High'),
+                       pd.read_excel(os.path.join(SAMPLE_DATA, 'dnfs_' + run + '.xlsx'), sheet_name='DNFEA_High'))
+
+    return frames
+
+
+
+@pytest.fixture(scope='module')
+def store(runs):
+    store = post.RunStore()
+    for name, (ccs, dnfs) in runs.items():
+        store.add(name, ccs, dnfs)
+
+    return store
+
+
+
+def brute_keys(ccs, ranges=True):
+    # features of every cc row with their ranges as written in the sheet
+    block = ccs.drop(columns=post.META_COLUMNS)
+    keys = []
+    for i in range(len(block)):
+        cells = block.iloc[i].dropna()
+        if not ranges:
+            keys.append(tuple(sorted(cells.index)))
+            continue
+        items = []
+        for name, cell in cells.items():
+            value = ast.literal_eval(cell)
+            numeric = all(isinstance(v, (int, float)) for v in value)
+            items.append((name, tuple(float(v) for v in value) if numeric else repr(value)))
+        keys.append(tuple(sorted(items)))
+
+    return keys
+
+
+
+def brute_usage(ccs, feature):
+    return sum(feature in features for features in post.parse_cc(ccs))
+
+
+
+def brute_cooccurrence(ccs, a, b):
+    return sum(a in features and b in features for features in post.parse_cc(ccs) if len(features) != 1)
+
+
+
+def test_shared_ids(store, runs):
+    names = list(runs)
+    keys = {name: brute_keys(runs[name][0]) for name in names}
+
+    # one id per distinct cc, the same in every run
+    assert len(store.cc_index) == len(set(keys[names[0]]) | set(keys[names[1]]))
+    for name in names:
+        archive = store.archive(name)
+        assert [store.feature_index[feature] for feature in archive.feature_names] == list(range(len(archive.feature_names)))
+        assert len(set(zip(keys[name], store.cc_ids[name].tolist()))) == len(set(keys[name]))
+    ids = {key: i for name in names for key, i in zip(keys[name], store.cc_ids[name].tolist())}
+    assert len(ids) == len(set(ids.values()))
+
+    # the store keeps the sheets of every run
+    assert store.names == names
+    assert store.frames(names[0])[0] is runs[names[0]][0]
+
+
+
+def test_cross_run_statistics(store, runs):
+    a, b = list(runs)
+    keys = {name: set(brute_keys(runs[name][0])) for name in runs}
+    features = {name: set(brute_keys(runs[name][0], ranges=False)) for name in runs}
+
+    overlap = store.cc_overlap()
+    assert 0 < overlap.loc[a, b] == len(keys[a] & keys[b])
+    assert overlap.loc[a, a] == len(keys[a])
+    assert store.cc_overlap(jaccard=True).loc[a, b] == pytest.approx(len(keys[a] & keys[b]) / len(keys[a] | keys[b]))
+    assert store.cc_overlap(ranges=False).loc[a, b] == len(features[a] & features[b])
+    assert store.summary().loc[a, 'shared_ccs'] == len(keys[a] & keys[b])
+
+    shared = store.shared_ccs(a, b)
+    assert len(shared) == len(keys[a] & keys[b])
+    cc_keys = {name: dict(zip(runs[name][0]['Unnamed: 0'], brute_keys(runs[name][0]))) for name in runs}
+    assert all(cc_keys[a][x] == cc_keys[b][y] for x, y in zip(shared[a], shared[b]))
+
+    usage = store.feature_usage()
+    for feature in usage.index:
+        assert usage.loc[feature, a] == brute_usage(runs[a][0], feature)
+    delta = store.usage_delta(a, b, share=False)
+    pd.testing.assert_series_equal(delta['delta'], (usage[b] - usage[a]).loc[delta.index], check_names=False)
+    assert delta['delta'].abs().is_monotonic_decreasing
+
+    cooccurrence = store.cooccurrence_delta(a, b)
+    for x, y in itertools.combinations_with_replacement(cooccurrence.index[:8], 2):
+        expected = brute_cooccurrence(runs[b][0], x, y) - brute_cooccurrence(runs[a][0], x, y)
+        assert cooccurrence.loc[x, y] == cooccurrence.loc[y, x] == expected
+
+
+
+def test_runs_without_common_features(runs, sheets):
+    # a synthetic run shares no feature and no cc with the sample runs
+    store = post.RunStore()
+    for name, (ccs, dnfs) in runs.items():
+        store.add(name, ccs, dnfs)
+    store.add('synthetic', *sheets)
+    a = list(runs)[0]
+
+    assert store.cc_overlap().loc[a, 'synthetic'] == 0
+    assert store.cc_overlap(jaccard=True).loc[a, 'synthetic'] == 0
+    usage = store.feature_usage()
+    assert ((usage[a] == 0) | (usage['synthetic'] == 0)).all()
+    assert store.incidence(a).shape[1] == len(store.feature_index)
+
+
+
+def test_load_runs(store, tmp_path):
+    runs = {run: (os.path.join(SAMPLE_DATA, 'ccs_' + run + '.xlsx'), os.path.join(SAMPLE_DATA, 'dnfs_' + run + '.xlsx'))
+            for run in SAMPLE_RUNS}
+    loaded = loader.load_runs(runs, cache_dir=str(tmp_path))
+
+    assert loaded.names == store.names
+    assert loaded.cc_index == store.cc_index
+    pd.testing.assert_frame_equal(loaded.cc_overlap(), store.cc_overlap())
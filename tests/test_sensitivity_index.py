@@ -0,0 +1,62 @@
+# SensitivityIndex (ranked binary search) against the direct slider filters.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import TEVA_Post_Processing as post
+
+
+
+def brute_masks(min_sens, max_sens, cc_numbers, dnf_ccs, lo, hi):
+    # the original filters: a cc passes both sliders, a dnf passes when all of its ccs do
+    cc_mask = (np.asarray(min_sens) >= lo) & (np.asarray(max_sens) <= hi)
+    kept = set(np.asarray(cc_numbers)[cc_mask].tolist())
+    dnf_mask = np.array([set(map(int, ccs)) <= kept for ccs in dnf_ccs], dtype=bool)
+
+    return cc_mask, dnf_mask
+
+
+
+def test_sample_sliders_match_filters(sample_sheets):
+    ccs, dnfs = sample_sheets
+    dnf_ccs = post.parse_dnf(dnfs)
+    cc_plot_data = pd.DataFrame({'min_sens': ccs['min_feat_sensitivity'], 'max_sens': ccs['max_feat_sensitivity'], 'CC': ccs['Unnamed: 0']})
+    index = post.SensitivityIndex.from_plot_data(cc_plot_data, pd.DataFrame({'CCs': dnf_ccs}))
+    # slider stops at, between and beyond the sensitivities of the sample
+    values = np.r_[ccs['min_feat_sensitivity'], ccs['max_feat_sensitivity']]
+    values = values[np.isfinite(values)]
+    stops = np.r_[-np.inf, np.quantile(values, np.linspace(0, 1, 9)), np.quantile(values, [0.1, 0.6]) + 0.01, np.inf]
+
+    for lo in stops:
+        for hi in stops:
+            expected = brute_masks(ccs['min_feat_sensitivity'], ccs['max_feat_sensitivity'], ccs['Unnamed: 0'], dnf_ccs, lo, hi)
+            cc_mask, dnf_mask = index.masks(lo, hi)
+            np.testing.assert_array_equal(cc_mask, expected[0])
+            np.testing.assert_array_equal(dnf_mask, expected[1])
+            cc_idx, dnf_idx = index.query(lo, hi)
+            np.testing.assert_array_equal(cc_idx, np.flatnonzero(expected[0]))
+            np.testing.assert_array_equal(dnf_idx, np.flatnonzero(expected[1]))
+
+
+
+def test_ties_nan_and_unknown_ccs():
+    rng = np.random.default_rng(3)
+    n = 300
+    min_sens = rng.integers(-6, 1, n).astype(float)
+    max_sens = rng.integers(-6, 1, n).astype(float)
+    min_sens[::17] = np.nan
+    max_sens[::23] = np.nan
+    cc_numbers = np.arange(n) * 2
+    # dnfs over known cc numbers, some with an unknown cc (odd number) and one empty dnf
+    dnf_ccs = [list(rng.choice(cc_numbers, rng.integers(1, 4), replace=False)) for _ in range(80)]
+    dnf_ccs[5].append(1)
+    dnf_ccs.append([])
+    cc_plot_data = pd.DataFrame({'min_sens': min_sens, 'max_sens': max_sens, 'CC': cc_numbers})
+    index = post.SensitivityIndex.from_plot_data(cc_plot_data, pd.DataFrame({'CCs': dnf_ccs}))
+
+    for lo in [-np.inf, -6, -3, 0]:
+        for hi in [-6, -3, 0]:
+            for mask, expected in zip(index.masks(lo, hi), brute_masks(min_sens, max_sens, cc_numbers, dnf_ccs, lo, hi)):
+                np.testing.assert_array_equal(mask, expected)
+    assert not index.masks(-np.inf, np.inf)[1][5]
+    assert index.masks(0, -6)[1][-1]
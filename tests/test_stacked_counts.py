@@ -0,0 +1,73 @@
+# StackedCounts (one bincount, row views) against direct counting per item and order.
+
+# Import libraries
+import numpy as np
+import pandas as pd
+import TEVA_Post_Processing as post
+
+
+
+def brute_view(item_lists, n_orders, names):
+    # counts of every item in lists of each length, and overall, sorted by total (stable)
+    flat = np.array(post.flatten(item_lists), dtype=object)
+    rows = []
+    for name in names:
+        row = [name] + [sum(list(items).count(name) for items in item_lists if len(items) == order) for order in range(1, n_orders + 1)]
+        rows.append(row + [int(np.count_nonzero(flat == name))])
+    table = pd.DataFrame(rows, columns=['Item'] + ['Order ' + str(j + 1) for j in range(n_orders)] + ['Total'])
+
+    return table.sort_values('Total', ascending=False, kind='stable')
+
+
+
+def assert_view(view, expected, label):
+    stack_plot, stack_names = view
+    assert stack_names == list(expected.columns[1:-1])
+    assert list(stack_plot[label]) == list(expected['Item'])
+    for column in expected.columns[1:]:
+        np.testing.assert_array_equal(np.asarray(stack_plot[column]), expected[column].to_numpy())
+
+
+
+def test_feature_view_matches_counting(sample_sheets):
+    ccs, dnfs = sample_sheets
+    cc_features = post.parse_cc(ccs)
+    unique_features = pd.unique(post.flatten(cc_features))
+    n_orders = max(ccs['order'])
+
+    assert_view(post.stacked_features(ccs, unique_features, cc_features, post.flatten(cc_features)),
+                brute_view(cc_features, n_orders, unique_features), 'Feature')
+    names = unique_features[::3]
+    assert_view(post.StackedCounts(cc_features, n_orders, 'Feature').view(names), brute_view(cc_features, n_orders, names), 'Feature')
+
+
+
+def test_cc_view_matches_counting(sample_sheets):
+    ccs, dnfs = sample_sheets
+    all_ccs = post.parse_dnf(dnfs)
+    unique_ccs = np.unique(post.flatten(all_ccs))
+    n_orders = max(dnfs['order'])
+
+    assert_view(post.stacked_ccs(dnfs, unique_ccs, all_ccs, post.flatten(all_ccs)),
+                brute_view(all_ccs, n_orders, unique_ccs), 'CC')
+
+
+
+def test_memoized_view_and_unknown_items():
+    item_lists = [['a', 'b'], ['b'], ['c', 'b', 'a'], ['d', 'e', 'f', 'g']]
+    counts = post.StackedCounts(item_lists, 3, 'Item')
+    names = ['a', 'z', 'g', 'b']
+
+    # 'z' is not used and 'g' only in a list longer than n_orders, which counts towards the total
+    assert_view(counts.view(names, key=1), brute_view(item_lists, 3, names), 'Item')
+    first = counts.view(names, key=1)
+    assert counts.view(list(names), key=1) is first
+    # the memo is keyed on the names as well: the same key with other names is not served a stale result
+    assert_view(counts.view(['a'], key=1), brute_view(item_lists, 3, ['a']), 'Item')
+    assert counts.top(['c', 'd'], 1, key=1)[0]['Item'] == ['c', 'Other (1)']
+    # it keeps the most recently used results only
+    for i in range(3 * counts.MEMO_SIZE):
+        counts.view(['b', 'c'], key=('slider', i))
+        assert counts.view(names, key=1) is first
+    assert len(counts._views) == counts.MEMO_SIZE
+    assert_view(post.StackedCounts([], 2, 'Item').view(['a']), brute_view([], 2, ['a']), 'Item')
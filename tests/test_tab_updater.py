@@ -0,0 +1,118 @@
+# Background tab rebuilds: debounced requests, stale builds dropped, shutdown releases the waiters.
+
+# Import libraries
+import time
+import threading
+import pytest
+
+pn = pytest.importorskip('panel')
+from bokeh.plotting import figure
+import TEVA_Dynamic_Plotting as teva_plot
+
+
+
+class Builder:
+    # builds a figure titled with its argument, optionally held until released
+    def __init__(self, hold=None):
+        self.calls = []
+        self.hold = hold or {}
+
+    def __call__(self, value):
+        self.calls.append(value)
+        if value in self.hold:
+            self.hold[value].wait(5)
+        return figure(title=str(value))
+
+
+
+@pytest.fixture
+def tabs():
+    return pn.Tabs(('a', pn.pane.Bokeh()), ('b', pn.pane.Bokeh()))
+
+
+
+def titles(tabs):
+    return [None if pane.object is None else pane.object.title.text for pane in tabs]
+
+
+
+def test_requests_are_debounced(tabs):
+    builders = [Builder(), Builder()]
+    updater = teva_plot.TabUpdater(tabs, builders, delay=0.2)
+    for value in [1, 2, 3]:
+        updater.request(value)
+    assert not updater.wait(0.05)
+
+    assert updater.wait(5)
+    assert [builder.calls for builder in builders] == [[3], [3]]
+    assert titles(tabs) == ['3', '3']
+    assert not any(pane.loading for pane in tabs)
+    updater.shutdown()
+
+
+
+def test_stale_builds_are_dropped(tabs):
+    release = threading.Event()
+    builders = [Builder(hold={1: release}), Builder()]
+    updater = teva_plot.TabUpdater(tabs, builders, delay=0, max_workers=4)
+    updater.request(1)
+    while not builders[0].calls:
+        time.sleep(0.01)
+    updater.request(2)
+    assert updater.wait(5)
+    assert titles(tabs) == ['2', '2']
+
+    # the first build of tab a finishes late and is not shown
+    release.set()
+    time.sleep(0.2)
+    assert builders[0].calls == [1, 2]
+    assert titles(tabs) == ['2', '2']
+    updater.shutdown()
+
+
+
+def test_refresh_cancels_pending_requests(tabs):
+    builders = [Builder(), Builder()]
+    updater = teva_plot.TabUpdater(tabs, builders, delay=0.2)
+    updater.request(1)
+    updater.refresh(2)
+
+    # refresh builds synchronously and the pending request never runs
+    assert titles(tabs) == ['2', '2']
+    assert updater.wait(0)
+    time.sleep(0.3)
+    assert [builder.calls for builder in builders] == [[2], [2]]
+    updater.shutdown()
+
+
+
+def test_failed_builds_keep_the_previous_figure(tabs, capsys):
+    def fail(value):
+        raise ValueError('boom')
+
+    updater = teva_plot.TabUpdater(tabs, [Builder(), fail], delay=0)
+    tabs[1].object = figure(title='before')
+    updater.request(2)
+
+    # a failing builder is reported, its tab keeps the previous figure
+    assert updater.wait(5)
+    assert titles(tabs) == ['2', 'before']
+    assert not tabs[1].loading
+    assert 'ValueError: boom' in capsys.readouterr().err
+    updater.shutdown()
+
+
+
+def test_shutdown_releases_waiters(tabs):
+    updater = teva_plot.TabUpdater(tabs, [Builder(), Builder()], delay=0.2)
+    updater.request(1)
+    updater.shutdown()
+    assert updater.wait(1)
+    assert titles(tabs) == [None, None]
+
+    # the pool goes away while a request is pending
+    updater = teva_plot.TabUpdater(tabs, [Builder(), Builder()], delay=0.1)
+    updater.request(1)
+    updater.executor.shutdown(wait=False)
+    assert updater.wait(2)
+    assert not any(pane.loading for pane in tabs)
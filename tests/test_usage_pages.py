@@ -0,0 +1,55 @@
+# Paged usage counts: StackedCounts.top pages against the stable-sorted full view.
+
+# Import libraries
+import numpy as np
+import TEVA_Post_Processing as post
+from test_stacked_counts import brute_view
+
+
+
+def assert_page(page_view, expected, label, k, page):
+    # one page of the stable-sorted view, with the rest summed into the 'Other (n)' row
+    stack_plot, stack_names, shown_page, n_pages = page_view
+    n = len(expected)
+    assert n_pages == max(-(-n // k), 1) and shown_page == min(page, n_pages - 1)
+    rows = expected.iloc[shown_page * k:shown_page * k + k]
+    m = len(rows)
+    assert list(stack_plot[label][:m]) == list(rows['Item'])
+    for column in expected.columns[1:]:
+        np.testing.assert_array_equal(np.asarray(stack_plot[column][:m]), rows[column].to_numpy())
+    if m < n:
+        assert stack_plot[label][m:] == ['Other ({})'.format(n - m)]
+        for column in expected.columns[1:]:
+            assert stack_plot[column][m] == expected[column].sum() - rows[column].sum()
+    else:
+        assert len(stack_plot[label]) == m
+
+
+
+def test_top_pages_match_view(archive):
+    all_ccs = archive.all_ccs()
+    counts = archive.cc_counts()
+    names = np.unique(post.flatten(all_ccs))
+    expected = brute_view(all_ccs, counts.n_orders, names)
+
+    for k in (1, 7, 25, len(names), len(names) + 5):
+        n_pages = max(-(-len(names) // k), 1)
+        for page in (0, 1, n_pages - 1, n_pages + 3):
+            assert_page(counts.top(names, k, page, key=('top', k)), expected, 'CC', k, page)
+
+
+
+def test_top_ties_and_edge_cases():
+    item_lists = [['a', 'b'], ['c', 'd'], ['b', 'e'], ['f'], ['d'], ['a', 'c', 'g']]
+    counts = post.StackedCounts(item_lists, 3, 'Item')
+    names = ['g', 'a', 'b', 'c', 'd', 'e', 'f', 'z']
+    expected = brute_view(item_lists, 3, names)
+
+    for k in range(1, 10):
+        for page in range(4):
+            assert_page(counts.top(names, k, page), expected, 'Item', k, page)
+    assert_page(counts.top(names, None), expected, 'Item', len(names), 0)
+    stack_plot, stack_names, page, n_pages = counts.top([], None)
+    assert (stack_plot['Item'], page, n_pages) == ([], 0, 1)
+    stack_plot = counts.top(names, 2, other=False)[0]
+    assert len(stack_plot['Item']) == 2